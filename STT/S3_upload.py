@@ -1,81 +1,105 @@
 import os
-import json
-import asyncio
-import boto3
+import sys
 from dotenv import load_dotenv
 
-# .env 파일 로드
+# .env 파일 로드 (공용 모듈이 import 시점에 환경변수를 읽으므로 가장 먼저 수행)
 load_dotenv()
 
+# Summarize 모듈의 공용 유틸(compression, storage 등)을 사용하기 위한 경로 추가
+SUMMARIZE_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Summarize"))
+if SUMMARIZE_DIR not in sys.path:
+    sys.path.append(SUMMARIZE_DIR)
+
+import compression
+import storage
+
 # AWS S3 설정
 AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
-AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-2")
 
 class S3Uploader:
     """
     S3 업로드를 전담하는 클래스
+    - 실제 전송은 프로세스 전역 공용 저장소 클라이언트(storage)를 사용하므로
+      여러 방의 로거가 커넥션 풀을 공유함
+    - STORAGE_BACKEND=local/memory 이면 AWS 없이 같은 키 구조로 저장
     """
     def __init__(self):
-        self.s3_client = None
-        if AWS_ACCESS_KEY and AWS_SECRET_KEY and AWS_BUCKET_NAME:
-            try:
-                self.s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=AWS_ACCESS_KEY,
-                    aws_secret_access_key=AWS_SECRET_KEY,
-                    region_name=AWS_REGION
-                )
-                print(f"☁️ S3 클라이언트 초기화 완료 (Bucket: {AWS_BUCKET_NAME})")
-            except Exception as e:
-                print(f"❌ S3 초기화 실패: {e}")
+        self.storage = None
+        if storage.STORAGE_BACKEND != "s3" or (AWS_ACCESS_KEY and AWS_SECRET_KEY and AWS_BUCKET_NAME):
+            self.storage = storage.get_storage_client()
+            print(f"☁️ 저장소 연결 ({self.storage.name}: {self.storage.bucket})")
         else:
             print("⚠️ AWS 환경변수가 설정되지 않아 S3 업로드가 비활성화됩니다.")
 
 
-    async def upload_json(self, data: dict, filename: str, folder: str = "meeting_logs"):
+    async def upload_json(self, data: dict, filename: str, folder: str = "meeting_logs") -> bool:
+        """
+        Python 딕셔너리 데이터를 JSON으로 변환하여 S3에 업로드 (STORAGE_COMPRESSION 설정 시 압축)
+        """
+        body, content_encoding = compression.encode_json(data, indent=4)
+        return await self.upload_bytes(
+            body, filename, folder=folder, content_type="application/json",
+            content_encoding=content_encoding
+        )
+
+    async def upload_bytes(self, body: bytes, filename: str, folder: str = "meeting_logs",
+                           content_type: str = "application/octet-stream",
+                           content_encoding: str | None = None) -> bool:
         """
-        Python 딕셔너리 데이터를 JSON으로 변환하여 S3에 업로드
+        이미 직렬화된 바이트 데이터를 그대로 S3에 업로드 (성공 여부 반환)
+        - content_encoding이 있으면 Content-Encoding 헤더로 함께 기록
         """
-        if not self.s3_client:
-            return
+        if not self.storage:
+            return False
 
         final_s3_key = f"{folder}/{filename}"
-        print(f"⬆️ S3 업로드 시도... ({final_s3_key})")
+        print(f"⬆️ S3 업로드 시도... ({final_s3_key}, {len(body)} bytes)")
 
         try:
-            json_string = json.dumps(data, ensure_ascii=False, indent=4)
+            await self.storage.aput_object(final_s3_key, body, content_type, content_encoding)
+            print("✅ S3 업로드 성공")
+            return True
+        except Exception as e:
+            print(f"❌ S3 업로드 실패: {e}")
+            return False
 
-            await asyncio.to_thread(
-                self.s3_client.put_object,
-                Bucket=AWS_BUCKET_NAME,
-                Key=final_s3_key,
-                Body=json_string,
-                ContentType="application/json"
-            )
+    async def upload_fileobj(self, fileobj, filename: str, folder: str = "meeting_logs",
+                             content_type: str = "application/octet-stream",
+                             content_encoding: str | None = None) -> bool:
+        """
+        파일 객체(임시 파일 등)를 청크 단위로 S3에 업로드 (큰 본문은 멀티파트)
+        """
+        if not self.storage:
+            return False
+
+        final_s3_key = f"{folder}/{filename}"
+        print(f"⬆️ S3 업로드 시도... ({final_s3_key})")
+
+        try:
+            await self.storage.aupload_fileobj(fileobj, final_s3_key, content_type, content_encoding)
             print("✅ S3 업로드 성공")
+            return True
         except Exception as e:
             print(f"❌ S3 업로드 실패: {e}")
+            return False
 
     async def read_json(self, key: str) -> dict | None:
         """
-        S3에서 JSON 파일을 읽어 딕셔너리로 반환
+        S3에서 JSON 파일을 읽어 딕셔너리로 반환 (압축된 객체는 투명하게 해제)
         """
-        if not self.s3_client:
+        if not self.storage:
             return None
 
         print(f"⬇️ S3 다운로드 시도... ({key})")
         try:
-            response = await asyncio.to_thread(
-                self.s3_client.get_object,
-                Bucket=AWS_BUCKET_NAME,
-                Key=key
-            )
-            content = await asyncio.to_thread(response['Body'].read)
-            data = json.loads(content.decode('utf-8'))
+            data = await self.storage.aget_json(key)
             print("✅ S3 다운로드 성공")
             return data
+        except storage.ObjectNotFound:
+            print(f"⏳ S3 객체 없음 ({key})")
+            return None
         except Exception as e:
             print(f"❌ S3 다운로드 실패: {e}")
             return None
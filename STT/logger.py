@@ -1,8 +1,19 @@
 import os
 import json
+import time
+import asyncio
 import datetime
+import tempfile
 from livekit import rtc
 from S3_upload import S3Uploader
+import compression
+
+# 업로드 본문을 메모리에 유지할 최대 크기 (초과 시 임시 파일로 자동 전환)
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# 크래시 복구용 체크포인트 설정
+CHECKPOINT_EVERY = int(os.getenv("LOG_CHECKPOINT_EVERY", "20"))               # N개 발화마다 체크포인트
+RESUME_MAX_AGE_SEC = int(os.getenv("LOG_RESUME_MAX_AGE_SEC", str(6 * 3600)))  # 이보다 오래된 저널은 이어쓰지 않음
 
 class TranscriptLogger:
     """
@@ -10,6 +21,9 @@ class TranscriptLogger:
     - 절대 경로 사용으로 파일 저장 위치 보장
     - Append 방식으로 로컬 저장, Overwrite 방식으로 S3 업로드
     - S3 업로드 시 메타데이터와 참여자 정보를 포함한 확장된 JSON 포맷 사용
+    - 회의 중에는 새 발화만 불변 세그먼트로 증분 업로드하고, 종료 시 전체 JSON으로 컴팩션
+    - 로거 상태를 체크포인트로 남겨, 프로세스가 죽은 뒤 같은 방의 새 Job이 기존 저널을 이어씀
+      (복구 시 마지막 체크포인트 이후 구간만 다시 읽고, 재업로드도 마지막 업로드 이후 구간으로 한정)
     """
     def __init__(self, room: rtc.Room):
         self.room = room
@@ -22,6 +36,8 @@ class TranscriptLogger:
         timestamp = self.start_time.strftime("%Y%m%d_%H%M%S")
         self.filename = os.path.join(self.log_dir, f"{self.room_name}_{timestamp}.jsonl")
         self.utterance_id = 1
+        # 마지막 발화 기록 시각 (monotonic) - STT가 한가한지 판단할 때 사용
+        self.last_log_time = time.monotonic()
         
         # S3 업로더 초기화
         self.s3_uploader = S3Uploader()
@@ -30,6 +46,33 @@ class TranscriptLogger:
         # Key: identity, Value: Participant Data Dict
         self.participants_history = {}
 
+        # [추가] 증분 업로드 상태
+        # uploaded_offset: 로컬 JSONL 중 이미 세그먼트로 올라간 바이트 위치
+        # segments: 업로드된 세그먼트 목록 (manifest에 기록)
+        self.uploaded_offset = 0
+        self.last_uploaded_id = 0
+        self.segments = []
+        self.participants_dirty = False
+
+        # [추가] 크래시 복구용 체크포인트 (방 이름 기준으로 하나)
+        self.checkpoint_path = os.path.join(self.log_dir, f"{self.room_name}.checkpoint.json")
+        self._since_checkpoint = 0
+        self.resumed = self._resume_from_checkpoint()
+        self._write_checkpoint()
+
+    def elapsed_sec(self):
+        """회의 시작(로거 생성 또는 복구된 시작 시각) 이후 경과 시간(초)"""
+        return (datetime.datetime.now() - self.start_time).total_seconds()
+
+    def idle_sec(self):
+        """마지막 발화 이후 경과 시간(초)"""
+        return time.monotonic() - self.last_log_time
+
+    @property
+    def base_name(self) -> str:
+        """S3 파일명에 사용하는 로그 이름 (.jsonl 제외)"""
+        return os.path.basename(self.filename).replace('.jsonl', '')
+
     def add_participant(self, participant: rtc.RemoteParticipant):
         """참여자 입장 시 정보 저장"""
         meta = {}
@@ -50,6 +93,8 @@ class TranscriptLogger:
         
         # 이미 있으면 업데이트, 없으면 추가
         self.participants_history[participant.identity] = p_data
+        self.participants_dirty = True
+        self._write_checkpoint()
         print(f"📝 [Logger] 참여자 기록 추가: {participant.identity}")
 
     def log(self, participant_id, text):
@@ -62,8 +107,106 @@ class TranscriptLogger:
             "content": text
         }
         self.utterance_id += 1
+        self.last_log_time = time.monotonic()
         with open(self.filename, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= CHECKPOINT_EVERY:
+            self._write_checkpoint()
+
+    # ==========================================================================
+    # 크래시 복구 (저널 + 체크포인트)
+    # ==========================================================================
+    def _write_checkpoint(self, finished: bool = False):
+        """
+        로거 상태를 체크포인트 파일에 원자적으로 기록 (임시 파일 작성 후 교체)
+        journal_offset: 체크포인트 시점의 저널 크기. 복구 시 이 위치 이후만 다시 읽음
+        """
+        journal_offset = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        state = {
+            "filename": os.path.basename(self.filename),
+            "start_time": self.start_time.isoformat(),
+            "next_id": self.utterance_id,
+            "journal_offset": journal_offset,
+            "participants_history": self.participants_history,
+            "uploaded_offset": self.uploaded_offset,
+            "last_uploaded_id": self.last_uploaded_id,
+            "segments": self.segments,
+            "finished": finished,
+            "updated_at": datetime.datetime.now().isoformat(),
+        }
+
+        tmp_path = self.checkpoint_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+            self._since_checkpoint = 0
+        except Exception as e:
+            print(f"⚠️ [Logger] 체크포인트 기록 실패: {e}")
+
+    def _resume_from_checkpoint(self) -> bool:
+        """
+        같은 방의 미완료 체크포인트가 있으면 기존 저널을 이어서 사용
+        - 체크포인트 이후에 기록된 발화는 저널 꼬리만 읽어 next_id를 복원
+        - 쓰다가 끊긴 마지막 줄(부분 기록)은 잘라냄
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return False
+
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"⚠️ [Logger] 체크포인트 읽기 실패 -> 새 로그 시작: {e}")
+            return False
+
+        journal_path = os.path.join(self.log_dir, state.get("filename", ""))
+        updated_at = datetime.datetime.fromisoformat(state["updated_at"])
+        age_sec = (datetime.datetime.now() - updated_at).total_seconds()
+
+        if state.get("finished") or not os.path.exists(journal_path) or age_sec > RESUME_MAX_AGE_SEC:
+            return False
+
+        next_id = self._recover_journal_tail(journal_path, state.get("journal_offset", 0), state["next_id"])
+
+        self.filename = journal_path
+        self.start_time = datetime.datetime.fromisoformat(state["start_time"])
+        self.utterance_id = next_id
+        self.participants_history = state.get("participants_history", {})
+        self.uploaded_offset = min(state.get("uploaded_offset", 0), os.path.getsize(journal_path))
+        self.last_uploaded_id = state.get("last_uploaded_id", 0)
+        self.segments = state.get("segments", [])
+        self.participants_dirty = True
+
+        print(f"♻️ [Logger] 기존 저널 이어쓰기: {os.path.basename(journal_path)} (next_id={next_id})")
+        return True
+
+    @staticmethod
+    def _recover_journal_tail(journal_path: str, journal_offset: int, next_id: int) -> int:
+        """체크포인트 이후의 저널 꼬리를 검사하여 다음 발화 ID 반환 (부분 기록 줄은 잘라냄)"""
+        with open(journal_path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = min(journal_offset, size)
+            f.seek(offset)
+            tail = f.read()
+
+            valid_end = tail.rfind(b"\n") + 1
+            if valid_end < len(tail):
+                print(f"✂️ [Logger] 불완전한 마지막 줄 제거 ({len(tail) - valid_end} bytes)")
+                f.truncate(offset + valid_end)
+
+        for line in tail[:valid_end].splitlines():
+            if line.strip():
+                next_id = max(next_id, json.loads(line).get("id", 0) + 1)
+        return next_id
+
+    def mark_finished(self):
+        """최종 컴팩션 완료 후 호출: 다음 Job이 이 저널을 이어쓰지 않도록 표시"""
+        self._write_checkpoint(finished=True)
 
     def _get_metadata(self):
         """방 메타데이터 생성"""
@@ -84,42 +227,277 @@ class TranscriptLogger:
         # 저장된 모든 참여자 이력 반환
         return list(self.participants_history.values())
 
-    async def upload_to_s3(self, folder: str = "meeting_logs", suffix: str = ""):
-        """로컬 파일을 읽어 확장된 JSON 형태로 변환 후 S3에 업로드"""
-        if not os.path.exists(self.filename):
-            return
-
-        utterances_list = []
-        speaker_set = set()
-        
-        try:
+    def read_utterances(self, after_id: int = 0) -> list:
+        """로컬 로그에서 after_id 이후의 발화 목록을 읽음 (이벤트 루프 밖에서 호출)"""
+        utterances = []
+        if os.path.exists(self.filename):
             with open(self.filename, "r", encoding="utf-8") as f:
                 for line in f:
                     if line.strip():
-                        data = json.loads(line)
-                        utterances_list.append(data)
-                        speaker_set.add(data.get("USER_ID"))
-        except Exception as e:
-            print(f"❌ 로그 파일 읽기 실패: {e}")
-            return
+                        entry = json.loads(line)
+                        if entry.get("id", 0) > after_id:
+                            utterances.append(entry)
+        return utterances
 
-        # 메타데이터 구성
+    async def snapshot(self) -> dict:
+        """
+        현재까지의 로그를 회의록 JSON과 같은 구조의 dict로 반환 (에이전트 내 Recap 생성용)
+        메타데이터/참여자는 이벤트 루프에서 복사하고, 파일 읽기는 스레드에서 수행
+        """
         metadata = self._get_metadata()
-        metadata["speaker_num"] = len(speaker_set)
-        # participant_num 업데이트 (로그에 기록된 모든 사람 포함 or 현재 접속자)
-        # 여기서는 현재 접속자 기준으로 하되, 로그에 있는 사람이 나갔을 수도 있으니
-        # 로그에 있는 사람 + 현재 접속자 합집합으로 하는게 더 정확할 수 있음.
-        # 일단 요청된 포맷에 맞춤.
-        
-        final_json_data = {
+        participants = self._get_participants_data()
+        utterances = await asyncio.to_thread(self.read_utterances)
+        metadata["speaker_num"] = len({u.get("USER_ID") for u in utterances})
+        return {
             "metadata": metadata,
+            "participants": participants,
+            "utterances": utterances,
+        }
+
+    @staticmethod
+    def _count_speakers(journal_path: str) -> int:
+        """로그 파일을 한 줄씩 읽어 실제 발화자 수 계산 (메모리 사용량 일정)"""
+        speaker_set = set()
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    speaker_set.add(json.loads(line).get("USER_ID"))
+        return len(speaker_set)
+
+    @staticmethod
+    def _write_meeting_json(out, metadata: dict, participants: list, journal_path: str):
+        """
+        metadata, participants, utterances 순서로 컴팩트 JSON을 out에 스트리밍 기록
+        - 발화 라인은 파싱/재직렬화 없이 JSONL 원문을 그대로 복사
+        """
+        def dumps(obj):
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+        out.write(b'{"metadata":' + dumps(metadata).encode("utf-8"))
+        out.write(b',"participants":' + dumps(participants).encode("utf-8"))
+        out.write(b',"utterances":[')
+
+        first = True
+        with open(journal_path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if not first:
+                    out.write(b",")
+                out.write(line)
+                first = False
+
+        out.write(b"]}")
+
+    def _build_upload_body(self, metadata: dict, participants: list, journal_path: str):
+        """업로드 본문을 SpooledTemporaryFile로 생성 (이벤트 루프 밖에서 실행, 설정 시 스트리밍 압축)"""
+        metadata["speaker_num"] = self._count_speakers(journal_path)
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            writer, content_encoding = compression.open_writer(body)
+            self._write_meeting_json(writer, metadata, participants, journal_path)
+            writer.close()
+            body.seek(0)
+        except Exception:
+            body.close()
+            raise
+        return body, content_encoding
+
+    async def upload_to_s3(self, folder: str = "meeting_logs", suffix: str = ""):
+        """
+        로컬 파일을 확장된 JSON 형태로 스트리밍 직렬화하여 S3에 업로드
+        - 발화 목록을 메모리에 올리지 않고 임시 본문에 바로 기록 (회의 길이와 무관한 메모리 사용)
+        - 직렬화는 스레드에서 수행하여 이벤트 루프를 막지 않음
+        """
+        # 메타데이터/참여자 스냅샷은 이벤트 루프에서 복사해 둔 뒤 스레드로 넘김
+        # speaker_num은 직렬화 시점에 로그 파일 기준으로 계산
+        # 파일명 생성 (.jsonl -> .json), suffix가 있으면 추가 (예: _request_recap)
+        return await self._upload_journal(self.filename, f"{self.base_name}{suffix}.json",
+                                          self._get_metadata(), self._get_participants_data(), folder)
+
+    async def _upload_journal(self, journal_path: str, json_filename: str, metadata: dict,
+                              participants: list, folder: str) -> bool:
+        """저널 파일 하나를 회의록 JSON으로 직렬화하여 {folder}/{json_filename}에 업로드"""
+        if not os.path.exists(journal_path):
+            return False
+
+        try:
+            body, content_encoding = await asyncio.to_thread(
+                self._build_upload_body, metadata, participants, journal_path
+            )
+        except Exception as e:
+            print(f"❌ 로그 파일 읽기 실패: {e}")
+            return False
+
+        try:
+            return await self.s3_uploader.upload_fileobj(
+                body, json_filename, folder=folder, content_type="application/json",
+                content_encoding=content_encoding
+            )
+        finally:
+            body.close()
+
+    def has_pending_changes(self) -> bool:
+        """마지막 증분 업로드 이후 새 발화나 참여자 변경이 있는지 확인"""
+        if self.participants_dirty:
+            return True
+        if not os.path.exists(self.filename):
+            return False
+        return os.path.getsize(self.filename) > self.uploaded_offset
+
+    def _read_new_lines(self):
+        """
+        uploaded_offset 이후에 추가된 완전한 줄만 읽어옴
+        (쓰기 도중인 마지막 줄은 다음 업로드로 미룸)
+        """
+        with open(self.filename, "rb") as f:
+            f.seek(self.uploaded_offset)
+            chunk = f.read()
+
+        end = chunk.rfind(b"\n") + 1
+        return chunk[:end], self.uploaded_offset + end
+
+    async def upload_incremental(self, folder: str = "meeting_logs") -> bool:
+        """
+        마지막 체크포인트 이후의 새 발화만 불변 세그먼트 객체로 업로드하고 manifest를 갱신
+        - 세그먼트: {folder}/segments/{base_name}/{first_id}_{last_id}.jsonl
+        - manifest: {folder}/segments/{base_name}/manifest.json
+        변경 사항이 없으면 아무것도 업로드하지 않고 False 반환
+        """
+        if not self.has_pending_changes():
+            print("⏭️ [Logger] 변경 사항 없음 -> 업로드 생략")
+            return False
+
+        segment_folder = f"{folder}/segments/{self.base_name}"
+        new_offset = self.uploaded_offset
+
+        if os.path.exists(self.filename):
+            try:
+                chunk, new_offset = await asyncio.to_thread(self._read_new_lines)
+            except Exception as e:
+                print(f"❌ 로그 파일 읽기 실패: {e}")
+                return False
+
+            lines = [line for line in chunk.decode("utf-8").splitlines() if line.strip()]
+            if lines:
+                first_id = json.loads(lines[0]).get("id")
+                last_id = json.loads(lines[-1]).get("id")
+                segment_name = f"{first_id:06d}_{last_id:06d}.jsonl"
+
+                segment_body, content_encoding = await asyncio.to_thread(compression.compress, chunk)
+                ok = await self.s3_uploader.upload_bytes(
+                    segment_body, segment_name, folder=segment_folder,
+                    content_type="application/x-ndjson", content_encoding=content_encoding
+                )
+                if not ok:
+                    return False
+
+                self.segments.append({
+                    "key": f"{segment_folder}/{segment_name}",
+                    "first_id": first_id,
+                    "last_id": last_id,
+                    "count": len(lines),
+                })
+                self.last_uploaded_id = last_id
+
+        self.uploaded_offset = new_offset
+        self.participants_dirty = False
+        self._write_checkpoint()
+
+        manifest = {
+            "metadata": self._get_metadata(),
             "participants": self._get_participants_data(),
-            "utterances": utterances_list
+            "last_uploaded_id": self.last_uploaded_id,
+            "segments": self.segments,
         }
-        
-        # 파일명 생성 (.jsonl -> .json)
-        # suffix가 있으면 추가 (예: _request_recap)
-        base_name = os.path.basename(self.filename).replace('.jsonl', '')
-        json_filename = f"{base_name}{suffix}.json"
-        
-        await self.s3_uploader.upload_json(final_json_data, json_filename, folder=folder)
+        await self.s3_uploader.upload_json(manifest, "manifest.json", folder=segment_folder)
+        return True
+
+    async def compact_to_s3(self, folder: str = "meeting_logs") -> bool:
+        """
+        회의 종료 시 컴팩션: 남은 세그먼트를 올린 뒤 최종 {folder}/{base_name}.json 생성
+        - 정상 종료이므로 업로드 결과와 무관하게 체크포인트는 항상 완료로 표시
+          (같은 방의 다음 회의가 이 저널을 이어쓰지 않도록, 이어쓰기는 크래시 후에만)
+        - 최종 업로드에 실패하면 대기 목록({base_name}.pending.json)에 남겨 retry_pending_uploads가 다시 올림
+        """
+        await self.upload_incremental(folder=folder)
+        ok = await self.upload_to_s3(folder=folder)
+        self.mark_finished()
+
+        if ok:
+            self._remove_pending(self.base_name)
+        elif not self.s3_uploader.storage:
+            print(f"⚠️ [Logger] 저장소 비활성화 -> {self.base_name} 최종 업로드 생략")
+        else:
+            self._write_pending(folder)
+            print(f"⚠️ [Logger] {self.base_name} 최종 업로드 실패 -> 업로드 대기 목록에 등록")
+        return ok
+
+    # ==========================================================================
+    # 최종 업로드 재시도 대기 목록 (정상 종료 후 업로드에 실패한 회의)
+    # ==========================================================================
+    def _pending_path(self, base_name: str) -> str:
+        return os.path.join(self.log_dir, f"{base_name}.pending.json")
+
+    def _write_pending(self, folder: str):
+        """최종 JSON을 다시 만들 수 있도록 저널 파일명과 메타데이터/참여자 스냅샷을 기록"""
+        record = {
+            "filename": os.path.basename(self.filename),
+            "room_name": self.room_name,
+            "folder": folder,
+            "metadata": self._get_metadata(),
+            "participants": self._get_participants_data(),
+            "ended_at": time.time(),
+        }
+        tmp_path = self._pending_path(self.base_name) + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, self._pending_path(self.base_name))
+        except Exception as e:
+            print(f"⚠️ [Logger] 업로드 대기 목록 기록 실패: {e}")
+
+    def _remove_pending(self, base_name: str):
+        try:
+            os.remove(self._pending_path(base_name))
+        except FileNotFoundError:
+            pass
+
+    async def retry_pending_uploads(self) -> list:
+        """
+        같은 방에서 최종 업로드에 실패한 지난 회의의 최종 JSON을 다시 업로드
+        성공한 회의의 대기 기록 목록 반환 (요약 작업 등록 등 후속 처리용)
+        """
+        if not self.s3_uploader.storage:
+            return []
+
+        uploaded = []
+        for name in sorted(os.listdir(self.log_dir)):
+            if not name.endswith(".pending.json"):
+                continue
+            base_name = name[:-len(".pending.json")]
+            try:
+                with open(os.path.join(self.log_dir, name), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except Exception as e:
+                print(f"⚠️ [Logger] 업로드 대기 기록 읽기 실패 ({name}): {e}")
+                continue
+            if record.get("room_name") != self.room_name or base_name == self.base_name:
+                continue
+
+            journal_path = os.path.join(self.log_dir, record["filename"])
+            if not os.path.exists(journal_path):
+                print(f"⚠️ [Logger] {base_name} 저널 없음 -> 업로드 대기 목록에서 제거")
+                self._remove_pending(base_name)
+                continue
+
+            print(f"🔁 [Logger] 지난 회의 최종 업로드 재시도: {base_name}")
+            ok = await self._upload_journal(journal_path, f"{base_name}.json", record["metadata"],
+                                            record["participants"], record.get("folder", "meeting_logs"))
+            if ok:
+                self._remove_pending(base_name)
+                record["base_name"] = base_name
+                uploaded.append(record)
+        return uploaded
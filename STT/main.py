@@ -1,5 +1,6 @@
 import asyncio
 import os
+import time
 import datetime
 import json
 from botocore.exceptions import ClientError
@@ -10,8 +11,16 @@ import sys
 #최종 summarize할거면 1 끌거면 0
 Summarize_enable = 1
 
+#Recap을 에이전트 안에서 바로 생성하면 1, 기존 방식(S3 업로드 + S3_Recap.py 서브프로세스 + 폴링)이면 0
+Recap_in_process = 1
+
+#회의 도중 입장한 참가자를 위해 Recap을 미리 생성하려면 1 (Recap_in_process = 1일 때만 동작)
+Recap_precompute = 1
+
+#회의 도중 끝난 토픽을 미리 요약해 종료 후 대기 시간을 줄이려면 1 (Summarize_enable = 1일 때만 동작)
+Rolling_summary = 1
+
 # [AI & ML 라이브러리]
-import google.generativeai as genai
 from transformers import pipeline
 import torch
 
@@ -23,6 +32,11 @@ from livekit.plugins import silero
 # [로컬 플러그인] WhisperSTT 클래스가 정의된 파일
 from whisper_plugin import WhisperSTT
 from logger import TranscriptLogger
+from recap_service import RecapService
+from rolling_summary import RollingSummarizer
+import storage
+import llm_client
+import job_queue
 
 # .env 파일 로드
 load_dotenv()
@@ -34,11 +48,10 @@ LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 
 
 
-# Google Gemini API 설정
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-else:
+# Google Gemini API 설정 (GEMINI_API_KEY 또는 GOOGLE_API_KEY, 공용 비동기 LLM 클라이언트 사용)
+try:
+    llm_client.configure()
+except ValueError:
     print("⚠️ [경고] GOOGLE_API_KEY가 설정되지 않았습니다. 투표 기능이 작동하지 않습니다.")
 
 
@@ -87,14 +100,13 @@ class VoteManager:
     def __init__(self, room: rtc.Room):
         self.room = room
 
-        # Gemini 2.0 Flash 초기화 (JSON 모드)
-        self.model = genai.GenerativeModel(
-            "gemini-2.0-flash",
-            generation_config={
-                "response_mime_type": "application/json",
-                "temperature": 0.0 
-            }
-        )
+        # Gemini 2.0 Flash 설정 (JSON 모드, 공용 비동기 LLM 클라이언트로 호출)
+        self.model_name = "gemini-2.0-flash"
+        self.generation_config = {
+            "response_mime_type": "application/json",
+            "temperature": 0.0 
+        }
+        self.timeout_sec = 15  # 투표는 실시간성이 중요하므로 짧게
 
         # 최근 발화 저장용 슬라이딩 윈도우 버퍼 (최대 25줄)
         self.transcript_buffer: list[str] = []
@@ -230,11 +242,18 @@ class VoteManager:
         )
 
         try:
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                prompt
-            )
             print("Gemini 호출 시작")
+            response = await llm_client.agenerate(
+                prompt,
+                self.model_name,
+                generation_config=self.generation_config,
+                timeout=self.timeout_sec,
+                max_attempts=2,
+                wait_min=1,
+                wait_max=2,
+                # 실시간 판정이므로 공용 제한기의 일시 정지(429 후 30초 이상)를 기다리지 않음
+                rate_limited=False,
+            )
         except Exception as e:
             print(f"❌ [VoteManager/Gemini] 호출 에러: {e}")
             return
@@ -343,12 +362,26 @@ async def process_track(participant: rtc.RemoteParticipant, track: rtc.RemoteAud
     finally:
         await stt_stream.aclose()
 
+async def enqueue_summary(file_id, room_name, hangup_at):
+    """세션 상태를 IN_PROGRESS로 바꾸고 요약 작업을 큐에 등록 (요약은 Summarize/summarize_worker.py 워커가 처리하고 COMPLETED로 변경)"""
+    update_session_status(room_name, "IN_PROGRESS")
+    try:
+        await asyncio.to_thread(job_queue.get_job_queue().enqueue, file_id, room_name, hangup_at)
+        print("📝 [Summarize] 요약 작업 등록 완료 -> 워커가 처리")
+    except Exception as e:
+        print(f"❌ 요약 작업 등록 실패: {e}")
+
 async def periodic_upload_task(logger, interval=300):
     try:
         while True:
+            # 지난 회의 중 최종 업로드에 실패한 것이 있으면 다시 업로드하고, 그때 미뤄 둔 요약 작업을 등록
+            for record in await logger.retry_pending_uploads():
+                if Summarize_enable == 1:
+                    await enqueue_summary(record["base_name"], record["room_name"], record["ended_at"])
             await asyncio.sleep(interval)
             print(f"⏰ 정기 백업 수행 ({interval}초)")
-            await logger.upload_to_s3()
+            # 새 발화만 세그먼트로 업로드 (변경 없으면 건너뜀)
+            await logger.upload_incremental()
     except asyncio.CancelledError:
         pass
 
@@ -356,7 +389,11 @@ async def entrypoint(ctx: JobContext):
     print("Job 시작. 초기화 중...")
     transcript_logger = TranscriptLogger(ctx.room)
     vote_manager = VoteManager(ctx.room)
+    recap_service = RecapService(ctx.room, transcript_logger)
+    rolling_summarizer = RollingSummarizer(transcript_logger)
     upload_task = None
+    # 전원 퇴장 종료 시각과 요약 작업 등록 여부 (종료 처리에서 최종 업로드를 다시 시도할 때 사용)
+    hangup = {"at": None, "enqueued": False}
 
     try:
         print("Whisper 모델 로딩 중...")
@@ -379,6 +416,8 @@ async def entrypoint(ctx: JobContext):
         print(f"방 접속 완료: {ctx.room.name}")
 
         upload_task = asyncio.create_task(periodic_upload_task(transcript_logger, interval=300))
+        if Summarize_enable == 1 and Rolling_summary == 1:
+            rolling_summarizer.start()
 
         # [추가] 초기 접속자 등록
         for p in ctx.room.remote_participants.values():
@@ -388,6 +427,8 @@ async def entrypoint(ctx: JobContext):
         def on_participant_connected(participant):
             print(f"👋 참가자 입장: {participant.identity}")
             transcript_logger.add_participant(participant)
+            if Recap_in_process == 1 and Recap_precompute == 1:
+                recap_service.precompute(reason=f"{participant.identity} 입장")
 
         @ctx.room.on("track_subscribed")
         def on_track_subscribed(track, publication, participant):
@@ -401,53 +442,23 @@ async def entrypoint(ctx: JobContext):
                 print("🚪 모든 참가자 퇴장 -> 종료 프로세스 시작")
                 
                 async def shutdown_sequence():
-                    # 1. Upload raw logs
-                    await transcript_logger.upload_to_s3()
-                    
-                    if Summarize_enable == 1:
-                        print("📝 [Summarize] 요약 프로세스 시작")
-                        room_name = ctx.room.name
-                        
-                        # 2. Status -> IN_PROGRESS
-                        update_session_status(room_name, "IN_PROGRESS")
-                        
-                        # 3. Run Summarization
-                        base_name = os.path.basename(transcript_logger.filename).replace('.jsonl', '')
-                        script_path = os.path.join("../Summarize", "S3_Summarization.py")
-                        script_path = os.path.abspath(script_path)
-                        
-                        command = [
-                            r"C:\Users\salus\IdeaProjects\untitled1\.venv\Scripts\python.exe", script_path,
-                            "--file_ids", base_name
-                        ]
-                        
-                        print(f"🚀 S3_Summarization.py 실행: {' '.join(command)}")
-                        
-                        try:
-                            process = await asyncio.create_subprocess_exec(
-                                *command,
-                                #stdout=asyncio.subprocess.PIPE,
-                                #stderr=asyncio.subprocess.PIPE
-                            )
-                            
-                            stdout, stderr = await process.communicate()
-                            
-                            # if stdout:
-                            #     print(f"[S3_Summarization Output]\n{stdout.decode()}")
-                            # if stderr:
-                            #     print(f"[S3_Summarization Error]\n{stderr.decode()}")
+                    hangup_at = hangup["at"] = time.time()
 
-                            rc = await process.wait()
+                    # 1. Upload raw logs (세그먼트 -> 최종 JSON 컴팩션)
+                    uploaded = await transcript_logger.compact_to_s3()
 
-                            if rc == 1:
-                                print("✅ 요약 완료")
-                                # 4. Status -> COMPLETED
-                                update_session_status(room_name, "COMPLETED")
-                            else:
-                                print(f"❌ 요약 스크립트 실패 (Exit Code: {process.returncode})")
-                                
-                        except Exception as e:
-                            print(f"❌ 요약 프로세스 실행 중 에러: {e}")
+                    # 회의 중 롤링 요약 마무리 (확정된 토픽은 Summarize/rolling/에 저장되어 있음)
+                    await rolling_summarizer.finish()
+                    
+                    if Summarize_enable == 1:
+                        if uploaded:
+                            # 2. Status -> IN_PROGRESS, 3. 요약 작업을 큐에 등록하고 바로 종료
+                            await enqueue_summary(transcript_logger.base_name, ctx.room.name, hangup_at)
+                            hangup["enqueued"] = True
+                        else:
+                            # 최종 회의록이 없으면 워커가 읽을 수 없으므로 등록하지 않음
+                            # (업로드 대기 목록에 남은 회의는 재업로드에 성공할 때 등록)
+                            print("⚠️ [Summarize] 최종 회의록 업로드 실패 -> 요약 작업 등록 보류")
                     
                     print("🛑 Agent 종료")
                     ctx.shutdown()
@@ -462,11 +473,16 @@ async def entrypoint(ctx: JobContext):
                 message = json.loads(decoded_str)
                 print(f"📨 데이터 수신: {message} from {data_packet.participant.identity}")
 
-                if message.get("action") == "Request_Recap":
+                if message.get("action") == "Request_Recap" and Recap_in_process == 1:
+                    print("📢 [Request_Recap] 요청 수신 -> 에이전트 내 Recap 생성")
+                    asyncio.create_task(recap_service.handle_request(data_packet.participant.identity))
+
+                elif message.get("action") == "Request_Recap":
                     print("📢 [Request_Recap] 요청 수신 -> S3 업로드 시작")
                     requester_id = data_packet.participant.identity
                     
                     async def handle_recap_request(target_id):
+                        started = time.perf_counter()
                         # 1. S3 업로드 (await로 완료 대기)
                         # 파일명: {base_name}_request_recap.json
                         # 여기서 base_name을 알기 위해 logger의 filename을 참조하거나,
@@ -538,6 +554,7 @@ async def entrypoint(ctx: JobContext):
                                     destination_identities=[target_id]
                                 )
                                 print("📨 [RECAP_GENERATED] 이벤트 전송 완료")
+                                print(f"⏱️ [Recap/subprocess] 요청 -> 전송 {time.perf_counter() - started:.2f}s")
                             else:
                                 print("❌ Recap 데이터 로드 실패")
                             
@@ -561,7 +578,13 @@ async def entrypoint(ctx: JobContext):
     finally:
         print("작업 종료 처리 중...")
         if upload_task: upload_task.cancel()
-        await transcript_logger.upload_to_s3()
+        await rolling_summarizer.finish()
+        uploaded = await transcript_logger.compact_to_s3()
+        # 전원 퇴장 때 최종 업로드에 실패해 보류한 요약 작업은 여기서 업로드에 성공하면 등록
+        if uploaded and Summarize_enable == 1 and hangup["at"] and not hangup["enqueued"]:
+            await enqueue_summary(transcript_logger.base_name, ctx.room.name, hangup["at"])
+        await storage.aclose_storage_client()
+        storage.metrics.log_summary()
         ctx.shutdown()
 
 
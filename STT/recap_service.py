@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import asyncio
+from livekit import rtc
+
+import S3_upload  # Summarize 모듈 경로(sys.path) 설정 포함
+import S3_Recap
+
+# 캐시된 Recap이 이 발화 수 이내로 뒤처져 있으면 새로 생성하지 않고 즉시 전송
+RECAP_STALENESS_UTTERANCES = int(os.getenv("RECAP_STALENESS_UTTERANCES", "5"))
+
+# 사전 계산: 회의가 N분 이상 진행된 뒤 참가자가 입장하면 요청 전에 미리 Recap 생성/갱신
+RECAP_PRECOMPUTE_AFTER_MIN = float(os.getenv("RECAP_PRECOMPUTE_AFTER_MIN", "10"))
+# 사전 계산은 STT가 이 시간(초) 동안 새 발화를 내지 않을 때 시작 (실시간 STT와 경쟁 방지)
+RECAP_IDLE_SEC = float(os.getenv("RECAP_IDLE_SEC", "3"))
+# 한가한 구간을 기다리는 최대 시간(초), 넘으면 그냥 시작
+RECAP_IDLE_MAX_WAIT_SEC = float(os.getenv("RECAP_IDLE_MAX_WAIT_SEC", "60"))
+
+
+class RecapService:
+    """
+    에이전트 프로세스 안에서 Recap을 생성하는 서비스 (방 하나당 하나)
+    - 로컬 저널(TranscriptLogger)에서 바로 읽어 생성 (S3 업로드/서브프로세스/폴링 없음)
+    - 생성 즉시 요청자에게 RECAP_GENERATED 전송
+    - Recap/ 저장은 전송 후 백그라운드로 수행
+    - 마지막으로 포함한 발화 ID 기준 캐시: RECAP_STALENESS_UTTERANCES 이내면 즉시 응답
+    - 생성 중에 들어온 요청은 같은 생성 결과를 함께 받음 (destination_identities로 일괄 전송)
+    - 캐시가 오래되면 '이전 Recap + 새 발화'로 증분 갱신 (RECAP_REBASE_EVERY마다 전체 재생성)
+    - precompute(): 늦게 입장한 참가자를 위해 요청 전에 미리 생성 (STT가 한가할 때 시작)
+    """
+    def __init__(self, room: rtc.Room, logger, output_folder: str = "Recap",
+                 staleness_utterances: int = RECAP_STALENESS_UTTERANCES):
+        self.room = room
+        self.logger = logger
+        self.output_folder = output_folder
+        self.staleness_utterances = staleness_utterances
+        self._background_tasks = set()
+
+        # 캐시 = 마지막 Recap 상태 (S3_Recap.next_recap_state 형식 + created_at)
+        # {"recap", "covered_id": 마지막 포함 발화 ID, "updates_since_rebase", "stats", "created_at"}
+        self.cache = None
+        # 진행 중인 생성 작업과 그 결과를 기다리는 요청자 (identity -> 요청 시각)
+        self._inflight = None
+        self._waiters = {}
+        # 사전 계산이 한가한 구간을 기다리는 중에 실제 요청이 오면 바로 시작하도록 깨움
+        self._urgent = asyncio.Event()
+
+    def _cached_recap_for(self, covered_id: int):
+        if self.cache and covered_id - self.cache["covered_id"] <= self.staleness_utterances:
+            return self.cache["recap"]
+        return None
+
+    async def handle_request(self, requester_id: str):
+        """Request_Recap 처리: 캐시 적중 시 즉시 전송, 아니면 생성(진행 중이면 합류)"""
+        covered_id = self.logger.utterance_id - 1
+
+        cached = self._cached_recap_for(covered_id)
+        if cached is not None:
+            print(f"⚡ [RecapService] 캐시 적중 (covered_id={self.cache['covered_id']}, 현재={covered_id}) -> 즉시 전송")
+            await self.publish(cached, [requester_id])
+            return
+
+        self._waiters.setdefault(requester_id, time.perf_counter())
+        if self._inflight is not None:
+            print(f"🔗 [RecapService] 진행 중인 Recap 생성에 합류: {requester_id} (대기 {len(self._waiters)}명)")
+            self._urgent.set()
+            return
+
+        self._inflight = self._spawn(self._generate_and_fan_out())
+
+    def precompute(self, reason: str = ""):
+        """
+        요청이 오기 전에 Recap을 미리 생성/갱신 (참가자 입장 시 호출)
+        - 회의 시작 후 RECAP_PRECOMPUTE_AFTER_MIN분이 지나지 않았으면 건너뜀
+        - 캐시가 충분히 최신이거나 이미 생성 중이면 건너뜀
+        """
+        elapsed_min = self.logger.elapsed_sec() / 60
+        if elapsed_min < RECAP_PRECOMPUTE_AFTER_MIN:
+            return
+        if self._inflight is not None or self._cached_recap_for(self.logger.utterance_id - 1) is not None:
+            return
+
+        print(f"🔮 [RecapService] Recap 사전 계산 예약 ({reason}, 회의 {elapsed_min:.0f}분 경과)")
+        self._inflight = self._spawn(self._generate_and_fan_out(wait_for_idle=True))
+
+    async def _wait_for_idle(self, poll_sec: float = 0.5):
+        """STT가 RECAP_IDLE_SEC 동안 조용해질 때까지 대기 (최대 RECAP_IDLE_MAX_WAIT_SEC, 실제 요청이 오면 즉시 종료)"""
+        self._urgent.clear()
+        waited = 0.0
+        while waited < RECAP_IDLE_MAX_WAIT_SEC and not self._urgent.is_set():
+            if self.logger.idle_sec() >= RECAP_IDLE_SEC:
+                return
+            try:
+                await asyncio.wait_for(self._urgent.wait(), timeout=poll_sec)
+            except asyncio.TimeoutError:
+                pass
+            waited += poll_sec
+
+    async def _generate_and_fan_out(self, wait_for_idle: bool = False):
+        """현재까지의 Recap 생성 -> 대기 중인 모든 요청자에게 한 번에 전송 -> 캐시/저장"""
+        recap_data = None
+
+        try:
+            if wait_for_idle:
+                await self._wait_for_idle()
+
+            started = time.perf_counter()
+            covered_id = self.logger.utterance_id - 1
+            meeting_log_data = await self.logger.snapshot()
+            meeting_log_data["utterances"] = [
+                u for u in meeting_log_data["utterances"] if u.get("id", 0) <= covered_id
+            ]
+            # 이전 Recap(캐시)이 있으면 그 이후 발화만 보내는 증분 갱신, 주기적으로 전체 재생성
+            state = await S3_Recap.anext_recap_state(meeting_log_data, self.cache)
+            recap_data = state["recap"] if state else None
+        except Exception as e:
+            print(f"❌ [RecapService] Recap 생성 실패: {e}")
+        finally:
+            # 대기자 목록을 비우는 시점 이후의 요청은 다음 생성(또는 캐시)으로 처리됨
+            waiters, self._waiters = self._waiters, {}
+            self._inflight = None
+
+        if recap_data is None:
+            print(f"❌ [RecapService] Recap 없음 -> 대기자 {len(waiters)}명에게 전송하지 못함")
+            return
+
+        self.cache = dict(state, created_at=time.perf_counter())
+
+        if not waiters:
+            print(f"🔮 [RecapService] Recap 사전 계산 완료 (covered_id={covered_id}, "
+                  f"{time.perf_counter() - started:.2f}s)")
+        else:
+            await self.publish(recap_data, list(waiters))
+            now = time.perf_counter()
+            print(f"⏱️ [RecapService] 생성 {now - started:.2f}s, 요청자 {len(waiters)}명 "
+                  f"(최대 대기 {max(now - t for t in waiters.values()):.2f}s)")
+
+        self._spawn(self.persist(recap_data))
+
+    async def publish(self, recap_data: dict, destination_identities: list):
+        payload = {
+            "type": "RECAP_GENERATED",
+            "data": recap_data
+        }
+        try:
+            await self.room.local_participant.publish_data(
+                payload=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                reliable=True,
+                destination_identities=destination_identities
+            )
+            print(f"📨 [RECAP_GENERATED] 이벤트 전송 완료 (Target: {destination_identities})")
+        except Exception as e:
+            print(f"❌ [RecapService] LiveKit publish_data 에러: {e}")
+
+    async def persist(self, recap_data: dict):
+        """Recap/{base_name}_recap.json 저장 (기존 S3_Recap.py 출력과 같은 키)"""
+        filename = S3_Recap.recap_output_filename(self.logger.base_name)
+        await self.logger.s3_uploader.upload_json(recap_data, filename, folder=self.output_folder)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import asyncio
+
+import S3_upload  # Summarize 모듈 경로(sys.path) 설정 포함
+import storage
+import structure_mapreduce
+import transcript_index
+import S3_Summarization
+from recap_service import RECAP_IDLE_SEC, RECAP_IDLE_MAX_WAIT_SEC
+
+# 롤링 요약 점검 주기(초)
+ROLLING_SUMMARY_INTERVAL_SEC = float(os.getenv("ROLLING_SUMMARY_INTERVAL_SEC", "300"))
+# 확정 구간 이후 새 발화가 이 수 이상 쌓였을 때만 구조 분석 (짧은 구간을 반복 분석하지 않음)
+ROLLING_SUMMARY_MIN_NEW_UTTERANCES = int(os.getenv("ROLLING_SUMMARY_MIN_NEW_UTTERANCES", "60"))
+# 마지막 발화에서 이 발화 수 이내에 끝나는 토픽은 아직 진행 중인 것으로 보고 확정하지 않음
+ROLLING_SUMMARY_OPEN_TAIL = int(os.getenv("ROLLING_SUMMARY_OPEN_TAIL", "20"))
+# 회의 종료 시 진행 중인 롤링 분석을 기다리는 최대 시간(초), 넘으면 취소
+ROLLING_SUMMARY_FINISH_WAIT_SEC = float(os.getenv("ROLLING_SUMMARY_FINISH_WAIT_SEC", "120"))
+
+
+class RollingSummarizer:
+    """
+    회의 도중 백그라운드에서 최종 요약의 대부분을 미리 계산하는 서비스 (방 하나당 하나)
+    - 주기적으로 '마지막 확정 지점 이후' 발화만 구조 분석(Step 1)
+    - 뒤에 다른 토픽이 이어지고 끝에서 충분히 떨어진 토픽(= 끝난 토픽)을 확정하고 바로 상세 분석(Step 2)
+    - 확정 결과는 Summarize/rolling/{file_id}.json에 저장 -> 종료 후 S3_Summarization.py는
+      남은 구간의 구조 분석/상세 분석과 최종 통합(CONSOLIDATION_PROMPT)만 수행
+    - 구조 분석은 STT가 한가할 때 시작 (실시간 STT와 경쟁 방지)
+    """
+    def __init__(self, logger, interval_sec: float = ROLLING_SUMMARY_INTERVAL_SEC):
+        self.logger = logger
+        self.interval_sec = interval_sec
+        self.file_id = logger.base_name
+        self.state_key = S3_Summarization.rolling_state_key(self.file_id)
+
+        # S3_Summarization.load_rolling_state가 읽는 형식
+        self.state = {
+            "file_id": self.file_id,
+            "finalized_until": None,
+            "main_topic": "",
+            "domain": "",
+            "topics": [],
+            "updated_at": None,
+        }
+        self._loop_task = None
+        self._step_task = None
+        # 마지막으로 구조 분석한 시점의 발화 ID (확정할 토픽이 없었을 때 같은 구간을 반복 분석하지 않음)
+        self._last_checked_id = 0
+
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    def _pending_utterances(self) -> int:
+        """마지막 확정 지점(또는 마지막 분석 시점) 이후 새로 쌓인 발화 수"""
+        checked_until = max(self.state["finalized_until"] or 0, self._last_checked_id)
+        return (self.logger.utterance_id - 1) - checked_until
+
+    async def _load_state(self):
+        """같은 저널을 이어쓰는 경우(크래시 복구) 이전 Job이 확정한 토픽을 이어받음"""
+        if not self.logger.resumed:
+            return
+        try:
+            state = await storage.get_storage_client().aget_json(self.state_key)
+        except storage.ObjectNotFound:
+            return
+        except Exception as e:
+            print(f"⚠️ [RollingSummary] 이전 롤링 요약을 읽지 못했습니다: {e}")
+            return
+        if state.get("file_id") == self.file_id:
+            self.state = state
+            print(f"♻️ [RollingSummary] 이전 롤링 요약 이어받음: 확정 토픽 {len(state['topics'])}개 (ID {state['finalized_until']}까지)")
+
+    async def _wait_for_idle(self, poll_sec: float = 0.5):
+        waited = 0.0
+        while waited < RECAP_IDLE_MAX_WAIT_SEC and self.logger.idle_sec() < RECAP_IDLE_SEC:
+            await asyncio.sleep(poll_sec)
+            waited += poll_sec
+
+    async def _run(self):
+        await self._load_state()
+        while True:
+            await asyncio.sleep(self.interval_sec)
+            if self._pending_utterances() < ROLLING_SUMMARY_MIN_NEW_UTTERANCES:
+                continue
+            await self._wait_for_idle()
+            self._step_task = asyncio.create_task(self.step())
+            try:
+                await self._step_task
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ [RollingSummary] 롤링 요약 실패 (다음 주기에 재시도): {e}")
+
+    async def step(self):
+        """확정 지점 이후 구간을 구조 분석 -> 끝난 토픽을 확정하고 상세 분석 -> 상태 저장"""
+        started = time.perf_counter()
+        covered_id = self.logger.utterance_id - 1
+        meeting_log_data = await self.logger.snapshot()
+        meeting_log_data["utterances"] = [
+            u for u in meeting_log_data["utterances"] if u.get("id", 0) <= covered_id
+        ]
+        index = transcript_index.get_index(meeting_log_data)
+        self._last_checked_id = covered_id
+
+        finalized_until = self.state["finalized_until"]
+        parsed_json = await S3_Summarization.extract_structure(meeting_log_data, after_id=finalized_until)
+        lo = index.index_of(finalized_until) + 1 if finalized_until is not None else 0
+        topics = structure_mapreduce.reconcile_topics(index, parsed_json.get("topics", []), lo)
+
+        # 마지막 토픽은 아직 진행 중일 수 있으므로 항상 남기고, 그 앞에서 끝이 충분히 지난 토픽만 확정
+        closed = []
+        for topic in topics[:-1]:
+            if int(topic["end_id"]) > covered_id - ROLLING_SUMMARY_OPEN_TAIL:
+                break
+            closed.append(topic)
+        if not closed:
+            print(f"🌀 [RollingSummary] 확정할 토픽 없음 (후보 {len(topics)}개, 현재 ID {covered_id})")
+            return
+
+        if not self.state["main_topic"]:
+            self.state["main_topic"] = parsed_json.get("main_topic", "")
+            self.state["domain"] = parsed_json.get("domain", "")
+
+        offset = len(self.state["topics"])
+        total_topics = offset + len(topics)
+        participants_info = json.dumps(meeting_log_data.get("participants", []), ensure_ascii=False, indent=2)
+        # 회의 중 반복 호출되므로 컨텍스트 캐시는 만들지 않음
+        context = await S3_Summarization.prepare_step2_context(self.file_id, index, participants_info, cache_mode="off")
+        semaphore = asyncio.Semaphore(S3_Summarization.STEP2_CONCURRENCY)
+
+        async def run_topic(i, topic_item):
+            async with semaphore:
+                return await S3_Summarization.analyze_topic(offset + i, topic_item, total_topics, context)
+
+        analyzed = await asyncio.gather(*(run_topic(i, t) for i, t in enumerate(closed)))
+
+        # 상세 분석에 실패한 토픽부터는 확정하지 않음 (다음 주기 또는 종료 후 다시 분석)
+        finalized = []
+        for topic_item in analyzed:
+            if topic_item.get("error"):
+                break
+            finalized.append(topic_item)
+        if not finalized:
+            print("⚠️ [RollingSummary] 상세 분석 실패로 확정한 토픽 없음")
+            return
+
+        self.state["topics"].extend(finalized)
+        self.state["finalized_until"] = int(finalized[-1]["end_id"])
+        self.state["updated_at"] = time.time()
+        await self.persist()
+        print(f"🌀 [RollingSummary] 토픽 {len(finalized)}개 확정 (누적 {len(self.state['topics'])}개, "
+              f"ID {self.state['finalized_until']}까지), {time.perf_counter() - started:.1f}s")
+
+    async def persist(self):
+        try:
+            await storage.get_storage_client().aput_json(self.state_key, self.state)
+        except Exception as e:
+            print(f"❌ [RollingSummary] 롤링 요약 저장 실패: {e}")
+
+    async def finish(self):
+        """회의 종료: 진행 중인 분석은 ROLLING_SUMMARY_FINISH_WAIT_SEC까지 기다린 뒤 백그라운드 루프 종료"""
+        if self._loop_task is None:
+            return
+        if self._step_task is not None and not self._step_task.done():
+            print("⏳ [RollingSummary] 진행 중인 롤링 요약을 기다리는 중...")
+            try:
+                await asyncio.wait_for(asyncio.shield(self._step_task), ROLLING_SUMMARY_FINISH_WAIT_SEC)
+            except asyncio.TimeoutError:
+                print(f"⚠️ [RollingSummary] {ROLLING_SUMMARY_FINISH_WAIT_SEC:g}s 내에 끝나지 않아 취소합니다.")
+            except Exception:
+                pass
+        self._loop_task.cancel()
+        try:
+            await self._loop_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        self._loop_task = None
+        print(f"🌀 [RollingSummary] 종료: 확정 토픽 {len(self.state['topics'])}개 (ID {self.state['finalized_until']}까지)")
@@ -0,0 +1,126 @@
+#%%
+# TranscriptLogger 크래시 복구 테스트: 기록 중인 프로세스를 SIGKILL로 죽인 뒤 같은 방의 새 로거가 저널을 이어쓰는지 확인
+###############################################################################################################################################################################
+
+import os
+import sys
+import json
+import signal
+import subprocess
+
+import pytest
+
+pytest.importorskip("livekit")
+pytest.importorskip("dotenv")
+
+STT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ROOM_NAME = "kill9_room"
+UTTERANCES = 2010             # 체크포인트(20개마다) 이후 10개가 남도록
+UPLOADED_AFTER = 1200         # 이 개수까지 기록한 뒤 증분 업로드 1회
+RESUME_TIME_LIMIT_SEC = 1.0   # 복구는 마지막 체크포인트 이후 꼬리만 읽으므로 회의 길이와 무관하게 짧아야 함
+
+# 1단계: 발화를 기록하다가 쓰는 도중(부분 줄)에 멈춰 SIGKILL을 기다림
+WRITER = """
+import os, sys, json, time, asyncio, types
+sys.path.insert(0, {stt_dir!r})
+import logger
+
+lg = logger.TranscriptLogger(types.SimpleNamespace(name={room!r}))
+for i in range({utterances}):
+    lg.log("speaker_%d" % (i % 3), "발화 %d" % i)
+    if i + 1 == {uploaded_after}:
+        asyncio.run(lg.upload_incremental())
+
+with open(lg.filename, "ab") as f:
+    size = f.tell()
+    f.write(b'{{"id":{next_id},"start_time":"2026-01-01T00:00:00","USER_ID":"spea')
+    f.flush()
+print(json.dumps({{"journal": lg.filename, "size_before_torn": size}}), flush=True)
+time.sleep(60)
+"""
+
+# 2단계: 같은 방 이름으로 새 로거를 만들어 복구하고, 남은 구간을 업로드
+RESUMER = """
+import os, sys, json, time, asyncio, types
+sys.path.insert(0, {stt_dir!r})
+import logger
+
+started = time.perf_counter()
+lg = logger.TranscriptLogger(types.SimpleNamespace(name={room!r}))
+resume_sec = time.perf_counter() - started
+
+next_id = lg.utterance_id
+journal_size = os.path.getsize(lg.filename)
+asyncio.run(lg.upload_incremental())
+print(json.dumps({{"resumed": lg.resumed, "journal": lg.filename, "next_id": next_id,
+                  "journal_size": journal_size, "segments": lg.segments, "resume_sec": resume_sec}}), flush=True)
+"""
+
+
+def _env(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_ROOT": str(tmp_path / "storage"),
+        "STORAGE_COMPRESSION": "none",
+        "LOG_CHECKPOINT_EVERY": "20",
+    })
+    return env
+
+
+def _last_json_line(output: str) -> dict:
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_resume_after_sigkill(tmp_path):
+    env = _env(tmp_path)
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER.format(stt_dir=STT_DIR, room=ROOM_NAME, utterances=UTTERANCES,
+                                             uploaded_after=UPLOADED_AFTER, next_id=UTTERANCES + 1)],
+        cwd=tmp_path, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        # 부분 줄까지 쓴 뒤 출력하는 상태 줄을 기다렸다가 정리 없이 강제 종료
+        for line in writer.stdout:
+            if line.startswith("{"):
+                killed_at = json.loads(line)
+                break
+        else:
+            pytest.fail("writer exited before reaching the torn write")
+        writer.send_signal(signal.SIGKILL)
+        writer.wait(timeout=10)
+    finally:
+        if writer.poll() is None:
+            writer.kill()
+        writer.stdout.close()
+    assert writer.returncode == -signal.SIGKILL
+
+    resumer = subprocess.run(
+        [sys.executable, "-c", RESUMER.format(stt_dir=STT_DIR, room=ROOM_NAME)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert resumer.returncode == 0, resumer.stderr
+    result = _last_json_line(resumer.stdout)
+    print(f"resume time after SIGKILL ({UTTERANCES} utterances): {result['resume_sec'] * 1000:.1f} ms")
+
+    # 같은 저널을 이어쓰고, 발화 ID가 끊긴 지점 다음부터 이어짐
+    assert result["resumed"] is True
+    assert result["journal"] == killed_at["journal"]
+    assert result["next_id"] == UTTERANCES + 1
+
+    # 쓰다가 끊긴 마지막 줄은 잘려 나가고 남은 줄은 모두 온전한 JSON
+    assert result["journal_size"] == killed_at["size_before_torn"]
+    with open(result["journal"], "rb") as f:
+        ids = [json.loads(line)["id"] for line in f]
+    assert ids == list(range(1, UTTERANCES + 1))
+
+    # 재업로드는 크래시 전 uploaded_offset 이후 구간만
+    ranges = [(s["first_id"], s["last_id"]) for s in result["segments"]]
+    assert ranges == [(1, UPLOADED_AFTER), (UPLOADED_AFTER + 1, UTTERANCES)]
+    segment_dir = tmp_path / "storage" / "meeting_logs" / "segments" / os.path.basename(result["journal"])[:-len(".jsonl")]
+    uploaded = sorted(p.name for p in segment_dir.iterdir() if p.suffix == ".jsonl")
+    assert uploaded == [f"{1:06d}_{UPLOADED_AFTER:06d}.jsonl", f"{UPLOADED_AFTER + 1:06d}_{UTTERANCES:06d}.jsonl"]
+    with open(segment_dir / uploaded[-1], "rb") as f:
+        assert [json.loads(line)["id"] for line in f] == list(range(UPLOADED_AFTER + 1, UTTERANCES + 1))
+
+    assert result["resume_sec"] < RESUME_TIME_LIMIT_SEC
@@ -3,90 +3,100 @@
 ###############################################################################################################################################################################
 
 import os
-import google.generativeai as genai
 import json
 import argparse
-import boto3
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from google.api_core import exceptions
+import asyncio
+import time
 from dotenv import load_dotenv
 
 # Import prompts from external file
 import prompts
+import storage
+import llm_client
+import schemas
+import prompt_builder
+import transcript_index
+import model_router
 
 load_dotenv()
 
 # Configuration
-MODEL_NAME = "models/gemini-2.5-pro"
-BUCKET_NAME = "hedj-s3-1"    # S3 버킷 이름
-
-# S3 Client 초기화
-s3_client = boto3.client('s3')
+BUCKET_NAME = storage.BUCKET_NAME    # S3 버킷 이름 (AWS_BUCKET_NAME, 기본 hedj-s3-1)
+# 증분 Recap을 이 횟수만큼 연속 갱신하면 다음 번에는 전체 대화로 다시 생성 (0이면 항상 전체 생성)
+RECAP_REBASE_EVERY = int(os.getenv("RECAP_REBASE_EVERY", "5"))
 
 # ==============================================================================
 # 1. API 호출 헬퍼 함수 (Retry 적용)
 # ==============================================================================
-@retry(
-    retry=retry_if_exception_type((
-        exceptions.ResourceExhausted, 
-        exceptions.ServiceUnavailable, 
-        exceptions.GoogleAPICallError,
-        exceptions.InternalServerError
-    )),
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=10)
-)
-def generate_content_with_retry(model, prompt):
+async def generate_recap_json(prompt):
     """
-    Gemini API 호출을 수행하며, 실패 시 지수 백오프로 재시도합니다.
+    공용 비동기 LLM 클라이언트로 Gemini API를 호출합니다. (실패 시 지수 백오프로 최대 3회)
+    JSON 모드 + RECAP_SCHEMA로 응답 형식을 강제하고, 깨진 JSON은 복구 또는 1회 재요청합니다.
+    지연 시간이 중요하므로 model_router가 flash를 먼저 쓰고, 한도가 부족하면 pro로 대체합니다.
+    반환: (파싱된 dict, 응답)
     """
-    return model.generate_content(prompt)
+    return await model_router.agenerate_json("recap", prompt, schema=schemas.RECAP_SCHEMA, label="Recap",
+                                             max_attempts=3, wait_min=2, wait_max=10)
 
 
 # ==============================================================================
-# 2. Recap 생성 함수
+# 2. Recap 생성 단계별 함수 (S3 스크립트와 에이전트 내 Recap 서비스가 공유)
 # ==============================================================================
-def generate_recap(file_id, end_utterance_id=None, input_folder="Request_Recap", output_folder="Recap"):
-    print(f"\n{'='*80}")
-    print(f"🚀 [Recap] 중간 요약 생성 시작: {file_id}")
-    if end_utterance_id:
-        print(f"   (Cut-off ID: {end_utterance_id})")
-    print(f"{'='*80}\n")
-    
-    # S3 경로 설정
-    input_s3_key = f"{input_folder}/{file_id}.json"
-    
-    #try:
-    # 1. S3에서 JSON 파일 읽기
-    print(f"S3에서 파일 읽는 중: s3://{BUCKET_NAME}/{input_s3_key}")
-    response = s3_client.get_object(Bucket=BUCKET_NAME, Key=input_s3_key)
-    meeting_log_data = json.loads(response['Body'].read().decode('utf-8'))
+def build_conversation_lines(meeting_log_data, end_utterance_id=None, after_utterance_id=None):
+    """
+    회의록 데이터에서 '[ID: n] 이름: 내용' 형식의 대화 줄 목록을 만듭니다.
+    (TRANSCRIPT_COMPACTION이면 같은 화자의 연속 발화는 '[ID: 12-15] 이름: ...' 한 줄, 필러/환각 문구는 제외)
+    end_utterance_id가 있으면 해당 발화까지만 포함합니다.
+    after_utterance_id가 있으면 그 이후 발화만 포함합니다. (증분 Recap용)
+    """
+    index = transcript_index.get_index(meeting_log_data)
+    return index.conversation_lines(end_utterance_id, after_utterance_id)
 
-    # 2. 대화 내용 추출 및 필터링
-    utterances = meeting_log_data.get('utterances', [])
-    participants = meeting_log_data.get('participants', [])
-    speaker_map = {p['USER_ID']: p.get('name', f"P{i:02d}") for i, p in enumerate(participants)}
 
-    conversation_text_lines = []
+def last_covered_id(meeting_log_data, end_utterance_id=None):
+    """Recap이 포함하게 될 마지막 발화 ID (end_utterance_id 이하 중 최대)"""
+    last_id = 0
+    for utterance in meeting_log_data.get('utterances', []):
+        u_id = utterance.get('id') or 0
+        if end_utterance_id and u_id > int(end_utterance_id):
+            break
+        last_id = max(last_id, u_id)
+    return last_id
 
-    found_cutoff = False
-    for utterance in utterances:
-        u_id = utterance.get('id')
-        speaker_id = utterance.get('USER_ID')
-        message = utterance.get('content')
 
-        if speaker_id and message and u_id:
-            speaker_label = speaker_map.get(speaker_id, speaker_id)
-            conversation_text_lines.append(f"[ID: {u_id}] {speaker_label}: {message}")
+def usage_report(response, mode, num_lines, started):
+    """응답의 usage_metadata에서 토큰 수를 꺼내 지연 시간과 함께 출력하고 dict로 반환"""
+    usage = getattr(response, "usage_metadata", None)
+    stats = {
+        "mode": mode,
+        "utterances": num_lines,
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "latency_sec": round(time.perf_counter() - started, 2),
+    }
+    print(f"📊 [Recap/{mode}] 발화 {num_lines}개, 입력 토큰 {stats['prompt_tokens']}, "
+          f"출력 토큰 {stats['output_tokens']}, {stats['latency_sec']:.2f}s")
+    return stats
 
-        # end_utterance_id가 지정되어 있고, 현재 ID와 일치하면 중단
-        if end_utterance_id and str(u_id) == str(end_utterance_id):
-            found_cutoff = True
-            break
 
-    if end_utterance_id and not found_cutoff:
-        print(f"⚠️ 경고: 지정된 Cut-off ID ({end_utterance_id})를 찾지 못했습니다. 전체 내용을 사용합니다.")
+async def _invoke_recap_model(prompt_text, mode, num_lines):
+    """Recap 프롬프트로 Gemini를 호출하고 (파싱 결과, 통계)를 반환"""
+    print(f"--- Gemini API 호출 중 ({mode}) ---")
+
+    started = time.perf_counter()
+    parsed_json, response = await generate_recap_json(prompt_text)
+    stats = usage_report(response, mode, num_lines, started)
+
+    return parsed_json, stats
 
+
+async def agenerate_recap_from_data(meeting_log_data, end_utterance_id=None):
+    """
+    회의록 데이터(dict)로부터 Recap을 생성합니다. 저장은 하지 않습니다.
+    대화 내용이 없으면 None을 반환합니다.
+    """
+    # 1. 대화 내용 추출 및 필터링
+    conversation_text_lines = build_conversation_lines(meeting_log_data, end_utterance_id)
     conversation_text = "\n".join(conversation_text_lines)
 
     if not conversation_text:
@@ -95,20 +105,87 @@ def generate_recap(file_id, end_utterance_id=None, input_folder="Request_Recap",
 
     print(f"✅ 분석 대상 발화 수: {len(conversation_text_lines)}개")
 
-    # 3. 프롬프트 구성
+    # 2. 프롬프트 구성
     prompt_text = prompts.RECAP_PROMPT.format(input_data=conversation_text)
 
-    # 4. Gemini API 호출
-    model = genai.GenerativeModel(MODEL_NAME)
-    print("--- Gemini API 호출 중 (Single-Shot) ---")
+    # 3. Gemini API 호출 및 결과 파싱
+    parsed_json, _ = await _invoke_recap_model(prompt_text, "full", len(conversation_text_lines))
+    return parsed_json
+
+
+async def anext_recap_state(meeting_log_data, previous_state=None, end_utterance_id=None,
+                            rebase_every=RECAP_REBASE_EVERY):
+    """
+    이전 Recap 상태를 바탕으로 새 Recap 상태를 만듭니다.
+    - 상태: {"recap", "covered_id", "updates_since_rebase", "stats"}
+    - 이전 상태가 있으면 '이전 요약 + 이후 발화'만 보내는 증분 갱신
+    - 이전 상태가 없거나 증분 갱신이 rebase_every번 누적되면 전체 대화로 재생성 (요약 드리프트 방지)
+    - 새 발화가 없으면 이전 상태를 그대로 반환, 대화 내용이 전혀 없으면 None
+    """
+    covered_id = last_covered_id(meeting_log_data, end_utterance_id)
+
+    incremental = (
+        previous_state is not None
+        and rebase_every > 0
+        and previous_state.get("updates_since_rebase", 0) < rebase_every
+    )
+
+    if previous_state is not None and covered_id <= previous_state["covered_id"]:
+        print(f"✅ 새 발화 없음 (covered_id={previous_state['covered_id']}) -> 이전 Recap 재사용")
+        return previous_state
+
+    if not incremental:
+        conversation_text_lines = build_conversation_lines(meeting_log_data, end_utterance_id)
+        if not conversation_text_lines:
+            print("❌ 대화 내용이 없습니다.")
+            return previous_state
+
+        print(f"✅ 분석 대상 발화 수: {len(conversation_text_lines)}개 (전체)")
+        prompt_text = prompts.RECAP_PROMPT.format(input_data="\n".join(conversation_text_lines))
+        parsed_json, stats = await _invoke_recap_model(prompt_text, "full", len(conversation_text_lines))
+        return {"recap": parsed_json, "covered_id": covered_id, "updates_since_rebase": 0, "stats": stats}
+
+    delta_lines = build_conversation_lines(
+        meeting_log_data, end_utterance_id, after_utterance_id=previous_state["covered_id"]
+    )
+    print(f"✅ 분석 대상 발화 수: {len(delta_lines)}개 "
+          f"(증분, ID {previous_state['covered_id']} 이후)")
+
+    prompt_text = prompts.INCREMENTAL_RECAP_PROMPT.format(
+        previous_recap=json.dumps(previous_state["recap"], ensure_ascii=False, indent=2),
+        input_data="\n".join(delta_lines),
+    )
+    parsed_json, stats = await _invoke_recap_model(prompt_text, "incremental", len(delta_lines))
+
+    return {
+        "recap": parsed_json,
+        "covered_id": covered_id,
+        "updates_since_rebase": previous_state.get("updates_since_rebase", 0) + 1,
+        "stats": stats,
+    }
 
-    response = generate_content_with_retry(model, prompt_text)
 
-    # 5. 결과 파싱 및 출력
-    json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-    print(response)
-    parsed_json = json.loads(json_string)
+def recap_output_filename(file_id, end_utterance_id=None):
+    # 파일명 변환 로직: _request_recap -> _recap
+    if file_id.endswith("_request_recap"):
+        base_name = file_id.replace("_request_recap", "")
+        output_filename = f"{base_name}_recap.json"
+    else:
+        output_filename = f"{file_id}_recap.json"
+
+    if end_utterance_id:
+        output_filename = output_filename.replace(".json", f"_{end_utterance_id}.json")
+
+    return output_filename
 
+
+def recap_state_key(file_id, output_folder="Recap"):
+    """증분 Recap 상태 저장 위치 (Recap/state/{파일명}.json)"""
+    base_name = file_id.replace("_request_recap", "")
+    return f"{output_folder}/state/{base_name}.json"
+
+
+def print_recap(parsed_json):
     print("\n" + "="*40)
     print("       📋 중간 요약 (Recap)       ")
     print("="*40)
@@ -126,31 +203,57 @@ def generate_recap(file_id, end_utterance_id=None, input_folder="Request_Recap",
     print(f"\n💡 Tip: {parsed_json.get('catch_up_tip', '')}")
     print("="*40 + "\n")
 
-    # 6. 결과 S3 저장
-    # 파일명 변환 로직: _request_recap -> _recap
-    if file_id.endswith("_request_recap"):
-        base_name = file_id.replace("_request_recap", "")
-        output_filename = f"{base_name}_recap.json"
-    else:
-        output_filename = f"{file_id}_recap.json"
 
+# ==============================================================================
+# 3. Recap 생성 함수 (S3 입력 -> S3 출력)
+# ==============================================================================
+async def agenerate_recap(file_id, end_utterance_id=None, input_folder="Request_Recap", output_folder="Recap",
+                         incremental=False):
+    print(f"\n{'='*80}")
+    print(f"🚀 [Recap] 중간 요약 생성 시작: {file_id}")
     if end_utterance_id:
-        output_filename = output_filename.replace(".json", f"_{end_utterance_id}.json")
+        print(f"   (Cut-off ID: {end_utterance_id})")
+    print(f"{'='*80}\n")
+    
+    # S3 경로 설정
+    input_s3_key = f"{input_folder}/{file_id}.json"
+    
+    #try:
+    # 1. S3에서 JSON 파일 읽기
+    print(f"S3에서 파일 읽는 중: s3://{BUCKET_NAME}/{input_s3_key}")
+    meeting_log_data = await storage.get_storage_client().aget_json(input_s3_key)
+
+    # 2. Recap 생성 (증분 모드면 Recap/state/의 이전 상태를 이어서 갱신)
+    if incremental:
+        state_key = recap_state_key(file_id, output_folder)
+        try:
+            previous_state = await storage.get_storage_client().aget_json(state_key)
+        except storage.ObjectNotFound:
+            previous_state = None
+
+        state = await anext_recap_state(meeting_log_data, previous_state, end_utterance_id)
+        if state is None:
+            return None
+        if state is not previous_state:
+            await storage.get_storage_client().aput_json(state_key, state, indent=2)
+        parsed_json = state["recap"]
+    else:
+        parsed_json = await agenerate_recap_from_data(meeting_log_data, end_utterance_id)
+        if parsed_json is None:
+            return None
+
+    print_recap(parsed_json)
 
-    output_s3_key = f"{output_folder}/{output_filename}"
+    # 3. 결과 S3 저장
+    output_s3_key = f"{output_folder}/{recap_output_filename(file_id, end_utterance_id)}"
 
     print(f"S3에 Recap 저장 중: s3://{BUCKET_NAME}/{output_s3_key}")
-    s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=output_s3_key,
-        Body=json.dumps(parsed_json, ensure_ascii=False, indent=2),
-        ContentType='application/json'
-    )
+    await storage.get_storage_client().aput_json(output_s3_key, parsed_json, indent=2)
     print("✅ 저장 완료")
 
     return parsed_json
 
-    # except s3_client.exceptions.NoSuchKey:
+    # except storage.ObjectNotFound:
     #     print(f"오류: S3에서 '{input_s3_key}' 파일을 찾을 수 없습니다.")
     #     return None
     # except Exception as e:
@@ -159,12 +262,9 @@ def generate_recap(file_id, end_utterance_id=None, input_folder="Request_Recap",
     #     return None
 
 if __name__ == "__main__":
-    # API 키 설정
+    # API 키 설정 (GEMINI_API_KEY 또는 GOOGLE_API_KEY)
     try:
-        api_key = "-"
-        if api_key is None:
-            raise ValueError("GEMINI_API_KEY 환경 변수가 설정되지 않았습니다.")
-        genai.configure(api_key=api_key)
+        llm_client.configure()
     except Exception as e:
         print(f"API 키 설정 중 오류 발생: {e}")
         exit(1)
@@ -175,8 +275,15 @@ if __name__ == "__main__":
     parser.add_argument("--end_id", required=False, help="Optional: Cut-off Utterance ID (simulate 'current time')")
     parser.add_argument("--input_folder", default="Request_Recap", help="S3 Input Folder")
     parser.add_argument("--output_folder", default="Recap", help="S3 Output Folder")
+    parser.add_argument("--incremental", action="store_true",
+                        help="이전 Recap 상태(Recap/state/)에 새 발화만 반영하여 갱신")
     
     args = parser.parse_args()
 
     print("Recap 함수 시작")
-    generate_recap(args.file_id, args.end_id, args.input_folder, args.output_folder)
+    try:
+        asyncio.run(agenerate_recap(args.file_id, args.end_id, args.input_folder, args.output_folder, args.incremental))
+    finally:
+        model_router.log_summary()
+        llm_client.log_json_summary()
+        prompt_builder.log_summary()
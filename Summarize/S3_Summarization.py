@@ -3,32 +3,40 @@
 ###############################################################################################################################################################################
 
 import os
-import google.generativeai as genai
 import json
 import argparse
+import asyncio
 import time
 import traceback
-import boto3
-from botocore.exceptions import ClientError
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from google.api_core import exceptions
+from collections import Counter
 from dotenv import load_dotenv
 import requests
 import sys
 
 # Import prompts from external file
 import prompts
+import storage
+import rate_limiter
+import llm_client
+import transcript_index
+import structure_mapreduce
+import checkpoint as stage_checkpoint
+import schemas
+import prompt_builder
+import local_segmentation
+import model_router
 
 load_dotenv()
 
 # Configuration
-MODEL_NAME = "models/gemini-2.5-pro"
-BUFFER_SIZE = 10             # 앞뒤 문맥 포함 개수
-WAIT_SECONDS = 31            # API 호출 간 대기 시간 (초)
-BUCKET_NAME = "hedj-s3-1"    # S3 버킷 이름
-
-# S3 Client 초기화
-s3_client = boto3.client('s3')
+MODEL_NAME = model_router.PRO_MODEL    # 기본 모델 (컨텍스트 캐시/체크포인트 기준, 호출별 모델은 model_router가 선택)
+BUFFER_SIZE = prompt_builder.CONTEXT_BUFFER_MAX    # 앞뒤 문맥 포함 최대 개수 (실제 개수는 구간 길이와 토큰 예산으로 결정)
+STEP2_CONCURRENCY = int(os.getenv("STEP2_CONCURRENCY", "4"))  # 토픽 상세 분석 동시 호출 수 (실제 속도는 rate_limiter가 조절)
+# Step 2 공통 앞부분 컨텍스트 캐시: off | prefix(공통 지시만) | transcript(공통 지시 + 전체 대화) | auto(=transcript)
+STEP2_CONTEXT_CACHE = os.getenv("STEP2_CONTEXT_CACHE", "auto").lower()
+STEP2_CACHE_MIN_TOPICS = 2    # 캐시 모델로 라우팅될 토픽이 이보다 적으면 캐시를 만들지 않음 (캐시 생성/보관 비용이 더 큼)
+BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "2"))   # 배치 모드에서 동시에 처리할 회의 수
+BUCKET_NAME = storage.BUCKET_NAME    # S3 버킷 이름 (AWS_BUCKET_NAME, 기본 hedj-s3-1)
 
 
 def update_session_status(room_name, status):
@@ -63,95 +71,91 @@ def update_session_status(room_name, status):
 # ==============================================================================
 # 1. API 호출 헬퍼 함수 (Retry 적용)
 # ==============================================================================
-@retry(
-    retry=retry_if_exception_type((
-        exceptions.ResourceExhausted, 
-        exceptions.ServiceUnavailable, 
-        exceptions.GoogleAPICallError,
-        exceptions.InternalServerError
-    )),
-    stop=stop_after_attempt(5),
-    wait=wait_exponential(multiplier=1, min=4, max=60)
-)
-def generate_content_with_retry(model, prompt):
+async def generate_content_with_retry(prompt, **kwargs):
+    """
+    공용 비동기 LLM 클라이언트로 Gemini API를 호출합니다.
+    (지수 백오프 재시도, 시도별 타임아웃, 공용 RPM/TPM 제한기 적용)
+    """
+    return await llm_client.agenerate(prompt, MODEL_NAME, **kwargs)
+
+
+async def generate_json_with_retry(prompt, schema=None, label="", task="structure", **kwargs):
     """
-    Gemini API 호출을 수행하며, 실패 시 지수 백오프로 재시도합니다.
+    JSON 모드(+ 응답 스키마)로 호출하고 파싱된 결과를 반환합니다.
+    응답 JSON이 깨졌으면 복구 파서로 고치고, 그래도 안 되면 이 호출만 다시 요청합니다.
+    모델은 작업 유형(task)과 프롬프트 크기, 호출 한도 여유로 model_router가 고릅니다.
+    반환: (파싱된 dict, 응답)
     """
-    return model.generate_content(prompt)
+    return await model_router.agenerate_json(task, prompt, schema=schema, label=label, **kwargs)
+
+
+async def generate_json(prompt, schema=None, label="", task="structure"):
+    """structure_mapreduce/local_segmentation용: 파싱된 dict만 반환"""
+    return (await generate_json_with_retry(prompt, schema, label, task))[0]
 
 # ==============================================================================
 # 2. ID 기반 텍스트 추출 함수 (Buffer 적용)
 # ==============================================================================
-def get_transcript_segment(all_utterances, start_id, end_id, buffer=5):
+def get_transcript_segment(index, start_id, end_id, budget_tokens):
     """
-    전체 발화 목록에서 특정 ID 구간의 텍스트만 추출합니다.
-    앞뒤로 buffer만큼의 발화를 더 포함하여 문맥을 확보합니다.
+    회의 발화 인덱스에서 특정 ID 구간의 텍스트만 추출합니다.
+    토큰 예산 안에서 구간 길이에 맞춰 앞뒤 문맥 발화를 포함하고, 예산을 넘으면 구간을 축약합니다.
+    반환: (텍스트, prompt_builder.fit_segment 정보), ID를 못 찾으면 ("", None)
     """
-    start_idx = -1
-    end_idx = -1
-    
-    # 인덱스 찾기 (문자열/정수 호환 위해 str 변환 비교)
-    for i, u in enumerate(all_utterances):
-        if str(u.get('id')) == str(start_id):
-            start_idx = i
-        if str(u.get('id')) == str(end_id):
-            end_idx = i
-            if start_idx != -1: break 
-            
-    if start_idx == -1 or end_idx == -1:
-        return "" # ID를 못 찾은 경우 빈 문자열 반환
+    return prompt_builder.fit_segment(index, start_id, end_id, budget_tokens, label="user_id")
 
-    # 버퍼 적용 (리스트 범위 보호)
-    real_start = max(0, start_idx - buffer)
-    real_end = min(len(all_utterances), end_idx + 1 + buffer)
-    
-    segment_lines = []
-    for i in range(real_start, real_end):
-        u = all_utterances[i]
-        u_id = u.get('id')
-        name = u.get('USER_ID', 'Unknown')
-        content = u.get('content', '')
-        segment_lines.append(f"[ID: {u_id}] {name}: {content}")
-        
-    return "\n".join(segment_lines)
+
+def log_compaction(index, label, stage):
+    """대화 압축(TRANSCRIPT_COMPACTION) 전후 줄 수/추정 토큰 로그"""
+    if not index.compact:
+        return
+    report = index.compaction_report(label)
+    saved = report['raw_tokens'] - report['compact_tokens']
+    print(f"🗜️ [{stage}] 대화 압축: 발화 {report['utterances']}개 -> 줄 {report['lines']}개, "
+          f"토큰 약 {report['raw_tokens']:,} -> {report['compact_tokens']:,} "
+          f"(-{saved / max(1, report['raw_tokens']):.0%}), 제거: 필러 {report['filler']}, "
+          f"환각 문구 {report['hallucination']}, 중복 {report['duplicate']}, 빈 발화 {report['empty']}")
+    return report
 
 
 # ==============================================================================
 # 3. 구조 분석 함수 (Step 1)
 # ==============================================================================
-def analyze_structure(file_id):
-    print(f"\n{'='*80}")
-    print(f"🏗️ [Step 1] 구조 분석 시작: {file_id}")
-    print(f"{'='*80}\n")
-    
-    # S3 경로 설정
-    input_s3_key = f"meeting_logs/{file_id}.json"
-    
-    try:
-        # 1. S3에서 JSON 파일 읽기
-        print(f"S3에서 파일 읽는 중: s3://{BUCKET_NAME}/{input_s3_key}")
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=input_s3_key)
-        meeting_log_data = json.loads(response['Body'].read().decode('utf-8'))
-        
-        # --- 프롬프트에 포함할 내용 가공 ---
-        metadata_str = json.dumps(meeting_log_data.get('metadata', {}), ensure_ascii=False, indent=2)
-        participants_str = json.dumps(meeting_log_data.get('participants', []), ensure_ascii=False, indent=2)
-        
-        speaker_map = {p['USER_ID']: p.get('name', f"P{i:02d}") for i, p in enumerate(meeting_log_data.get('participants', []))}
-        conversation_text_lines = []
-        
-        for utterance in meeting_log_data.get('utterances', []):
-            u_id = utterance.get('id')
-            speaker_id = utterance.get('USER_ID') 
-            message = utterance.get('content')
-            
-            if speaker_id and message and u_id:
-                speaker_label = speaker_map.get(speaker_id, speaker_id)
-                conversation_text_lines.append(f"[ID: {u_id}] {speaker_label}: {message}")
-                
-        conversation_text = "\n".join(conversation_text_lines)
-        
-        prompt_input_text = f"""# Metadata
+async def extract_structure(meeting_log_data, after_id=None, structure_mode=None):
+    """
+    회의 데이터에서 구조(main_topic, domain, topics)를 추출합니다.
+    after_id가 있으면 그 이후 발화만 대상으로 합니다. (회의 중 롤링 요약 / 종료 후 남은 구간)
+    structure_mode: llm | local | hybrid (기본 STRUCTURE_MODE, local/hybrid가 실패하면 llm으로 재시도)
+    """
+    structure_mode = structure_mode or local_segmentation.STRUCTURE_MODE
+    if after_id is not None:
+        meeting_log_data = dict(meeting_log_data, utterances=[
+            u for u in meeting_log_data.get('utterances', [])
+            if transcript_index.normalize_id(u.get('id')) > transcript_index.normalize_id(after_id)
+        ])
+
+    # --- 프롬프트에 포함할 내용 가공 ---
+    metadata_str = json.dumps(meeting_log_data.get('metadata', {}), ensure_ascii=False, indent=2)
+    participants_str = json.dumps(meeting_log_data.get('participants', []), ensure_ascii=False, indent=2)
+
+    # 발화 인덱스 (Step 2 구간 추출에서도 같은 인덱스를 재사용)
+    index = transcript_index.get_index(meeting_log_data)
+    conversation_text = index.text()
+    log_compaction(index, "name", "구조 분석")
+
+    # 로컬 임베딩 구간 분할 (전체 대화를 LLM에 보내지 않음)
+    if structure_mode in ("local", "hybrid"):
+        try:
+            parsed_json = await local_segmentation.analyze_local(
+                index, metadata_str, participants_str, generate_json, structure_mode
+            )
+            print(f"\n--- 로컬 구조 분석 결과 ({structure_mode}) ---")
+            print(json.dumps(parsed_json, indent=2, ensure_ascii=False))
+            return parsed_json
+        except Exception as e:
+            print(f"⚠️ 로컬 구조 분석 실패 -> LLM 구조 분석으로 재시도: {e}")
+
+    prompt_input_text = f"""# Metadata
 {metadata_str}
 
 # Participants
@@ -160,44 +164,119 @@ def analyze_structure(file_id):
 # Conversation
 {conversation_text}
 """
-        print(f"S3 파일 내용 로드 및 프롬프트용 데이터 가공 완료.")
+    print(f"S3 파일 내용 로드 및 프롬프트용 데이터 가공 완료.")
+
+    # --- 구조 및 구간 추출용 프롬프트 ---
+    # prompts.py에서 템플릿 가져오기
+    prompt_text_template = prompts.STRUCTURE_PROMPT.format(input_data=prompt_input_text)
+
+    # 긴 회의는 구간별 분석 후 병합 (map-reduce), 실패하면 단일 호출로 재시도
+    prompt_tokens = rate_limiter.estimate_tokens(prompt_text_template)
+    windowing = structure_mapreduce.choose_mode(prompt_tokens)
+    print(f"구조 분석 방식: {windowing} (프롬프트 약 {prompt_tokens} 토큰)")
+
+    parsed_json = None
+    if windowing == "hierarchical":
+        try:
+            parsed_json = await structure_mapreduce.analyze_hierarchical(
+                index, metadata_str, participants_str, generate_json
+            )
+        except Exception as e:
+            print(f"⚠️ 계층적 구조 분석 실패 -> 단일 호출로 재시도: {e}")
+
+    if parsed_json is None:
+        # 프롬프트 전달 (Retry 적용)
+        print(f"---Gemini API 호출 중--- (모델: {model_router.route('structure', prompt_tokens)[0]})")
+        parsed_json = await generate_json(prompt_text_template, schemas.STRUCTURE_SCHEMA, "구조 분석")
+        # 압축 줄의 범위 ID('12-15')를 실제 발화 ID로 바꾸고, 없는 ID/겹치는 구간 정리
+        parsed_json['topics'] = structure_mapreduce.reconcile_topics(index, parsed_json.get('topics', []))
 
-        # --- 구조 및 구간 추출용 프롬프트 ---
-        # prompts.py에서 템플릿 가져오기
-        prompt_text_template = prompts.STRUCTURE_PROMPT.format(input_data=prompt_input_text)
+    print("\n--- Gemini API 응답 ---")
+    print(json.dumps(parsed_json, indent=2, ensure_ascii=False))
+    return parsed_json
 
-        # 모델 초기화
-        model = genai.GenerativeModel(MODEL_NAME)
-        print(f"Gemini 모델 초기화 성공. (모델: {MODEL_NAME})")
-        
-        # 프롬프트 전달 (Retry 적용)
-        print("---Gemini API 호출 중---")
-        response = generate_content_with_retry(model, prompt_text_template)
-        
-        print("\n--- Gemini API 응답 ---")
-        
-        # JSON 파싱
-        json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-        parsed_json = json.loads(json_string)
-        print(json.dumps(parsed_json, indent=2, ensure_ascii=False))
+
+def rolling_state_key(file_id):
+    """회의 중 롤링 요약이 확정한 토픽을 저장하는 키 (STT/rolling_summary.py와 공용)"""
+    return f"Summarize/rolling/{file_id}.json"
+
+
+async def load_rolling_state(file_id, meeting_log_data):
+    """
+    회의 중 롤링 요약 결과를 읽어옵니다. 없거나 회의록과 맞지 않으면 None
+    (확정 구간의 마지막 발화 ID가 최종 회의록에 없으면 다른 회의의 결과로 보고 무시)
+    """
+    try:
+        state = await storage.get_storage_client().aget_json(rolling_state_key(file_id))
+    except storage.ObjectNotFound:
+        return None
+    except Exception as e:
+        print(f"⚠️ 롤링 요약 결과를 읽지 못했습니다 -> 전체 분석으로 진행: {e}")
+        return None
+
+    finalized_until = state.get('finalized_until')
+    if not state.get('topics') or finalized_until is None:
+        return None
+    if transcript_index.get_index(meeting_log_data).index_of(finalized_until) is None:
+        print(f"⚠️ 롤링 요약의 확정 구간(ID {finalized_until})이 회의록에 없습니다 -> 전체 분석으로 진행")
+        return None
+    return state
+
+
+async def analyze_structure(file_id, use_rolling=True, checkpoint=None):
+    print(f"\n{'='*80}")
+    print(f"🏗️ [Step 1] 구조 분석 시작: {file_id}")
+    print(f"{'='*80}\n")
+    
+    # S3 경로 설정
+    input_s3_key = f"meeting_logs/{file_id}.json"
+    
+    try:
+        # 1. S3에서 JSON 파일 읽기
+        print(f"S3에서 파일 읽는 중: s3://{BUCKET_NAME}/{input_s3_key}")
+        meeting_log_data = await storage.get_storage_client().aget_json(input_s3_key)
+        utterance_count = len(meeting_log_data.get('utterances', []))
+
+        # 체크포인트에 같은 회의록으로 만든 구조 분석 결과가 있으면 재사용
+        if checkpoint is not None:
+            saved = await checkpoint.aload("structure", checkpoint.structure_key())
+            if saved and saved.get('utterance_count') == utterance_count:
+                meeting_log_data['skeleton'] = saved['skeleton']
+                print(f"  Step 1 완료 (체크포인트 재사용, 토픽 {len(saved['skeleton'].get('topics', []))}개)")
+                return meeting_log_data
+
+        # 2. 회의 중 롤링 요약으로 확정된 토픽이 있으면 그 이후 구간만 구조 분석
+        rolling = await load_rolling_state(file_id, meeting_log_data) if use_rolling else None
+        rolling_topics = []
+        after_id = None
+        if rolling:
+            rolling_topics = rolling['topics']
+            after_id = rolling['finalized_until']
+            print(f"♻️ 롤링 요약 결과 재사용: 확정 토픽 {len(rolling_topics)}개 (ID {after_id}까지) -> 이후 구간만 분석")
+
+        has_tail = transcript_index.get_index(meeting_log_data).conversation_lines(after_id=after_id)
+        parsed_json = await extract_structure(meeting_log_data, after_id) if has_tail else {}
         
         # Skeleton 저장 (메모리)
         if 'skeleton' not in meeting_log_data:
             meeting_log_data['skeleton'] = {}
             
-        meeting_log_data['skeleton']['main_topic'] = parsed_json.get('main_topic', '')
-        meeting_log_data['skeleton']['domain'] = parsed_json.get('domain', '')
-        meeting_log_data['skeleton']['topics'] = parsed_json.get('topics', [])
+        meeting_log_data['skeleton']['main_topic'] = (rolling or {}).get('main_topic') or parsed_json.get('main_topic', '')
+        meeting_log_data['skeleton']['domain'] = (rolling or {}).get('domain') or parsed_json.get('domain', '')
+        meeting_log_data['skeleton']['topics'] = rolling_topics + parsed_json.get('topics', [])
+        # 앞쪽 rolling_topics개 토픽은 이미 상세 분석까지 끝난 상태 (Step 2에서 건너뜀)
+        meeting_log_data['skeleton']['analyzed_topics'] = len(rolling_topics)
+
+        if checkpoint is not None:
+            await checkpoint.asave("structure", checkpoint.structure_key(),
+                                   {"utterance_count": utterance_count, "skeleton": meeting_log_data['skeleton']})
         
         print(f"  Step 1 완료 (메모리에 저장)")
         return meeting_log_data  # 데이터 반환
 
-    except s3_client.exceptions.NoSuchKey:
+    except storage.ObjectNotFound:
         print(f"오류: S3에서 '{input_s3_key}' 파일을 찾을 수 없습니다.")
         return None
-    except ClientError as e:
-        print(f"S3 오류 발생: {e}")
-        return None
     except Exception as e:
         print(f"구조 분석 중 오류 발생: {e}")
         traceback.print_exc()
@@ -207,7 +286,188 @@ def analyze_structure(file_id):
 # ==============================================================================
 # 4. 상세 분석 및 통합 함수 (Step 2)
 # ==============================================================================
-def analyze_details_and_consolidate(file_id, meeting_log_data):
+def topic_prompt_tokens(context, topic_item):
+    """캐시 없이 보낼 때의 토픽 프롬프트 추정 토큰 (모델 라우팅 기준)"""
+    type_instruction = prompts.TYPE_PROMPTS.get(topic_item.get('type', 'unknown'), prompts.DEFAULT_PROMPT)
+    fixed_prompt = build_topic_prompt(context, topic_item, type_instruction, "", use_cache=False)
+    _, fit = get_transcript_segment(context["transcript"], topic_item.get('start_id'), topic_item.get('end_id'),
+                                    prompt_builder.remaining_budget(fixed_prompt))
+    return prompt_builder.count_tokens(fixed_prompt) + (fit["tokens"] if fit else 0)
+
+
+async def prepare_step2_context(file_id, transcript, participants_info, cache_mode=None, topics=None):
+    """
+    모든 토픽에 공통인 Step 2 앞부분을 만들고, 설정에 따라 컨텍스트 캐시에 올립니다.
+    캐시는 모델별이므로 topics({순번: topic_item})를 먼저 라우팅해 가장 많은 토픽이 쓸 모델에 만들고,
+    그 모델로 갈 토픽이 STEP2_CACHE_MIN_TOPICS개 미만이면 만들지 않습니다.
+    캐시 생성이 불가능하면(작거나 실패) 캐시 없이 매 호출에 앞부분을 붙입니다.
+    cache_mode를 주지 않으면 STEP2_CONTEXT_CACHE를 따릅니다.
+    """
+    cache_mode = cache_mode or STEP2_CONTEXT_CACHE
+    prefix = prompts.STEP2_PREFIX_PROMPT.format(participants_info=participants_info)
+    context = {
+        "prefix": prefix,
+        "transcript": transcript,
+        "cache": None,
+        "cache_model": None,
+        "cache_topics": set(),      # 캐시 모델로 보낼 토픽 순번
+        "transcript_cached": False,
+        "stats": {"calls": 0, "hits": 0, "misses": 0, "fallbacks": 0, "cache_topics": 0, "routed_away": 0,
+                  "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0},
+    }
+
+    if cache_mode == "off":
+        return context
+
+    # 토픽별 모델을 미리 정해 캐시를 실제로 쓸 모델에만 만듦
+    planned = {i: model_router.route("topic", topic_prompt_tokens(context, topic_item))[0]
+               for i, topic_item in (topics or {}).items()}
+    counts = Counter(planned.values())
+    cache_model, cache_count = counts.most_common(1)[0] if counts else (MODEL_NAME, 0)
+    if cache_count < STEP2_CACHE_MIN_TOPICS:
+        routed = ", ".join(f"{m.split('/')[-1]} {n}개" for m, n in counts.items()) or "토픽 없음"
+        print(f"ℹ️ [Step 2] 같은 모델로 가는 토픽이 {STEP2_CACHE_MIN_TOPICS}개 미만이라 컨텍스트 캐시를 만들지 않습니다. ({routed})")
+        return context
+
+    contents = None
+    if cache_mode in ("transcript", "auto"):
+        contents = ["# 전체 대화\n" + transcript.text(label="user_id")]
+
+    context["cache"] = await llm_client.acreate_cache(
+        cache_model, prefix, contents, display_name=f"step2-{file_id}"[:128]
+    )
+    if context["cache"] is not None:
+        context["cache_model"] = cache_model
+        context["cache_topics"] = {i for i, model_name in planned.items() if model_name == cache_model}
+        print(f"🧊 [Step 2] 캐시 모델 {cache_model.split('/')[-1]}: 토픽 {len(context['cache_topics'])}/{len(planned)}개 사용 예정")
+    context["transcript_cached"] = context["cache"] is not None and contents is not None
+    return context
+
+
+def build_topic_prompt(context, topic_item, type_instruction, segment_text, use_cache, buffer_size=BUFFER_SIZE):
+    """토픽별 Step 2 프롬프트 (캐시를 쓰면 토픽별 뒷부분만, 아니면 공통 앞부분 + 뒷부분)"""
+    start_id = topic_item.get('start_id')
+    end_id = topic_item.get('end_id')
+
+    if use_cache and context["transcript_cached"]:
+        context_note = prompts.STEP2_CACHED_TRANSCRIPT_NOTE.format(buffer_size=buffer_size)
+        segment_text = f"(앞서 제공된 [전체 대화]의 ID {start_id}번 ~ {end_id}번 구간)"
+    else:
+        context_note = prompts.STEP2_SEGMENT_NOTE.format(buffer_size=buffer_size)
+
+    topic_prompt = prompts.STEP2_TOPIC_PROMPT.format(
+        sub_topic=topic_item.get('sub_topic', '제목 없음'),
+        start_id=start_id,
+        end_id=end_id,
+        context_note=context_note,
+        type_instruction=type_instruction,
+        segment_text=segment_text,
+    )
+    return topic_prompt if use_cache else context["prefix"] + topic_prompt
+
+
+async def analyze_topic(index, topic_item, total_topics, context):
+    """
+    토픽 하나의 상세 분석 (Step 2의 작업 단위, 여러 토픽이 동시에 실행됨)
+    topic_item에 분석 결과(또는 error)를 채워 반환합니다.
+    """
+    topic_item['sub_topic_id'] = str(index + 1)
+    sub_topic = topic_item.get('sub_topic', '제목 없음')
+    topic_type = topic_item.get('type', 'unknown')
+    start_id = topic_item.get('start_id')
+    end_id = topic_item.get('end_id')
+    
+    # 동시 실행 중 로그가 섞이지 않도록 한 줄로 출력
+    print(f"🔄 [Topic {index+1}/{total_topics}] 처리 중... (주제: {sub_topic}, 유형: {topic_type}, 구간: ID {start_id} ~ {end_id})")
+    
+    # prompts.py에서 템플릿 가져오기
+    type_instruction = prompts.TYPE_PROMPTS.get(topic_type, prompts.DEFAULT_PROMPT)
+
+    # 토큰 예산(TOPIC_PROMPT_BUDGET_TOKENS)에서 고정 부분을 뺀 만큼만 대화 구간 + 문맥으로 채움 (topic_prompt_tokens와 같은 계산)
+    fixed_prompt = build_topic_prompt(context, topic_item, type_instruction, "", use_cache=False)
+    segment_text, fit = get_transcript_segment(
+        context["transcript"], start_id, end_id, prompt_builder.remaining_budget(fixed_prompt)
+    )
+    
+    if not segment_text:
+        print(f"   -> [Topic {index+1}] 경고: 텍스트 추출 실패 (ID 확인 필요). Skip.")
+        topic_item['error'] = "Text extraction failed"
+        return topic_item
+    if fit["clipped"] or fit["omitted"]:
+        print(f"   -> [Topic {index+1}] 토큰 예산 초과로 구간 축약: 긴 발화 {fit['clipped']}개 자름, "
+              f"발화 {fit['omitted']}/{fit['core_lines']}개 생략")
+    buffer_size = max(fit["buffer_before"], fit["buffer_after"])
+    response_schema = schemas.topic_schema(topic_type)
+    label = f"Topic {index+1}"
+    stats = context["stats"]
+    # 짧은 구간은 flash, 긴 구간은 pro (캐시 없는 프롬프트 크기 기준)
+    # 캐시를 만들 때 캐시 모델로 계획된 토픽은 캐시 모델 우선 (캐시된 입력은 이미 비용을 치렀고 입력 가격의 1/4)
+    models = model_router.route("topic", prompt_builder.count_tokens(fixed_prompt) + fit["tokens"])
+    use_cache = context["cache"] is not None and index in context["cache_topics"]
+    if use_cache:
+        models = [context["cache_model"]] + [m for m in models if m != context["cache_model"]]
+        stats["cache_topics"] += 1
+    elif context["cache"] is not None:
+        stats["routed_away"] += 1
+
+    try:
+        print(f"   -> [Topic {index+1}] API 호출 중... (모델: {models[0].split('/')[-1]})")
+        started = time.perf_counter()
+        parsed_response = response = None
+
+        # 1) 컨텍스트 캐시 사용 (만료/삭제 등으로 실패하면 캐시 없이 다시 호출)
+        if use_cache:
+            try:
+                cached_prompt = build_topic_prompt(context, topic_item, type_instruction, segment_text, use_cache=True,
+                                                   buffer_size=fit["buffer"])
+                # 캐시 만료 등은 재시도해도 소용없으므로 짧게 시도하고 캐시 없는 호출로 넘어감
+                parsed_response, response = await generate_json_with_retry(
+                    cached_prompt, response_schema, label, "topic", models=[context["cache_model"]],
+                    cached_content=context["cache"], max_attempts=2, wait_min=1, wait_max=2
+                )
+            except json.JSONDecodeError:
+                # 캐시 문제가 아니라 응답 형식 문제이므로 캐시 없이 다시 부르지 않음
+                raise
+            except Exception as e:
+                print(f"   -> [Topic {index+1}] 캐시 호출 실패 -> 캐시 없이 재시도: {e}")
+                stats["fallbacks"] += 1
+
+        # 2) 캐시 없이 전체 프롬프트로 호출
+        if response is None:
+            step2_prompt = build_topic_prompt(context, topic_item, type_instruction, segment_text, use_cache=False,
+                                              buffer_size=buffer_size)
+            parsed_response, response = await generate_json_with_retry(step2_prompt, response_schema, label, "topic",
+                                                                       models=models)
+
+        usage = llm_client.usage_of(response)
+        stats["calls"] += 1
+        stats["hits" if usage["cached_tokens"] else "misses"] += 1
+        stats["prompt_tokens"] += usage["prompt_tokens"] or 0
+        stats["cached_tokens"] += usage["cached_tokens"]
+        stats["output_tokens"] += usage["output_tokens"] or 0
+        print(f"   -> [Topic {index+1}] 입력 토큰 {usage['prompt_tokens']} (캐시 {usage['cached_tokens']}), "
+              f"출력 토큰 {usage['output_tokens']}, {time.perf_counter() - started:.1f}s")
+        
+        topic_item.update(parsed_response)
+        print(f"   -> [Topic {index+1}] 분석 및 병합 완료")
+    except Exception as e:
+        print(f"   -> [Topic {index+1}] API 호출/파싱 오류: {e}")
+        topic_item['error'] = str(e)
+
+    return topic_item
+
+
+def log_cache_summary(file_id, stats):
+    """회의 단위 컨텍스트 캐시 적중/절감 로그"""
+    prompt_tokens = stats["prompt_tokens"] or 1
+    print(f"🧊 [Step 2] {file_id} 컨텍스트 캐시 적중 {stats['hits']}/{stats['calls']}회 "
+          f"(미적중 {stats['misses']}, 캐시 실패 후 재호출 {stats['fallbacks']}, 캐시 모델로 보낸 토픽 {stats['cache_topics']}, "
+          f"다른 모델로 라우팅되어 캐시 미사용 {stats['routed_away']}), "
+          f"캐시로 처리된 입력 토큰 {stats['cached_tokens']} / {stats['prompt_tokens']} "
+          f"({stats['cached_tokens'] / prompt_tokens:.0%}), 출력 토큰 {stats['output_tokens']}")
+
+
+async def analyze_details_and_consolidate(file_id, meeting_log_data, checkpoint=None):
     print(f"\n{'='*80}")
     print(f"🔍 [Step 2] 상세 분석 및 통합 시작: {file_id}")
     print(f"{'='*80}\n")
@@ -217,9 +477,9 @@ def analyze_details_and_consolidate(file_id, meeting_log_data):
     
     try:
         topics_list = meeting_log_data.get('skeleton', {}).get('topics', [])
-        all_utterances = meeting_log_data.get('utterances', [])
+        transcript = transcript_index.get_index(meeting_log_data)
         participants = meeting_log_data.get('participants', [])
-        final_topics = []
+        log_compaction(transcript, "user_id", "Step 2")
         
         # Participants 정보를 JSON 문자열로 변환
         participants_info = json.dumps(participants, ensure_ascii=False, indent=2)
@@ -229,115 +489,65 @@ def analyze_details_and_consolidate(file_id, meeting_log_data):
             return False
             
         total_topics = len(topics_list)
-        print(f"✅ 총 {total_topics}개의 토픽을 분석합니다. (Buffer: ±{BUFFER_SIZE}, 대기시간: {WAIT_SECONDS}초)\n")
-        
-        model = genai.GenerativeModel(MODEL_NAME)
+        # 회의 중 롤링 요약으로 이미 상세 분석된 앞쪽 토픽은 건너뜀
+        analyzed_topics = meeting_log_data['skeleton'].get('analyzed_topics', 0)
+        print(f"✅ 총 {total_topics}개의 토픽을 분석합니다. (Buffer: 최대 ±{BUFFER_SIZE}, 토큰 예산: {prompt_builder.TOPIC_PROMPT_BUDGET_TOKENS}, 동시 호출: {STEP2_CONCURRENCY}, "
+              f"롤링 요약으로 완료: {analyzed_topics}개)\n")
+        for i, topic_item in enumerate(topics_list[:analyzed_topics]):
+            topic_item['sub_topic_id'] = str(i + 1)
         
-        # --- 상세 분석 Loop ---
-        for index, topic_item in enumerate(topics_list):
-            topic_item['sub_topic_id'] = str(index + 1)
-            sub_topic = topic_item.get('sub_topic', '제목 없음')
-            topic_type = topic_item.get('type', 'unknown')
-            start_id = topic_item.get('start_id')
-            end_id = topic_item.get('end_id')
-            
-            print(f"🔄 [Topic {index+1}/{total_topics}] 처리 중...")
-            print(f"   - 주제: {sub_topic}")
-            print(f"   - 유형: {topic_type}")
-            print(f"   - 구간: ID {start_id} ~ {end_id}")
-            
-            segment_text = get_transcript_segment(all_utterances, start_id, end_id, buffer=BUFFER_SIZE)
-            
-            if not segment_text:
-                print("   -> 경고: 텍스트 추출 실패 (ID 확인 필요). Skip.")
-                topic_item['error'] = "Text extraction failed"
-                final_topics.append(topic_item)
-                continue
+        # 체크포인트에 상세 분석 결과가 있는 토픽은 건너뜀 (키는 분석 전 구간 정보로 계산)
+        pending = list(range(analyzed_topics, total_topics))
+        topic_keys = {}
+        if checkpoint is not None:
+            topic_keys = {i: checkpoint.topic_key(i, topics_list[i]) for i in pending}
+            saved_topics = await asyncio.gather(*(checkpoint.aload("topics", topic_keys[i]) for i in pending))
+            for i, saved in zip(list(pending), saved_topics):
+                if saved is not None:
+                    topics_list[i].update(saved)
+                    pending.remove(i)
+
+        # --- 상세 분석 (동시 실행, 호출 속도는 공용 RPM/TPM 제한기가 조절) ---
+        if pending:
+            step2_started = time.perf_counter()
+            semaphore = asyncio.Semaphore(STEP2_CONCURRENCY)
+            context = await prepare_step2_context(file_id, transcript, participants_info,
+                                                  topics={i: topics_list[i] for i in pending})
+
+            async def run_topic(index, topic_item):
+                async with semaphore:
+                    result = await analyze_topic(index, topic_item, total_topics, context)
+                # 끝난 토픽은 바로 저장 (중간에 프로세스가 죽어도 재실행 시 이어서 진행)
+                if index in topic_keys and not result.get('error'):
+                    await checkpoint.asave("topics", topic_keys[index], result)
+                return result
 
-            # prompts.py에서 템플릿 가져오기
-            type_instruction = prompts.TYPE_PROMPTS.get(topic_type, prompts.DEFAULT_PROMPT)
-            
-            step2_prompt = f"""
-# 페르소나
-당신은 회의록의 특정 세그먼트를 정밀 분석하는 전문가입니다.
-
-# 작업 개요
-* **분석 대상 주제**: '{sub_topic}'
-* **핵심 논의 구간**: ID {start_id}번 ~ {end_id}번 발화
-* **참고 문맥(Buffer)**: 핵심 구간의 앞뒤로 각각 {BUFFER_SIZE}개의 발화가 문맥 파악을 위해 추가되었습니다.
-
-# 참가자 정보
-다음은 회의 참가자 목록입니다. action_items의 assignee를 지정할 때 **반드시** 이 정보를 참고하세요.
-{participants_info}
-
-# 작업 지시
-제공된 [대화 내용]을 읽고, **핵심 논의 구간**을 중심으로 다음 내용을 추출하세요.
-
-1. **details (상세 내용)**: 아래 [작성 지침]에 정의된 구조대로 작성하세요.
-2. **segment_decisions (결정 사항)**: 이 구간에서 확정된 합의나 결정 사항이 있다면 명확한 문장으로 추출하세요. (없으면 빈 리스트)
-3. **segment_action_items (실행 항목)**: 구체적인 할 일(Task), 담당자(Assignee), 기한(Due Date)을 추출하세요.
-   - **중요:** assignee는 반드시 위 [참가자 정보]의 'name' 필드 값을 사용하세요. USER_ID를 사용하지 마세요.
-   - 대화에서 "제가 할게요" 같은 표현이 나오면, 해당 발화자의 USER_ID를 확인하고 [참가자 정보]에서 매칭되는 name을 찾아 사용하세요.
-   - 담당자가 불명확하거나 [참가자 정보]에서 찾을 수 없으면 '미정'으로 표기하세요.
-   - (없으면 빈 리스트)
-
-# 작성 지침 (JSON Schema & Guide)
-{type_instruction}
-
-# 필수 출력 형식 (JSON Only)
-반드시 아래 포맷으로 응답하세요. 마크다운(```json)이나 추가 설명은 제외하세요.
-{{
-  "short_summary": "이 주제에 대한 1~2문장 요약",
-  "details": {{ ...위 작성 지침의 구조... }},
-  "segment_decisions": [
-    "결정된 사항 1",
-    "결정된 사항 2"
-  ],
-  "segment_action_items": [
-    {{
-      "task": "구체적인 작업 내용",
-      "assignee": "담당자 이름 (또는 '미정')",
-      "due_date": "마감기한 (또는 '미정')"
-    }}
-  ]
-}}
-
-# 대화 내용
-{segment_text}
-"""
             try:
-                print("   -> API 호출 중...")
-                # Retry 적용된 함수 호출
-                response = generate_content_with_retry(model, step2_prompt)
-                
-                json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-                parsed_response = json.loads(json_string)
-                
-                topic_item.update(parsed_response)
-                print("   -> 분석 및 병합 완료")
-            except Exception as e:
-                print(f"   -> API 호출/파싱 오류: {e}")
-                topic_item['error'] = str(e)
-            
-            final_topics.append(topic_item)
-
-            if index < total_topics - 1:
-                print(f"   -> API 제한 준수를 위해 {WAIT_SECONDS}초 대기합니다...")
-                time.sleep(WAIT_SECONDS)
+                await asyncio.gather(*(run_topic(i, topics_list[i]) for i in pending))
+            finally:
+                await llm_client.adelete_cache(context["cache"])
+            print(f"⏱️ [Step 2] 토픽 {len(pending)}개 상세 분석 {time.perf_counter() - step2_started:.1f}s")
+            log_cache_summary(file_id, context["stats"])
+            model_router.log_summary()
+        final_topics = topics_list
         
         # --- 최종 통합 (Consolidation) ---
         print(f"\n✅ 분석된 토픽 {len(final_topics)}개를 바탕으로 최종 요약을 시작합니다.")
         
-        topics_json_str = json.dumps(final_topics, ensure_ascii=False, indent=2)
-        # prompts.py에서 템플릿 가져오기
-        final_prompt = prompts.CONSOLIDATION_PROMPT.format(topics_json=topics_json_str)
-        
-        print("🚀 Gemini API 호출 중... (Final Consolidation)")
-        # Retry 적용된 함수 호출
-        response = generate_content_with_retry(model, final_prompt)
-        
-        json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-        parsed_result = json.loads(json_string)
+        consolidation_key = checkpoint.consolidation_key(final_topics) if checkpoint is not None else None
+        parsed_result = await checkpoint.aload("consolidation", consolidation_key) if consolidation_key else None
+
+        if parsed_result is None:
+            topics_json_str = json.dumps(final_topics, ensure_ascii=False, indent=2)
+            # prompts.py에서 템플릿 가져오기
+            final_prompt = prompts.CONSOLIDATION_PROMPT.format(topics_json=topics_json_str)
+
+            print("🚀 Gemini API 호출 중... (Final Consolidation)")
+            # Retry 적용된 함수 호출
+            parsed_result, _ = await generate_json_with_retry(final_prompt, schemas.CONSOLIDATION_SCHEMA, "최종 통합",
+                                                              "consolidation")
+            if consolidation_key:
+                await checkpoint.asave("consolidation", consolidation_key, parsed_result)
         
         ordered_summary = {}
         ordered_summary['main_topic'] = meeting_log_data['skeleton'].get('main_topic', '')
@@ -356,31 +566,108 @@ def analyze_details_and_consolidate(file_id, meeting_log_data):
         
         # 최종 결과 저장 (S3)
         print(f"\nS3에 최종 파일 저장 중: s3://{BUCKET_NAME}/{final_s3_key}")
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=final_s3_key,
-            Body=json.dumps(final_output_data, ensure_ascii=False, indent=2),
-            ContentType='application/json'
-        )
+        await storage.get_storage_client().aput_json(final_s3_key, final_output_data, indent=2)
             
         print(f"🎉 [최종 완료] 회의록 생성이 끝났습니다!")
         print(f"💾 파일 저장 경로: s3://{BUCKET_NAME}/{final_s3_key}")
-        sys.exit(0)
-        #return True
+        return True
 
     except Exception as e:
         print(f"상세 분석 중 오류 발생: {e}")
         traceback.print_exc()
         return False
+    finally:
+        if checkpoint is not None:
+            checkpoint.log_summary()
+
+
+async def summarize_meeting(file_id, use_rolling=True, force_stages=()):
+    """회의 하나를 요약합니다. 성공하면 None, 실패하면 실패한 단계 이름을 반환합니다."""
+    # 단계별 체크포인트 (모델/프롬프트가 같으면 끝난 단계를 건너뜀)
+    checkpoint = stage_checkpoint.StageCheckpoint(file_id, MODEL_NAME, force_stages,
+                                                  compaction=transcript_index.TRANSCRIPT_COMPACTION,
+                                                  structure_mode=local_segmentation.STRUCTURE_MODE,
+                                                  rolling=use_rolling,
+                                                  **model_router.settings(),
+                                                  **prompt_builder.settings())
+
+    # Step 1: 구조 분석
+    meeting_data = await analyze_structure(file_id, use_rolling, checkpoint)
+
+    if meeting_data is None:
+        print(f"⛔ {file_id}: 구조 분석 실패로 인해 상세 분석을 건너뜁니다.")
+        return "structure"
+
+    # Step 2: 상세 분석 및 최종 저장
+    success = await analyze_details_and_consolidate(file_id, meeting_data, checkpoint)
+
+    if not success:
+        print(f"⛔ {file_id}: 상세 분석 실패")
+        return "details"
+    return None
+
+
+def log_batch_summary(results, elapsed):
+    """배치 전체 결과 요약 (실패한 회의는 단계와 함께 나열)"""
+    failed = {fid: r for fid, r in results.items() if not r['ok']}
+    print("\n" + "="*80)
+    print(f"📦 [Batch] 완료: 성공 {len(results) - len(failed)}/{len(results)}개, 실패 {len(failed)}개, 총 {elapsed:.1f}s")
+    for fid, r in failed.items():
+        print(f"   ❌ {fid}: {r['failed_stage']} 단계 실패 ({r['elapsed_sec']:.1f}s)")
+    print("="*80 + "\n")
+
+
+def batch_exit_code(results):
+    """0: 전부 성공, 1: 전부 실패(또는 대상 없음), 2: 일부 실패"""
+    succeeded = sum(1 for r in results.values() if r['ok'])
+    if results and succeeded == len(results):
+        return 0
+    return 1 if succeeded == 0 else 2
+
+
+async def main(target_file_ids, use_rolling=True, force_stages=(), concurrency=BATCH_CONCURRENCY):
+    """
+    여러 회의를 최대 concurrency개씩 동시에 요약합니다.
+    Gemini 호출은 모든 회의가 프로세스 전역 RPM/TPM 제한기(rate_limiter)를 공유하므로
+    동시 처리 수를 늘려도 할당량을 넘지 않고, 먼저 할당량을 받은 호출부터 진행됩니다.
+    반환: {file_id: {"ok", "failed_stage", "elapsed_sec"}}
+    """
+    batch_started = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = {}
+
+    async def run_meeting(file_id):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                failed_stage = await summarize_meeting(file_id, use_rolling, force_stages)
+            except Exception as e:
+                print(f"⛔ {file_id}: 처리 중 예외 발생: {e}")
+                traceback.print_exc()
+                failed_stage = "error"
+
+            results[file_id] = {
+                "ok": failed_stage is None,
+                "failed_stage": failed_stage,
+                "elapsed_sec": round(time.perf_counter() - started, 1),
+            }
+            print(f"📦 [Batch {len(results)}/{len(target_file_ids)}] {'✅' if failed_stage is None else '❌'} "
+                  f"{file_id} ({results[file_id]['elapsed_sec']:.1f}s)")
+
+    await asyncio.gather(*(run_meeting(fid) for fid in dict.fromkeys(target_file_ids)))
+
+    log_batch_summary(results, time.perf_counter() - batch_started)
+    model_router.log_summary()
+    llm_client.log_json_summary()
+    prompt_builder.log_summary()
+    await storage.aclose_storage_client()
+    return results
 
 
 if __name__ == "__main__":
-    # API 키 설정
+    # API 키 설정 (GEMINI_API_KEY 또는 GOOGLE_API_KEY)
     try:
-        api_key = "-"
-        if api_key is None:
-            raise ValueError("GEMINI_API_KEY 환경 변수가 설정되지 않았습니다.")
-        genai.configure(api_key=api_key)
+        llm_client.configure()
         print("Gemini API 키 설정 완료.")
     except Exception as e:
         print(f"API 키 설정 중 오류 발생: {e}")
@@ -388,28 +675,38 @@ if __name__ == "__main__":
 
     # Argument Parsing
     parser = argparse.ArgumentParser(description="S3 기반 Gemini API 회의록 요약 스크립트")
-    parser.add_argument("--file_ids", nargs='+', required=True, help="Target File IDs (space separated, e.g., 'room001_20231121_143000')")
+    parser.add_argument("--file_ids", nargs='+', default=[], help="Target File IDs (space separated, e.g., 'room001_20231121_143000')")
+    parser.add_argument("--file_list", help="처리할 File ID 목록 파일 (한 줄에 하나, 대량 재처리용)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="동시에 처리할 회의 수")
+    parser.add_argument("--report", help="회의별 처리 결과를 저장할 로컬 JSON 경로")
+    parser.add_argument("--ignore_rolling", action="store_true", help="회의 중 롤링 요약 결과를 무시하고 처음부터 전체 분석")
+    parser.add_argument("--force-stage", dest="force_stages", nargs='+', default=[],
+                        choices=list(stage_checkpoint.STAGES) + ["all"],
+                        help="체크포인트가 있어도 다시 계산할 단계 (structure, topics, consolidation, all)")
     args, _ = parser.parse_known_args()
     
-    target_file_ids = args.file_ids
+    target_file_ids = list(args.file_ids)
+    if args.file_list:
+        with open(args.file_list, encoding="utf-8") as f:
+            target_file_ids += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not target_file_ids:
+        parser.error("--file_ids 또는 --file_list 중 하나는 필요합니다.")
     
-    print(f"총 {len(target_file_ids)}개의 파일을 처리합니다: {target_file_ids}")
+    print(f"총 {len(target_file_ids)}개의 파일을 처리합니다 (동시 {args.concurrency}개): {target_file_ids}")
     print(f"입력 경로: s3://{BUCKET_NAME}/meeting_logs/[file_id].json")
     print(f"출력 경로: s3://{BUCKET_NAME}/meeting_logs/[file_id]_final.json\n")
     
-    for file_id in target_file_ids:
-        # Step 1: 구조 분석
-        meeting_data = analyze_structure(file_id)
-        
-        if meeting_data is None:
-            print(f"⛔ {file_id}: 구조 분석 실패로 인해 상세 분석을 건너뜁니다.")
-            continue
-            
-        # Step 2: 상세 분석 및 최종 저장
-        success = analyze_details_and_consolidate(file_id, meeting_data)
-        
-        if not success:
-            print(f"⛔ {file_id}: 상세 분석 실패")
-        
-        print("\n" + "="*80 + "\n")
-
+    results = {}
+    try:
+        results = asyncio.run(main(target_file_ids, use_rolling=not args.ignore_rolling,
+                                   force_stages=args.force_stages, concurrency=args.concurrency))
+    finally:
+        storage.metrics.log_summary()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📦 [Batch] 결과 보고서 저장: {args.report}")
+
+    # 종료 코드: 0 전부 성공, 1 전부 실패, 2 일부 실패 (배치 CLI/크론 재처리 스크립트용, 세션 상태는 summarize_worker가 처리)
+    sys.exit(batch_exit_code(results))
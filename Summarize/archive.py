@@ -0,0 +1,362 @@
+#%%
+# 회의록 컬럼형(Parquet) 아카이브: 회의 간 분석용 내보내기 + 조회 헬퍼
+###############################################################################################################################################################################
+
+import os
+import json
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow는 아카이브 기능에서만 필요한 선택 의존성
+    pa = None
+
+import storage
+
+# Configuration
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "analytics")
+PARTITION_COLS = ["date", "room"]
+
+# ==============================================================================
+# 1. 테이블 스키마 (타입이 지정된 컬럼)
+# ==============================================================================
+if pa is not None:
+    SCHEMAS = {
+        "utterances": pa.schema([
+            ("meeting_id", pa.string()),
+            ("date", pa.string()),
+            ("room", pa.string()),
+            ("utterance_id", pa.int32()),
+            ("user_id", pa.string()),
+            ("speaker_name", pa.string()),
+            ("start_time", pa.timestamp("ms")),
+            ("duration_sec", pa.float32()),
+            ("char_count", pa.int32()),
+            ("content", pa.string()),
+        ]),
+        "meetings": pa.schema([
+            ("meeting_id", pa.string()),
+            ("date", pa.string()),
+            ("room", pa.string()),
+            ("start_time", pa.timestamp("ms")),
+            ("participant_num", pa.int16()),
+            ("speaker_num", pa.int16()),
+            ("utterance_count", pa.int32()),
+            ("main_topic", pa.string()),
+            ("domain", pa.string()),
+            ("topic_count", pa.int16()),
+            ("decision_count", pa.int16()),
+            ("action_item_count", pa.int16()),
+            ("vote_count", pa.int16()),
+        ]),
+        "decisions": pa.schema([
+            ("meeting_id", pa.string()),
+            ("date", pa.string()),
+            ("room", pa.string()),
+            ("kind", pa.string()),            # decision | action_item | vote
+            ("content", pa.string()),
+            ("assignee", pa.string()),
+            ("due_date", pa.string()),
+            ("related_sub_topic_id", pa.string()),
+        ]),
+    }
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet 아카이브 기능을 사용하려면 pyarrow 패키지가 필요합니다. (pip install pyarrow)")
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+# ==============================================================================
+# 2. 회의록 JSON -> 행(row) 변환
+# ==============================================================================
+def meeting_to_rows(file_id, meeting_log_data, final_data=None):
+    """
+    TranscriptLogger 출력(meeting_logs)과 S3_Summarization 결과(Summarize/*_final)를
+    테이블별 행 목록으로 변환합니다.
+    """
+    metadata = meeting_log_data.get('metadata', {})
+    participants = meeting_log_data.get('participants', [])
+    utterances = meeting_log_data.get('utterances', [])
+
+    start_time = _parse_time(metadata.get('date'))
+    date = start_time.strftime("%Y-%m-%d") if start_time else "unknown"
+    room = metadata.get('roomname') or file_id.rsplit('_', 2)[0]
+    base = {"meeting_id": file_id, "date": date, "room": room}
+
+    speaker_map = {p['USER_ID']: p.get('name', p['USER_ID']) for p in participants}
+
+    # 발화 시간: 다음 발화 시작까지의 간격으로 근사 (마지막 발화는 0)
+    times = [_parse_time(u.get('start_time')) for u in utterances]
+    utterance_rows = []
+    for i, u in enumerate(utterances):
+        duration = 0.0
+        if i + 1 < len(times) and times[i] and times[i + 1]:
+            duration = max(0.0, (times[i + 1] - times[i]).total_seconds())
+        content = u.get('content') or ""
+        utterance_rows.append({
+            **base,
+            "utterance_id": int(u.get('id', 0)),
+            "user_id": u.get('USER_ID'),
+            "speaker_name": speaker_map.get(u.get('USER_ID'), u.get('USER_ID')),
+            "start_time": times[i],
+            "duration_sec": duration,
+            "char_count": len(content),
+            "content": content,
+        })
+
+    summary = (final_data or {}).get('final_summary', {})
+    topics = summary.get('topics', [])
+    decision_rows = []
+    for d in summary.get('decisions', []):
+        decision_rows.append({**base, "kind": "decision", "content": d.get('content'),
+                              "related_sub_topic_id": str(d.get('related_sub_topic_id', ''))})
+    for a in summary.get('action_items', []):
+        decision_rows.append({**base, "kind": "action_item", "content": a.get('task'),
+                              "assignee": a.get('assignee'), "due_date": a.get('due_date'),
+                              "related_sub_topic_id": str(a.get('related_sub_topic_id', ''))})
+    for t in topics:
+        for v in (t.get('details') or {}).get('voting_results', []) or []:
+            decision_rows.append({**base, "kind": "vote", "content": v.get('item'),
+                                  "related_sub_topic_id": str(t.get('sub_topic_id', ''))})
+
+    meeting_row = {
+        **base,
+        "start_time": start_time,
+        "participant_num": metadata.get('participant_num', len(participants)),
+        "speaker_num": metadata.get('speaker_num', len({u.get('USER_ID') for u in utterances})),
+        "utterance_count": len(utterances),
+        "main_topic": summary.get('main_topic'),
+        "domain": summary.get('domain'),
+        "topic_count": len(topics),
+        "decision_count": sum(1 for r in decision_rows if r["kind"] == "decision"),
+        "action_item_count": sum(1 for r in decision_rows if r["kind"] == "action_item"),
+        "vote_count": sum(1 for r in decision_rows if r["kind"] == "vote"),
+    }
+
+    return {"utterances": utterance_rows, "meetings": [meeting_row], "decisions": decision_rows}
+
+
+def write_archive(rows_by_table, output_dir=ARCHIVE_DIR):
+    """
+    테이블별 행을 date/room 기준 Hive 파티션 Parquet 데이터셋으로 기록합니다.
+    같은 회의를 다시 내보내면 해당 회의 파일만 덮어씁니다.
+    """
+    _require_pyarrow()
+    for table_name, rows in rows_by_table.items():
+        if not rows:
+            continue
+        table = pa.Table.from_pylist(rows, schema=SCHEMAS[table_name])
+        pq.write_to_dataset(
+            table,
+            root_path=os.path.join(output_dir, table_name),
+            partition_cols=PARTITION_COLS,
+            basename_template=f"{rows[0]['meeting_id']}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+
+# ==============================================================================
+# 3. 입력 소스 (저장소 백엔드 또는 로컬 디렉터리)
+# ==============================================================================
+def _source(local_dir=None):
+    """입력 저장소: local_dir가 있으면 해당 디렉터리, 없으면 STORAGE_BACKEND 설정"""
+    return storage.LocalBackend(local_dir) if local_dir else storage.get_storage_client()
+
+
+def load_meeting(file_id, local_dir=None):
+    """(meeting_log_data, final_data) 반환. 요약 결과가 없으면 final_data는 None"""
+    source = _source(local_dir)
+
+    def read(key):
+        try:
+            return source.get_json(key)
+        except storage.ObjectNotFound:
+            return None
+
+    return read(f"meeting_logs/{file_id}.json"), read(f"Summarize/{file_id}_final.json")
+
+
+def list_meeting_ids(local_dir=None):
+    """meeting_logs/ 아래의 최종 회의록 ID 목록 (세그먼트/매니페스트 제외)"""
+    keys = _source(local_dir).list_keys("meeting_logs/", delimiter="/")
+    return sorted(key.split('/', 1)[1][:-5] for key in keys if key.endswith(".json"))
+
+
+def export_meetings(file_ids, output_dir=ARCHIVE_DIR, local_dir=None):
+    """회의 목록을 Parquet 아카이브로 내보내고 (성공, 실패) 개수를 반환합니다."""
+    _require_pyarrow()
+    ok, failed = 0, 0
+    for file_id in file_ids:
+        try:
+            meeting_log_data, final_data = load_meeting(file_id, local_dir)
+            if meeting_log_data is None:
+                print(f"⚠️ {file_id}: 회의록을 찾을 수 없어 건너뜁니다.")
+                failed += 1
+                continue
+            write_archive(meeting_to_rows(file_id, meeting_log_data, final_data), output_dir)
+            print(f"✅ {file_id}: 내보내기 완료 (요약 {'포함' if final_data else '없음'})")
+            ok += 1
+        except Exception as e:
+            print(f"❌ {file_id}: 내보내기 실패: {e}")
+            failed += 1
+    return ok, failed
+
+
+# ==============================================================================
+# 4. 조회 헬퍼
+# ==============================================================================
+def open_table(table_name, output_dir=ARCHIVE_DIR):
+    _require_pyarrow()
+    return ds.dataset(os.path.join(output_dir, table_name), format="parquet", partitioning="hive")
+
+
+def _filter(room=None, date_from=None, date_to=None):
+    expr = None
+    for cond in (
+        (ds.field("room") == room) if room else None,
+        (ds.field("date") >= date_from) if date_from else None,
+        (ds.field("date") <= date_to) if date_to else None,
+    ):
+        if cond is not None:
+            expr = cond if expr is None else expr & cond
+    return expr
+
+
+def speaker_talk_time(output_dir=ARCHIVE_DIR, room=None, date_from=None, date_to=None):
+    """화자별 누적 발화 시간(초), 발화 수, 글자 수 (발화 시간 내림차순)"""
+    table = open_table("utterances", output_dir).to_table(
+        columns=["speaker_name", "duration_sec", "char_count"],
+        filter=_filter(room, date_from, date_to),
+    )
+    result = table.group_by("speaker_name").aggregate([
+        ("duration_sec", "sum"), ("duration_sec", "count"), ("char_count", "sum"),
+    ])
+    return result.sort_by([("duration_sec_sum", "descending")]).to_pylist()
+
+
+def utterance_counts(output_dir=ARCHIVE_DIR, room=None, date_from=None, date_to=None):
+    """회의별 발화 수"""
+    table = open_table("meetings", output_dir).to_table(
+        columns=["meeting_id", "room", "date", "utterance_count"],
+        filter=_filter(room, date_from, date_to),
+    )
+    return table.sort_by([("date", "ascending")]).to_pylist()
+
+
+def decision_frequency(output_dir=ARCHIVE_DIR, kind="vote", room=None, date_from=None, date_to=None):
+    """방/날짜별 결정 사항(decision | action_item | vote) 건수"""
+    expr = ds.field("kind") == kind
+    extra = _filter(room, date_from, date_to)
+    table = open_table("decisions", output_dir).to_table(
+        columns=["room", "date"], filter=expr if extra is None else expr & extra,
+    )
+    return table.group_by(["room", "date"]).aggregate([("room", "count")]).to_pylist()
+
+
+# ==============================================================================
+# 5. 벤치마크: 1,000개 회의 스캔 (Parquet vs JSON)
+# ==============================================================================
+def run_benchmark(num_meetings=1000, utterances_per_meeting=300):
+    _require_pyarrow()
+    from compression import make_sample_meeting
+
+    work_dir = tempfile.mkdtemp(prefix="archive_bench_")
+    json_dir = os.path.join(work_dir, "meeting_logs")
+    parquet_dir = os.path.join(work_dir, "analytics")
+    os.makedirs(json_dir)
+
+    try:
+        print(f"가상 회의 {num_meetings}개 생성 중 (회의당 발화 {utterances_per_meeting}개)...")
+        for n in range(num_meetings):
+            data = make_sample_meeting(utterances_per_meeting, seed=n)
+            data["metadata"]["roomname"] = f"room{n % 20:02d}"
+            data["metadata"]["date"] = f"2025-{n % 12 + 1:02d}-{n % 28 + 1:02d}T14:00:00"
+            file_id = f"room{n % 20:02d}_{n:05d}"
+            with open(os.path.join(json_dir, f"{file_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            write_archive(meeting_to_rows(file_id, data), parquet_dir)
+
+        # JSON: 모든 파일을 열어 화자별 발화 수 집계
+        t0 = time.perf_counter()
+        counts = {}
+        for name in os.listdir(json_dir):
+            with open(os.path.join(json_dir, name), encoding="utf-8") as f:
+                data = json.load(f)
+            names = {p['USER_ID']: p['name'] for p in data['participants']}
+            for u in data['utterances']:
+                speaker = names.get(u['USER_ID'], u['USER_ID'])
+                counts[speaker] = counts.get(speaker, 0) + 1
+        json_sec = time.perf_counter() - t0
+
+        # Parquet: 필요한 컬럼만 스캔
+        t0 = time.perf_counter()
+        table = open_table("utterances", parquet_dir).to_table(columns=["speaker_name"])
+        table.group_by("speaker_name").aggregate([("speaker_name", "count")])
+        parquet_sec = time.perf_counter() - t0
+
+        def dir_size(path):
+            return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(path) for f in fs)
+
+        print(f"{'format':<10}{'scan(s)':>10}{'size(MB)':>10}")
+        print(f"{'json':<10}{json_sec:>10.2f}{dir_size(json_dir) / 1e6:>10.1f}")
+        print(f"{'parquet':<10}{parquet_sec:>10.2f}{dir_size(parquet_dir) / 1e6:>10.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="회의록 Parquet 아카이브 내보내기/조회/벤치마크")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="회의록을 Parquet 아카이브로 내보내기")
+    p_export.add_argument("--file_ids", nargs='*', help="대상 File ID 목록 (생략 시 meeting_logs/ 전체)")
+    p_export.add_argument("--local_dir", help="S3 대신 읽을 로컬 디렉터리 (meeting_logs/, Summarize/ 포함)")
+    p_export.add_argument("--output", default=ARCHIVE_DIR, help="Parquet 아카이브 경로")
+
+    p_query = sub.add_parser("query", help="아카이브 조회")
+    p_query.add_argument("report", choices=["talk_time", "utterances", "votes", "decisions"])
+    p_query.add_argument("--output", default=ARCHIVE_DIR, help="Parquet 아카이브 경로")
+    p_query.add_argument("--room")
+    p_query.add_argument("--date_from", help="YYYY-MM-DD")
+    p_query.add_argument("--date_to", help="YYYY-MM-DD")
+
+    p_bench = sub.add_parser("benchmark", help="Parquet vs JSON 스캔 벤치마크")
+    p_bench.add_argument("--meetings", type=int, default=1000)
+    p_bench.add_argument("--utterances", type=int, default=300)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        file_ids = args.file_ids or list_meeting_ids(args.local_dir)
+        print(f"총 {len(file_ids)}개의 회의를 내보냅니다 -> {args.output}")
+        ok, failed = export_meetings(file_ids, args.output, args.local_dir)
+        print(f"완료: 성공 {ok}개, 실패 {failed}개")
+        exit(1 if failed else 0)
+    elif args.command == "query":
+        filters = dict(room=args.room, date_from=args.date_from, date_to=args.date_to)
+        if args.report == "talk_time":
+            rows = speaker_talk_time(args.output, **filters)
+        elif args.report == "utterances":
+            rows = utterance_counts(args.output, **filters)
+        else:
+            rows = decision_frequency(args.output, "vote" if args.report == "votes" else "decision", **filters)
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False, default=str))
+    else:
+        run_benchmark(args.meetings, args.utterances)
@@ -0,0 +1,87 @@
+#%%
+# S3_Summarization 단계별 체크포인트 (구조 분석 / 토픽별 상세 분석 / 최종 통합)
+###############################################################################################################################################################################
+
+import json
+import hashlib
+
+import prompts
+import storage
+
+# Configuration
+CHECKPOINT_FOLDER = "Summarize/checkpoints"
+STAGES = ("structure", "topics", "consolidation")
+# 결과에 영향을 주는 프롬프트 (하나라도 바뀌면 새 체크포인트 경로를 사용)
+SUMMARY_PROMPT_NAMES = (
+    "STRUCTURE_PROMPT", "WINDOW_STRUCTURE_PROMPT", "STRUCTURE_MERGE_PROMPT", "SEGMENT_LABEL_PROMPT",
+    "STEP2_PREFIX_PROMPT", "STEP2_TOPIC_PROMPT", "STEP2_SEGMENT_NOTE", "STEP2_CACHED_TRANSCRIPT_NOTE",
+    "TYPE_PROMPTS", "DEFAULT_PROMPT", "CONSOLIDATION_PROMPT",
+)
+
+
+def digest(obj, length: int = 12) -> str:
+    """JSON으로 직렬화 가능한 값의 짧은 sha256 해시"""
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:length]
+
+
+def prompt_hash(model_name: str, **settings) -> str:
+    """모델 이름 + 요약 프롬프트 + 결과에 영향을 주는 설정(BUFFER_SIZE 등)의 해시"""
+    return digest({
+        "model": model_name,
+        "prompts": {name: getattr(prompts, name, None) for name in SUMMARY_PROMPT_NAMES},
+        "settings": settings,
+    })
+
+
+class StageCheckpoint:
+    """
+    회의 하나의 단계별 결과를 저장소에 남겨, 재실행 시 끝난 단계를 건너뛰게 하는 체크포인트
+    - 경로: Summarize/checkpoints/{file_id}/{모델+프롬프트 해시}/
+      structure.json, topics/{순번}_{구간 해시}.json, consolidation_{토픽 결과 해시}.json
+    - force_stages에 있는 단계는 읽지 않고 다시 계산해 덮어씀 ("all"이면 전체)
+    - 저장/읽기 실패는 경고만 하고 계산을 계속함 (체크포인트는 재실행 최적화일 뿐)
+    """
+    def __init__(self, file_id: str, model_name: str, force_stages=(), **settings):
+        self.file_id = file_id
+        self.prefix = f"{CHECKPOINT_FOLDER}/{file_id}/{prompt_hash(model_name, **settings)}"
+        self.force_stages = set(STAGES) if "all" in force_stages else set(force_stages)
+        self.stats = {"hits": 0, "saved": 0}
+
+    def structure_key(self) -> str:
+        return f"{self.prefix}/structure.json"
+
+    def topic_key(self, index: int, topic_item: dict) -> str:
+        """토픽 순번 + 구간/유형/제목 해시 (구조 분석 결과가 바뀌면 다른 키가 됨)"""
+        boundary = {k: topic_item.get(k) for k in ("sub_topic", "type", "start_id", "end_id")}
+        return f"{self.prefix}/topics/{index + 1:03d}_{digest(boundary, 8)}.json"
+
+    def consolidation_key(self, topics) -> str:
+        """통합 입력(토픽 상세 분석 결과)이 바뀌면 다시 계산되도록 입력 해시를 키에 포함"""
+        return f"{self.prefix}/consolidation_{digest(topics, 8)}.json"
+
+    async def aload(self, stage: str, key: str):
+        if stage in self.force_stages:
+            return None
+        try:
+            data = await storage.get_storage_client().aget_json(key)
+        except storage.ObjectNotFound:
+            return None
+        except Exception as e:
+            print(f"⚠️ [Checkpoint] 읽기 실패 -> 다시 계산: {key} ({e})")
+            return None
+        self.stats["hits"] += 1
+        print(f"💾 [Checkpoint] {stage} 재사용: {key}")
+        return data
+
+    async def asave(self, stage: str, key: str, data):
+        try:
+            await storage.get_storage_client().aput_json(key, data)
+            self.stats["saved"] += 1
+        except Exception as e:
+            print(f"⚠️ [Checkpoint] 저장 실패 ({stage}): {key} ({e})")
+
+    def log_summary(self):
+        forced = f", 강제 재계산: {', '.join(sorted(self.force_stages))}" if self.force_stages else ""
+        print(f"💾 [Checkpoint] {self.file_id} 재사용 {self.stats['hits']}개, 저장 {self.stats['saved']}개 "
+              f"({self.prefix}{forced})")
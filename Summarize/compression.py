@@ -0,0 +1,187 @@
+#%%
+# 저장소 객체 압축/해제 유틸 (STT, Summarize 공용)
+###############################################################################################################################################################################
+
+import os
+import io
+import gzip
+import json
+import time
+import random
+import argparse
+
+try:
+    import zstandard
+except ImportError:  # zstd는 선택 의존성
+    zstandard = None
+
+# Configuration
+# none | gzip | zstd  (zstd는 zstandard 패키지가 설치된 경우에만 사용)
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "none").lower()
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def resolve_encoding(encoding=None):
+    """
+    사용할 Content-Encoding 값을 결정합니다. (압축하지 않으면 None)
+    zstd가 요청됐지만 zstandard가 없으면 gzip으로 대체합니다.
+    """
+    encoding = (encoding or STORAGE_COMPRESSION or "none").lower()
+    if encoding in ("", "none", "identity"):
+        return None
+    if encoding == "zstd" and zstandard is None:
+        print("⚠️ zstandard 패키지가 없어 gzip으로 대체합니다.")
+        return "gzip"
+    if encoding not in ("gzip", "zstd"):
+        raise ValueError(f"지원하지 않는 압축 방식: {encoding}")
+    return encoding
+
+
+def compress(data: bytes, encoding=None):
+    """
+    바이트 데이터를 압축하고 (본문, Content-Encoding) 튜플을 반환합니다.
+    """
+    encoding = resolve_encoding(encoding)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), encoding
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), encoding
+    return data, None
+
+
+def decompress(body: bytes, content_encoding=None) -> bytes:
+    """
+    Content-Encoding 헤더(없으면 매직 바이트)를 보고 투명하게 압축을 해제합니다.
+    """
+    encoding = (content_encoding or "").lower()
+    if encoding == "gzip" or (not encoding and body[:2] == GZIP_MAGIC):
+        return gzip.decompress(body)
+    if encoding == "zstd" or (not encoding and body[:4] == ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstd로 압축된 객체를 읽으려면 zstandard 패키지가 필요합니다.")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return body
+
+
+def open_writer(fileobj, encoding=None):
+    """
+    fileobj 위에 스트리밍 압축 writer를 씌웁니다. (writer, Content-Encoding) 반환.
+    writer.close()는 원본 fileobj를 닫지 않습니다.
+    """
+    encoding = resolve_encoding(encoding)
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=GZIP_LEVEL, mtime=0), encoding
+    if encoding == "zstd":
+        writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(fileobj, closefd=False)
+        return writer, encoding
+    return _NonClosingWriter(fileobj), None
+
+
+class _NonClosingWriter(io.RawIOBase):
+    """압축하지 않을 때 사용하는 pass-through writer (close 시 원본 유지)"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.fileobj.write(b)
+
+
+def encode_json(data, encoding=None, indent=None):
+    """
+    JSON 직렬화 + 압축. (본문 바이트, Content-Encoding) 반환.
+    압축할 때는 들여쓰기 없이 컴팩트하게 직렬화합니다.
+    """
+    encoding = resolve_encoding(encoding)
+    if encoding:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=indent)
+    return compress(text.encode("utf-8"), encoding)
+
+
+def decode_json(body: bytes, content_encoding=None):
+    """압축 해제 후 JSON 파싱"""
+    return json.loads(decompress(body, content_encoding).decode("utf-8"))
+
+
+# ==============================================================================
+# 벤치마크: 한국어 회의록 기준 크기/시간 비교
+# ==============================================================================
+SAMPLE_SENTENCES = [
+    "그럼 다음 안건으로 넘어가서 예산 배분 문제를 논의해 보겠습니다.",
+    "네, 지난주에 말씀드린 일정은 개발팀과 다시 조율해 보겠습니다.",
+    "이 부분은 고객 피드백을 보고 우선순위를 다시 정하는 게 좋을 것 같아요.",
+    "음 저는 A안이 더 현실적이라고 생각합니다.",
+    "서버 비용이 지난달 대비 이십 퍼센트 정도 늘었습니다.",
+    "혹시 마감 기한을 다음 주 금요일로 미룰 수 있을까요?",
+    "네 알겠습니다.",
+    "그 건은 제가 담당해서 수요일까지 정리해 오겠습니다.",
+]
+
+
+def make_sample_meeting(num_utterances=3000, num_speakers=6, seed=0):
+    """벤치마크용 가상 한국어 회의록 생성"""
+    rng = random.Random(seed)
+    participants = [
+        {"USER_ID": f"user{i:02d}", "name": f"참가자{i}", "age": "unknown",
+         "occupation": "unknown", "role": "unknown", "sex": "unknown"}
+        for i in range(num_speakers)
+    ]
+    utterances = [
+        {
+            "id": i + 1,
+            "start_time": f"2025-11-21T14:{(i // 60) % 60:02d}:{i % 60:02d}",
+            "USER_ID": rng.choice(participants)["USER_ID"],
+            "content": " ".join(rng.choice(SAMPLE_SENTENCES) for _ in range(rng.randint(1, 3))),
+        }
+        for i in range(num_utterances)
+    ]
+    return {
+        "metadata": {"roomname": "bench", "date": "2025-11-21T14:00:00",
+                     "participant_num": num_speakers, "speaker_num": num_speakers},
+        "participants": participants,
+        "utterances": utterances,
+    }
+
+
+def run_benchmark(num_utterances=3000, repeat=5):
+    data = make_sample_meeting(num_utterances)
+    baseline = json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+
+    cases = [("pretty(indent=4)", None, 4), ("compact", None, None), ("gzip", "gzip", None)]
+    if zstandard is not None:
+        cases.append(("zstd", "zstd", None))
+
+    print(f"발화 {num_utterances}개, 기준 크기 {len(baseline) / 1024:.1f} KB (indent=4)")
+    print(f"{'format':<18}{'size(KB)':>10}{'ratio':>8}{'encode(ms)':>12}{'decode(ms)':>12}")
+    for label, encoding, indent in cases:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            if encoding:
+                body, content_encoding = encode_json(data, encoding)
+            else:
+                body, content_encoding = json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8"), None
+        encode_ms = (time.perf_counter() - t0) / repeat * 1000
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            decode_json(body, content_encoding)
+        decode_ms = (time.perf_counter() - t0) / repeat * 1000
+
+        print(f"{label:<18}{len(body) / 1024:>10.1f}{len(body) / len(baseline):>8.2f}{encode_ms:>12.1f}{decode_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="회의록 JSON 압축 포맷 크기/시간 벤치마크")
+    parser.add_argument("--utterances", type=int, default=3000, help="가상 회의록 발화 수")
+    parser.add_argument("--repeat", type=int, default=5, help="측정 반복 횟수")
+    args = parser.parse_args()
+
+    run_benchmark(args.utterances, args.repeat)
@@ -0,0 +1,225 @@
+#%%
+# 회의록 요약 작업 큐 (SQLite, STT 에이전트 -> summarize_worker 공용)
+###############################################################################################################################################################################
+
+import os
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+
+# Configuration
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "summarize_jobs.db"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))        # 작업당 최대 시도 횟수 (넘으면 failed)
+JOB_LEASE_SEC = float(os.getenv("JOB_LEASE_SEC", "600"))          # 워커가 작업을 점유하는 시간 (하트비트로 연장, 만료되면 다른 워커가 가져감)
+JOB_RETRY_BASE_SEC = float(os.getenv("JOB_RETRY_BASE_SEC", "60")) # 실패 후 재시도 대기 (시도마다 2배)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id       TEXT NOT NULL UNIQUE,
+    room_name     TEXT,
+    status        TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    next_run_at   REAL NOT NULL,
+    locked_by     TEXT,
+    locked_until  REAL,
+    last_error    TEXT,
+    hangup_at     REAL,                             -- 전원 퇴장 시각 (epoch, 퇴장 -> COMPLETED 시간 측정용)
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, next_run_at);
+"""
+
+
+class JobQueue:
+    """
+    SQLite 파일 하나로 여러 프로세스(STT 에이전트, 요약 워커 여러 개)가 공유하는 내구성 있는 작업 큐
+    - enqueue: 같은 file_id는 한 번만 등록 (이미 끝났거나 실패한 작업은 다시 대기열로)
+    - claim: BEGIN IMMEDIATE 트랜잭션으로 한 작업을 한 워커에게만 배정 (점유 기한 = lease)
+    - 워커가 죽어 점유 기한이 지나면 다른 워커가 다시 가져감 (시도 횟수를 다 쓴 작업은 failed)
+    - complete/fail: 지금 점유 중인 워커의 기록만 반영 (점유를 잃은 워커가 새 워커의 상태를 덮어쓰지 않음)
+    - fail: 시도 횟수가 남았으면 지수 백오프 후 재시도, 아니면 failed
+    """
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """스레드마다 연결 하나 (asyncio.to_thread에서 호출해도 안전)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, file_id: str, room_name: str | None = None, hangup_at: float | None = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """INSERT INTO jobs (file_id, room_name, max_attempts, next_run_at, hangup_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(file_id) DO UPDATE SET
+                       status = CASE WHEN jobs.status = 'running' THEN jobs.status ELSE 'queued' END,
+                       attempts = CASE WHEN jobs.status = 'running' THEN jobs.attempts ELSE 0 END,
+                       room_name = excluded.room_name,
+                       max_attempts = excluded.max_attempts,
+                       next_run_at = excluded.next_run_at,
+                       hangup_at = COALESCE(excluded.hangup_at, jobs.hangup_at),
+                       last_error = NULL,
+                       updated_at = excluded.updated_at""",
+                (file_id, room_name, max_attempts, now, hangup_at, now, now),
+            )
+            job_id = conn.execute("SELECT id FROM jobs WHERE file_id = ?", (file_id,)).fetchone()["id"]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"📥 [JobQueue] 요약 작업 등록: #{job_id} {file_id}")
+        return job_id
+
+    def claim(self, worker_id: str, lease_sec: float = JOB_LEASE_SEC):
+        """실행할 작업 하나를 점유해 dict로 반환 (없으면 None)"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 점유 기한이 지난 작업 중 시도 횟수를 다 쓴 작업(워커가 죽거나 OOM으로 fail()까지 못 간 경우)은 failed 처리
+            conn.execute(
+                """UPDATE jobs SET status = 'failed', locked_by = NULL, locked_until = NULL,
+                       last_error = 'lease expired', updated_at = ?
+                   WHERE status = 'running' AND locked_until < ? AND attempts >= max_attempts""",
+                (now, now),
+            )
+            row = conn.execute(
+                """SELECT * FROM jobs
+                   WHERE (status = 'queued' AND next_run_at <= ?)
+                      OR (status = 'running' AND locked_until < ?)
+                   ORDER BY next_run_at, id LIMIT 1""",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?,
+                       locked_until = ?, updated_at = ? WHERE id = ?""",
+                (worker_id, now + lease_sec, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_sec: float = JOB_LEASE_SEC) -> bool:
+        """점유 기한 연장 (다른 워커가 이미 가져갔으면 False)"""
+        cur = self._connect().execute(
+            "UPDATE jobs SET locked_until = ?, updated_at = ? WHERE id = ? AND locked_by = ? AND status = 'running'",
+            (time.time() + lease_sec, time.time(), job_id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """완료 기록. 점유를 잃었으면(다른 워커가 가져감) 아무것도 바꾸지 않고 False"""
+        cur = self._connect().execute(
+            """UPDATE jobs SET status = 'done', locked_by = NULL, locked_until = NULL, last_error = NULL, updated_at = ?
+               WHERE id = ? AND locked_by = ? AND status = 'running'""",
+            (time.time(), job_id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry_base_sec: float = JOB_RETRY_BASE_SEC):
+        """
+        실패 기록. 재시도가 예약되면 True, 최대 시도 횟수를 넘어 failed가 되면 False
+        점유를 잃었으면(다른 워커가 가져감) 아무것도 바꾸지 않고 None
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND locked_by = ? AND status = 'running'",
+            (job_id, worker_id),
+        ).fetchone()
+        if row is None:
+            return None
+        retry = row["attempts"] < row["max_attempts"]
+        if retry:
+            delay = retry_base_sec * (2 ** (row["attempts"] - 1))
+            cur = conn.execute(
+                """UPDATE jobs SET status = 'queued', next_run_at = ?, locked_by = NULL, locked_until = NULL,
+                       last_error = ?, updated_at = ? WHERE id = ? AND locked_by = ? AND status = 'running'""",
+                (time.time() + delay, error, time.time(), job_id, worker_id),
+            )
+        else:
+            cur = conn.execute(
+                """UPDATE jobs SET status = 'failed', locked_by = NULL, locked_until = NULL, last_error = ?, updated_at = ?
+                   WHERE id = ? AND locked_by = ? AND status = 'running'""",
+                (error, time.time(), job_id, worker_id),
+            )
+        return retry if cur.rowcount == 1 else None
+
+    def requeue_failed(self) -> int:
+        """failed 작업을 모두 다시 대기열로 (시도 횟수 초기화)"""
+        cur = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, next_run_at = ?, updated_at = ? WHERE status = 'failed'",
+            (time.time(), time.time()),
+        )
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def list_jobs(self, status: str | None = None, limit: int = 50):
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY id DESC LIMIT ?"
+        params = (status, limit) if status else (limit,)
+        return [dict(row) for row in self._connect().execute(query, params).fetchall()]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """프로세스 전역에서 하나의 JobQueue 인스턴스를 공유"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="요약 작업 큐 상태 확인/관리")
+    parser.add_argument("--enqueue", nargs='+', metavar="FILE_ID", help="요약 작업 직접 등록 (재처리 등)")
+    parser.add_argument("--room_name", help="--enqueue 작업의 방 이름 (세션 상태 갱신용)")
+    parser.add_argument("--status", choices=["queued", "running", "done", "failed"], help="이 상태의 작업만 나열")
+    parser.add_argument("--requeue_failed", action="store_true", help="실패한 작업을 모두 다시 대기열에 넣기")
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    for file_id in args.enqueue or []:
+        queue.enqueue(file_id, args.room_name)
+    if args.requeue_failed:
+        print(f"🔁 실패 작업 {queue.requeue_failed()}개를 다시 대기열에 넣었습니다.")
+
+    print(f"📋 [JobQueue] {queue.path}: {queue.counts()}")
+    for job in queue.list_jobs(args.status):
+        print(f"  #{job['id']:<5} {job['status']:<8} 시도 {job['attempts']}/{job['max_attempts']}  {job['file_id']}"
+              + (f"  ({job['last_error']})" if job['last_error'] else ""))
@@ -0,0 +1,359 @@
+#%%
+# 공용 비동기 Gemini 클라이언트 (S3_Summarization, S3_Recap, STT VoteManager 공용)
+###############################################################################################################################################################################
+
+import os
+import json
+import time
+import asyncio
+import datetime
+import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core import exceptions
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential, retry_if_exception_type
+from dotenv import load_dotenv
+
+import schemas
+import prompt_builder
+import rate_limiter
+
+load_dotenv()
+
+# Configuration
+DEFAULT_MODEL = "models/gemini-2.5-pro"
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "180"))    # 호출 1회(시도 1회)의 최대 대기 시간
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+CACHE_MIN_TOKENS = int(os.getenv("CACHE_MIN_TOKENS", "4096"))   # 명시적 컨텍스트 캐시 최소 크기 (이보다 작으면 캐시하지 않음)
+CACHE_TTL_SEC = int(os.getenv("CACHE_TTL_SEC", "1800"))         # 컨텍스트 캐시 유지 시간
+
+# 재시도 대상 오류 (기존 generate_content_with_retry와 동일 + 타임아웃)
+RETRYABLE_ERRORS = (
+    exceptions.ResourceExhausted,
+    exceptions.ServiceUnavailable,
+    exceptions.GoogleAPICallError,
+    exceptions.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+_configured = False
+_models = {}
+
+
+def configure(api_key: str | None = None):
+    """GEMINI_API_KEY (없으면 GOOGLE_API_KEY)로 Gemini API 키 설정"""
+    global _configured
+    api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY(또는 GOOGLE_API_KEY) 환경 변수가 설정되지 않았습니다.")
+    genai.configure(api_key=api_key)
+    _configured = True
+
+
+def get_model(model_name: str = DEFAULT_MODEL, generation_config: dict | None = None, cached_content=None):
+    """(모델, 생성 설정)별로 GenerativeModel 인스턴스를 재사용 (컨텍스트 캐시를 쓰면 캐시 기반 모델 생성)"""
+    if cached_content is not None:
+        return genai.GenerativeModel.from_cached_content(cached_content, generation_config=generation_config)
+
+    key = (model_name, json.dumps(generation_config, sort_keys=True))
+    if key not in _models:
+        _models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+    return _models[key]
+
+
+async def agenerate(prompt, model_name: str = DEFAULT_MODEL, generation_config: dict | None = None,
+                    timeout: float = LLM_TIMEOUT_SEC, max_attempts: int = LLM_MAX_ATTEMPTS,
+                    wait_min: float = 4, wait_max: float = 60, rate_limited: bool = True,
+                    cached_content=None):
+    """
+    Gemini 비동기 호출 (generate_content_async)
+    - 시도마다 timeout 초 제한, RETRYABLE_ERRORS는 지수 백오프로 최대 max_attempts회 재시도
+    - rate_limited이면 모델별 공용 RPM/TPM 제한기에서 할당량을 받은 뒤 호출하고, 429를 제한기에 알림
+    - 호출한 태스크가 취소되면 재시도하지 않고 CancelledError를 그대로 전파
+    - cached_content가 있으면 캐시된 앞부분(시스템 지시/대화) 뒤에 prompt를 이어 호출
+    """
+    if not _configured:
+        configure()
+
+    model = get_model(model_name, generation_config, cached_content)
+    limiter = rate_limiter.get_rate_limiter(model_name) if rate_limited else None
+    estimated = rate_limiter.estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        stop=stop_after_attempt(max_attempts),
+        wait=wait_exponential(multiplier=1, min=wait_min, max=wait_max),
+        reraise=True,
+    ):
+        with attempt:
+            if limiter:
+                await limiter.aacquire(estimated)
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(prompt, request_options={"timeout": timeout}),
+                    timeout=timeout,
+                )
+            except exceptions.ResourceExhausted:
+                if limiter:
+                    limiter.on_rate_limited()
+                raise
+            except asyncio.TimeoutError:
+                print(f"⏱️ [LLM] {model_name} 응답 시간 초과 ({timeout:g}s), 시도 {attempt.retry_state.attempt_number}/{max_attempts}")
+                raise
+
+    if limiter:
+        limiter.on_success()
+        usage = getattr(response, "usage_metadata", None)
+        limiter.record_usage(estimated, getattr(usage, "total_token_count", None))
+    return response
+
+
+def usage_of(response) -> dict:
+    """응답의 usage_metadata에서 입력/캐시/출력 토큰 수를 꺼냄 (없으면 None)"""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+    }
+
+
+async def acreate_cache(model_name: str, system_instruction: str, contents=None,
+                        ttl_sec: int = CACHE_TTL_SEC, display_name: str | None = None):
+    """
+    명시적 컨텍스트 캐시(CachedContent) 생성
+    - 캐시할 내용이 CACHE_MIN_TOKENS보다 작거나 생성에 실패하면 None (호출부는 캐시 없이 진행)
+    """
+    if not _configured:
+        configure()
+
+    estimated = rate_limiter.estimate_tokens(system_instruction + "".join(contents or []))
+    if estimated < CACHE_MIN_TOKENS:
+        print(f"ℹ️ [LLM] 캐시할 내용이 작아 컨텍스트 캐시를 사용하지 않습니다. (약 {estimated} < {CACHE_MIN_TOKENS} 토큰)")
+        return None
+
+    try:
+        cache = await asyncio.to_thread(
+            caching.CachedContent.create,
+            model=model_name,
+            display_name=display_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl_sec),
+        )
+    except Exception as e:
+        print(f"⚠️ [LLM] 컨텍스트 캐시 생성 실패 -> 캐시 없이 진행: {e}")
+        return None
+
+    cached_tokens = getattr(getattr(cache, "usage_metadata", None), "total_token_count", None)
+    print(f"🧊 [LLM] 컨텍스트 캐시 생성: {cache.name} (토큰 {cached_tokens or f'약 {estimated}'}, TTL {ttl_sec}s)")
+    return cache
+
+
+async def adelete_cache(cache):
+    """컨텍스트 캐시 삭제 (실패해도 TTL이 지나면 자동 만료되므로 무시)"""
+    if cache is None:
+        return
+    try:
+        await asyncio.to_thread(cache.delete)
+    except Exception as e:
+        print(f"⚠️ [LLM] 컨텍스트 캐시 삭제 실패 (TTL 후 만료): {e}")
+
+
+# ==============================================================================
+# JSON 응답 (JSON 모드 + 스키마 강제, 복구 파서, 실패 시 해당 호출만 재시도)
+# ==============================================================================
+JSON_RETRY_NOTE = "\n\n[중요] 이전 응답이 올바른 JSON이 아니었습니다. 설명이나 코드 블록 없이 지정된 형식의 JSON 객체 하나만 출력하세요."
+JSON_TRUNCATED_NOTE = "\n\n[중요] 이전 응답이 출력 길이 한도에서 잘렸습니다. 지정된 형식의 JSON 객체 하나만 출력하되, 모든 항목을 빠짐없이 더 간결하게 작성하세요."
+
+# 프로세스 전체 JSON 응답 통계 (파싱 실패율, 출력 한도로 잘린 응답, 실패로 버려진 토큰)
+json_stats = {"calls": 0, "parsed": 0, "repaired": 0, "truncated": 0, "failures": 0, "retries": 0, "wasted_tokens": 0}
+
+
+def _strip_comments_and_trailing_commas(text: str) -> str:
+    """문자열 밖의 // , /* */ 주석과 닫는 괄호 앞의 쉼표 제거"""
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if c == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+            out.append(c)
+        elif text.startswith("//", i):
+            while i < n and text[i] != "\n":
+                i += 1
+            continue
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        elif c in "}]":
+            # 직전의 공백이 아닌 문자가 쉼표면 제거
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """출력 토큰 한도 등으로 잘린 JSON의 열린 문자열/괄호를 닫음"""
+    stack = []
+    in_string = False
+    escaped = False
+    for c in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    # 값 없이 끝난 키("key":) 또는 끝의 쉼표는 제거
+    while text.endswith((",", ":")):
+        if text.endswith(":"):
+            key_end = len(text[:-1].rstrip()) - 1
+            text = text[:text.rfind('"', 0, key_end)]
+        text = text.rstrip().rstrip(",").rstrip()
+    return text + "".join(reversed(stack))
+
+
+def parse_json_text(text: str, close_truncated: bool = True):
+    """
+    모델 응답 텍스트를 JSON으로 파싱해 (data, repaired) 반환
+    - 먼저 그대로 파싱하고, 실패하면 코드 블록/BOM 제거, 앞뒤 설명문 제거, 주석/끝 쉼표 제거,
+      잘린 문자열/괄호 닫기(close_truncated일 때만) 순으로 복구를 시도
+    - 끝까지 실패하면 json.JSONDecodeError
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError as e:
+        error = e
+
+    cleaned = text.lstrip("\ufeff").replace("```json", "").replace("```JSON", "").replace("```", "").strip()
+    starts = [pos for pos in (cleaned.find("{"), cleaned.find("[")) if pos != -1]
+    if starts:
+        cleaned = cleaned[min(starts):]
+    for candidate in (cleaned, _strip_comments_and_trailing_commas(cleaned)):
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            pass
+        # 뒤에 붙은 설명문 무시 (첫 번째 완결된 값만 사용)
+        try:
+            return json.JSONDecoder().raw_decode(candidate)[0], True
+        except json.JSONDecodeError:
+            pass
+    if not close_truncated:
+        raise error
+    try:
+        return json.loads(_close_truncated(_strip_comments_and_trailing_commas(cleaned))), True
+    except json.JSONDecodeError:
+        raise error
+
+
+def missing_required(data, schema) -> list:
+    """스키마의 최상위 필수 키 중 data에 없는 키 목록"""
+    if not schema or schema.get("type") != "object":
+        return []
+    if not isinstance(data, dict):
+        return ["<object>"]
+    return [key for key in schema.get("required", []) if key not in data]
+
+
+def finish_reason_of(response) -> str:
+    """응답 첫 후보의 종료 사유 이름 (STOP, MAX_TOKENS 등, 알 수 없으면 빈 문자열)"""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return ""
+    return getattr(reason, "name", str(reason))
+
+
+def parse_json_response(response):
+    """GenerateContentResponse(.text) 또는 문자열을 parse_json_text로 파싱해 data만 반환"""
+    text = response if isinstance(response, str) else response.text
+    return parse_json_text(text)[0]
+
+
+async def agenerate_json(prompt, model_name: str = DEFAULT_MODEL, schema=None, parse_retries: int = 1,
+                         generation_config: dict | None = None, label: str = "", **kwargs):
+    """
+    JSON 응답을 받는 agenerate
+    - schemas.STRUCTURED_OUTPUT에 따라 response_mime_type=application/json (+ response_schema) 지정
+    - 복구 파서로도 파싱하지 못하면 해당 호출(이 프롬프트)만 parse_retries회 다시 요청
+      (실패한 응답의 토큰은 wasted_tokens로 집계)
+    - 출력 한도(MAX_TOKENS)에서 잘린 응답은 괄호를 닫아 복구하지 않고 파싱 실패로 보고 다시 요청
+      (잘린 목록이 완결된 결과처럼 체크포인트에 저장되지 않도록, 잘린 결과는 반환하지 않음)
+    - (data, response) 반환, 재시도까지 실패하면 json.JSONDecodeError
+    """
+    config = schemas.json_config(schema, generation_config)
+    attempt_prompt = prompt
+    if isinstance(prompt, str):
+        estimated = prompt_builder.count_tokens(prompt)
+    else:
+        estimated = sum(prompt_builder.count_tokens(part) for part in prompt if isinstance(part, str))
+    for parse_attempt in range(parse_retries + 1):
+        json_stats["calls"] += 1
+        started = time.perf_counter()
+        response = await agenerate(attempt_prompt, model_name, generation_config=config, **kwargs)
+        latency = time.perf_counter() - started
+        truncated = finish_reason_of(response) == "MAX_TOKENS"
+        try:
+            if truncated:
+                json_stats["truncated"] += 1
+                raise ValueError("출력 토큰 한도(MAX_TOKENS)에서 응답이 잘림")
+            data, repaired = parse_json_text(response.text, close_truncated=False)
+            # 복구한 결과에 필수 키가 빠져 있으면 불완전한 응답으로 보고 다시 요청
+            missing = missing_required(data, schema) if repaired else []
+            if missing:
+                raise json.JSONDecodeError(f"복구한 JSON에 필수 키 없음 {missing}", response.text, 0)
+        except (json.JSONDecodeError, ValueError) as e:
+            # ValueError: 안전 필터 등으로 응답 텍스트가 없거나 출력 한도에서 잘린 경우
+            prompt_builder.record_call(label, model_name, estimated, response, latency, parsed=False)
+            json_stats["failures"] += 1
+            json_stats["wasted_tokens"] += getattr(getattr(response, "usage_metadata", None), "total_token_count", None) or 0
+            if parse_attempt >= parse_retries:
+                raise json.JSONDecodeError(f"JSON 응답 파싱 실패{f' ({label})' if label else ''}: {e}", "", 0) from e
+            json_stats["retries"] += 1
+            print(f"🔁 [LLM] JSON 파싱 실패 -> 해당 호출만 재요청{f' ({label})' if label else ''}: {e}")
+            if isinstance(prompt, str):
+                attempt_prompt = prompt + (JSON_TRUNCATED_NOTE if truncated else JSON_RETRY_NOTE)
+            continue
+        prompt_builder.record_call(label, model_name, estimated, response, latency)
+        json_stats["parsed"] += 1
+        if repaired:
+            json_stats["repaired"] += 1
+        return data, response
+
+
+def log_json_summary():
+    s = json_stats
+    if not s["calls"]:
+        return
+    failure_rate = s["failures"] / s["calls"] * 100
+    print(f"🧾 [LLM] JSON 응답 {s['calls']}회: 파싱 성공 {s['parsed']} (복구 {s['repaired']}), "
+          f"실패 {s['failures']} ({failure_rate:.1f}%, 출력 한도로 잘림 {s['truncated']}), 재요청 {s['retries']}, 실패로 버려진 토큰 {s['wasted_tokens']:,} "
+          f"(모드: {schemas.STRUCTURED_OUTPUT})")
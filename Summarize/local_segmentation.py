@@ -0,0 +1,403 @@
+#%%
+# 로컬 문장 임베딩 기반 토픽 구간 분할 (Step 1 대체/보조, TextTiling 방식) + LLM 구조 분석과의 경계 일치도 평가
+###############################################################################################################################################################################
+
+import os
+import re
+import json
+import math
+import time
+import bisect
+import asyncio
+import argparse
+import threading
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # 로컬 구간 분할(STRUCTURE_MODE=local|hybrid)에서만 필요한 선택 의존성
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # 로컬 구간 분할(STRUCTURE_MODE=local|hybrid)에서만 필요한 선택 의존성
+    SentenceTransformer = None
+
+import prompts
+import schemas
+import rate_limiter
+import structure_mapreduce
+
+# Configuration
+# llm: Gemini가 전체 대화로 구조 분석 | local: 임베딩 구간 분할만 (LLM 호출 없음) | hybrid: 임베딩 구간 + 작은 프롬프트로 제목/유형/병합
+STRUCTURE_MODE = os.getenv("STRUCTURE_MODE", "llm").lower()
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+LOCAL_EMBEDDING_DEVICE = os.getenv("LOCAL_EMBEDDING_DEVICE", "cpu")
+LOCAL_EMBEDDING_BATCH = int(os.getenv("LOCAL_EMBEDDING_BATCH", "64"))
+SEGMENT_BLOCK_LINES = int(os.getenv("SEGMENT_BLOCK_LINES", "8"))            # 경계 후보 양쪽에서 비교하는 줄 수 (TextTiling 블록 크기)
+SEGMENT_MIN_LINES = int(os.getenv("SEGMENT_MIN_LINES", "20"))               # 토픽 하나의 최소 줄 수 (더 가까운 경계는 깊이가 큰 쪽만 채택)
+SEGMENT_DEPTH_CUTOFF = float(os.getenv("SEGMENT_DEPTH_CUTOFF", "0.5"))      # 깊이 점수가 평균 + cutoff × 표준편차를 넘는 골짜기만 경계로 채택
+SEGMENT_MAX_TOPICS = int(os.getenv("SEGMENT_MAX_TOPICS", "12"))             # 회의 하나에서 나누는 최대 토픽 수
+SEGMENT_EXCERPT_LINES = 6                                                   # hybrid 프롬프트에 넣는 구간별 발췌 줄 수
+SEGMENT_EXCERPT_CHARS = 160                                                 # 발췌 줄 하나의 최대 글자 수
+SEGMENT_KEYWORDS = 5                                                        # 구간별 핵심어 수
+LOCAL_TOPIC_TYPE = "general"                                                # local 모드 토픽 유형 (TYPE_PROMPTS에 없으므로 Step 2는 DEFAULT_PROMPT 사용)
+EVAL_TOLERANCE = 5                                                          # 평가 시 경계 일치로 보는 허용 오차 (발화 수)
+
+# 핵심어에서 제외할 흔한 말
+STOPWORDS = {
+    "그리고", "그래서", "그런데", "그러면", "그러니까", "그니까", "하지만", "이제", "지금", "저희", "저희가", "우리", "우리가",
+    "제가", "이거", "그거", "저거", "이건", "그건", "이렇게", "그렇게", "있습니다", "없습니다", "합니다", "했습니다", "하는",
+    "하고", "해서", "같습니다", "생각합니다", "것", "것을", "것이", "거", "거예요", "네", "예", "좀", "많이", "정도", "부분",
+    "일단", "그럼", "아니", "혹시", "다시", "정말", "진짜", "괜찮습니다", "좋습니다", "감사합니다",
+}
+_WORD = re.compile(r"[가-힣A-Za-z0-9]{2,}")
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def _require_dependencies():
+    if np is None or SentenceTransformer is None:
+        raise RuntimeError("로컬 구간 분할을 사용하려면 numpy와 sentence-transformers 패키지가 필요합니다. "
+                           "(pip install sentence-transformers)")
+
+
+def get_embedder():
+    """프로세스 전역에서 문장 임베딩 모델 하나를 공유 (첫 호출 때 로드)"""
+    global _embedder
+    _require_dependencies()
+    with _embedder_lock:
+        if _embedder is None:
+            started = time.perf_counter()
+            _embedder = SentenceTransformer(LOCAL_EMBEDDING_MODEL, device=LOCAL_EMBEDDING_DEVICE)
+            print(f"🧠 [LocalSeg] 임베딩 모델 로드: {LOCAL_EMBEDDING_MODEL} ({LOCAL_EMBEDDING_DEVICE}, "
+                  f"{time.perf_counter() - started:.1f}s)")
+        return _embedder
+
+
+def embed(texts):
+    """정규화된 문장 임베딩 (n, dim)"""
+    model = get_embedder()
+    with _embedder_lock:
+        return model.encode(texts, batch_size=LOCAL_EMBEDDING_BATCH, normalize_embeddings=True,
+                            convert_to_numpy=True, show_progress_bar=False)
+
+
+def _content(line: str) -> str:
+    """'[ID: 12-15] 화자: 내용' -> '내용'"""
+    return line.split(": ", 2)[-1] if line.startswith("[ID:") else line
+
+
+# ==============================================================================
+# 1. TextTiling: 블록 유사도 -> 깊이 점수 -> 경계 선택
+# ==============================================================================
+def gap_similarities(embeddings, block: int = SEGMENT_BLOCK_LINES):
+    """줄 g-1과 g 사이(g=1..n-1)마다 앞 block줄 평균과 뒤 block줄 평균의 코사인 유사도"""
+    n = len(embeddings)
+    cumsum = np.vstack([np.zeros((1, embeddings.shape[1])), np.cumsum(embeddings, axis=0)])
+    sims = np.empty(max(0, n - 1))
+    for g in range(1, n):
+        lo, hi = max(0, g - block), min(n, g + block)
+        left = cumsum[g] - cumsum[lo]
+        right = cumsum[hi] - cumsum[g]
+        denom = np.linalg.norm(left) * np.linalg.norm(right)
+        sims[g - 1] = float(left @ right / denom) if denom else 1.0
+    return sims
+
+
+def smooth(values, width: int = 2):
+    """앞뒤 width개 평균 (작은 흔들림 제거)"""
+    if len(values) == 0:
+        return values
+    kernel = np.ones(2 * width + 1) / (2 * width + 1)
+    padded = np.pad(values, width, mode="edge")
+    return np.convolve(padded, kernel, mode="valid")
+
+
+def depth_scores(sims):
+    """각 지점의 골짜기 깊이 = (왼쪽 봉우리 - 값) + (오른쪽 봉우리 - 값), 봉우리는 값이 오르는 동안 따라감"""
+    n = len(sims)
+    depths = np.zeros(n)
+    for i in range(n):
+        left = i
+        while left > 0 and sims[left - 1] >= sims[left]:
+            left -= 1
+        right = i
+        while right < n - 1 and sims[right + 1] >= sims[right]:
+            right += 1
+        depths[i] = (sims[left] - sims[i]) + (sims[right] - sims[i])
+    return depths
+
+
+def choose_boundaries(depths, num_lines: int, min_lines: int = SEGMENT_MIN_LINES,
+                      cutoff: float = SEGMENT_DEPTH_CUTOFF, max_topics: int = SEGMENT_MAX_TOPICS):
+    """
+    깊이 점수로 경계(새 토픽이 시작하는 줄 번호) 선택
+    - 평균 + cutoff × 표준편차를 넘는 지점을 깊은 순으로 채택
+    - 이미 채택한 경계나 회의 처음/끝과 min_lines보다 가까우면 제외, 최대 max_topics개 토픽
+    """
+    if len(depths) == 0:
+        return []
+    threshold = float(depths.mean() + cutoff * depths.std())
+    candidates = sorted((i for i in range(len(depths)) if depths[i] > threshold), key=lambda i: -depths[i])
+    chosen = []
+    for i in candidates:
+        gap = i + 1  # depths[i]는 줄 i와 i+1 사이
+        if gap < min_lines or num_lines - gap < min_lines:
+            continue
+        if any(abs(gap - b) < min_lines for b in chosen):
+            continue
+        chosen.append(gap)
+        if len(chosen) >= max_topics - 1:
+            break
+    return sorted(chosen)
+
+
+def find_boundaries(index):
+    """
+    회의 전체(이름 라벨, 압축 시 합친 줄)를 임베딩해 토픽 경계를 찾음
+    반환: (줄 목록 index.units, 경계 줄 번호 목록)
+    """
+    units = index.units(0, None, "name")
+    if len(units) < 2 * SEGMENT_MIN_LINES:
+        return units, []
+    embeddings = embed([_content(text) for _, _, text in units])
+    depths = depth_scores(smooth(gap_similarities(embeddings)))
+    return units, choose_boundaries(depths, len(units))
+
+
+# ==============================================================================
+# 2. 구간 -> 토픽 (핵심어 제목) / hybrid 프롬프트
+# ==============================================================================
+def segment_ranges(num_lines: int, boundaries):
+    edges = [0] + list(boundaries) + [num_lines]
+    return [(edges[k], edges[k + 1]) for k in range(len(edges) - 1) if edges[k] < edges[k + 1]]
+
+
+def segment_keywords(units, ranges, top_n: int = SEGMENT_KEYWORDS):
+    """구간별 핵심어 (구간 안 빈도 × 다른 구간에 드문 정도)"""
+    counts = []
+    for lo, hi in ranges:
+        words = Counter(w for _, _, text in units[lo:hi] for w in _WORD.findall(_content(text)) if w not in STOPWORDS)
+        counts.append(words)
+    doc_freq = Counter(w for words in counts for w in words)
+    keywords = []
+    for words in counts:
+        scored = sorted(words, key=lambda w: -words[w] * math.log(1 + len(counts) / doc_freq[w]))
+        keywords.append(scored[:top_n])
+    return keywords
+
+
+def local_topics(index, units, ranges, keywords):
+    topics = []
+    for no, ((lo, hi), words) in enumerate(zip(ranges, keywords), 1):
+        topics.append({
+            "sub_topic": ", ".join(words[:3]) or f"구간 {no}",
+            "type": LOCAL_TOPIC_TYPE,
+            "start_id": str(index.utterances[units[lo][0]].get('id')),
+            "end_id": str(index.utterances[units[hi - 1][1]].get('id')),
+        })
+    return topics
+
+
+def build_label_prompt(units, ranges, keywords, topics, metadata_str, participants_str):
+    """hybrid용 작은 프롬프트: 구간별 ID 범위 + 핵심어 + 고르게 뽑은 발췌 줄 (대화 원문 전체 대신)"""
+    blocks = []
+    for no, ((lo, hi), words, topic) in enumerate(zip(ranges, keywords, topics), 1):
+        step = max(1, (hi - lo) // SEGMENT_EXCERPT_LINES)
+        excerpt = [units[k][2][:SEGMENT_EXCERPT_CHARS] for k in range(lo, hi, step)][:SEGMENT_EXCERPT_LINES]
+        blocks.append(
+            f"## 구간 {no} (start_id {topic['start_id']} ~ end_id {topic['end_id']}, {hi - lo}줄)\n"
+            f"- 핵심어: {', '.join(words)}\n- 발췌:\n" + "\n".join(excerpt)
+        )
+    return prompts.SEGMENT_LABEL_PROMPT.format(
+        metadata=metadata_str, participants=participants_str, segments="\n\n".join(blocks),
+    )
+
+
+async def analyze_local(index, metadata_str, participants_str, generate_json, mode: str = STRUCTURE_MODE):
+    """
+    로컬 구간 분할로 구조 분석 (반환 형식은 STRUCTURE_PROMPT 응답과 같음: {main_topic, domain, topics})
+    - local: 경계 + 핵심어 제목만 (LLM 호출 없음, 유형은 LOCAL_TOPIC_TYPE)
+    - hybrid: 구간 요약만 담은 작은 프롬프트로 제목/유형/도메인을 받고 같은 주제의 이웃 구간은 병합
+      (호출이 실패하면 local 결과 사용)
+    generate_json(prompt, schema, label, task): 파싱된 JSON을 반환하는 호출 함수 (task는 model_router 작업 유형)
+    """
+    started = time.perf_counter()
+    units, boundaries = await asyncio.to_thread(find_boundaries, index)
+    if not units:
+        raise ValueError("구조 분석할 발화가 없습니다.")
+    ranges = segment_ranges(len(units), boundaries)
+    keywords = segment_keywords(units, ranges)
+    topics = local_topics(index, units, ranges, keywords)
+    print(f"🧭 [LocalSeg] 줄 {len(units)}개 -> 토픽 {len(topics)}개 ({time.perf_counter() - started:.2f}s)")
+
+    overall = segment_keywords(units, [(0, len(units))])[0]
+    result = {"main_topic": ", ".join(overall[:5]), "domain": "", "topics": topics}
+    if mode != "hybrid":
+        return result
+
+    prompt = build_label_prompt(units, ranges, keywords, topics, metadata_str, participants_str)
+    print(f"🧭 [LocalSeg] 구간 제목/유형 요청 (프롬프트 약 {rate_limiter.estimate_tokens(prompt)} 토큰)")
+    try:
+        labeled = await generate_json(prompt, schemas.SEGMENT_LABEL_SCHEMA, "구간 제목/유형", "segment_label")
+        merged = structure_mapreduce.reconcile_topics(index, labeled.get('topics', []))
+        if not merged:
+            raise ValueError("유효한 토픽이 없습니다.")
+        labeled['topics'] = merged
+        return labeled
+    except Exception as e:
+        print(f"⚠️ [LocalSeg] 구간 제목/유형 요청 실패 -> 로컬 구간 그대로 사용: {e}")
+        return result
+
+
+# ==============================================================================
+# 3. 평가: LLM 구조 분석(skeleton)과의 경계 일치도, 소요 시간
+# ==============================================================================
+def topic_starts(index, topics):
+    """토픽 목록 -> 토픽이 시작하는 발화 위치 (정렬, 첫 토픽 포함)"""
+    starts = sorted(p for p in (index.index_of(t.get('start_id')) for t in topics) if p is not None)
+    return starts or [0]
+
+
+def boundary_metrics(num_positions: int, ref_starts, hyp_starts, tolerance: int = EVAL_TOLERANCE):
+    """
+    Pk / WindowDiff (낮을수록 좋음) + 허용 오차 안의 경계 정밀도/재현율/F1
+    경계 = 두 번째 토픽부터의 시작 위치
+    """
+    def labels(starts):
+        return [bisect.bisect_right(starts, p) for p in range(num_positions)]
+
+    ref_labels, hyp_labels = labels(ref_starts), labels(hyp_starts)
+    k = max(2, round(num_positions / max(1, len(ref_starts)) / 2))
+    windows = max(1, num_positions - k)
+    pk = sum((ref_labels[i] == ref_labels[i + k]) != (hyp_labels[i] == hyp_labels[i + k]) for i in range(windows)) / windows
+    wd = sum((ref_labels[i + k] - ref_labels[i]) != (hyp_labels[i + k] - hyp_labels[i]) for i in range(windows)) / windows
+
+    ref_b, hyp_b = [s for s in ref_starts if s > 0], [s for s in hyp_starts if s > 0]
+    unmatched = list(ref_b)
+    hits = 0
+    for b in hyp_b:
+        near = [r for r in unmatched if abs(r - b) <= tolerance]
+        if near:
+            unmatched.remove(min(near, key=lambda r: abs(r - b)))
+            hits += 1
+    precision = hits / len(hyp_b) if hyp_b else float(not ref_b)
+    recall = hits / len(ref_b) if ref_b else float(not hyp_b)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"pk": round(pk, 3), "windowdiff": round(wd, 3), "precision": round(precision, 3),
+            "recall": round(recall, 3), "f1": round(f1, 3)}
+
+
+async def evaluate_meeting(file_id, mode="local", run_llm=False):
+    """
+    회의 하나에 대해 로컬(또는 hybrid) 구조 분석과 LLM 구조 분석을 비교
+    - 기준: run_llm이면 지금 STRUCTURE_PROMPT로 다시 분석(시간 측정), 아니면 저장된 최종 요약의 토픽
+    """
+    import storage
+    import transcript_index
+    import S3_Summarization
+
+    client = storage.get_storage_client()
+    meeting = await client.aget_json(f"meeting_logs/{file_id}.json")
+    index = transcript_index.get_index(meeting)
+    row = {"file_id": file_id, "utterances": len(index)}
+
+    llm_sec = None
+    if run_llm:
+        started = time.perf_counter()
+        reference = (await S3_Summarization.extract_structure(meeting, structure_mode="llm")).get('topics', [])
+        llm_sec = time.perf_counter() - started
+    else:
+        try:
+            final = await client.aget_json(f"Summarize/{file_id}_final.json")
+        except storage.ObjectNotFound:
+            print(f"⚠️ {file_id}: 최종 요약이 없어 기준 토픽을 알 수 없습니다 (--run_llm으로 새로 분석 가능)")
+            return None
+        reference = final.get('final_summary', {}).get('topics', [])
+
+    started = time.perf_counter()
+    hypothesis = (await S3_Summarization.extract_structure(meeting, structure_mode=mode)).get('topics', [])
+    local_sec = time.perf_counter() - started
+
+    # 프롬프트 크기 비교 (로컬 추정): 전체 대화 구조 분석 vs hybrid 구간 요약
+    metadata_str = json.dumps(meeting.get('metadata', {}), ensure_ascii=False, indent=2)
+    participants_str = json.dumps(meeting.get('participants', []), ensure_ascii=False, indent=2)
+    units, boundaries = find_boundaries(index)
+    ranges = segment_ranges(len(units), boundaries)
+    keywords = segment_keywords(units, ranges)
+    label_prompt = build_label_prompt(units, ranges, keywords, local_topics(index, units, ranges, keywords),
+                                      metadata_str, participants_str)
+    full_prompt = prompts.STRUCTURE_PROMPT.format(input_data=index.text())
+
+    row.update(boundary_metrics(len(index), topic_starts(index, reference), topic_starts(index, hypothesis)))
+    row.update({
+        "ref_topics": len(reference),
+        "hyp_topics": len(hypothesis),
+        "local_sec": round(local_sec, 2),
+        "llm_sec": round(llm_sec, 2) if llm_sec is not None else None,
+        "llm_prompt_tokens": rate_limiter.estimate_tokens(full_prompt),
+        "hybrid_prompt_tokens": rate_limiter.estimate_tokens(label_prompt),
+    })
+    return row
+
+
+async def evaluate(file_ids, mode="local", run_llm=False):
+    get_embedder()  # 모델 로드 시간은 회의별 시간에서 제외
+    rows = []
+    for file_id in file_ids:
+        try:
+            row = await evaluate_meeting(file_id, mode, run_llm)
+        except Exception as e:
+            print(f"❌ {file_id}: 평가 실패: {e}")
+            continue
+        if row is None:
+            continue
+        rows.append(row)
+        timing = f"로컬 {row['local_sec']:.2f}s" + (f" / LLM {row['llm_sec']:.2f}s" if row['llm_sec'] is not None else "")
+        print(f"📏 {file_id}: 토픽 {row['ref_topics']} vs {row['hyp_topics']}, Pk {row['pk']:.3f}, WD {row['windowdiff']:.3f}, "
+              f"경계 F1 {row['f1']:.3f} (±{EVAL_TOLERANCE}), {timing}, "
+              f"프롬프트 {row['llm_prompt_tokens']:,} -> {row['hybrid_prompt_tokens']:,} 토큰")
+
+    if rows:
+        def mean(key):
+            values = [r[key] for r in rows if r[key] is not None]
+            return sum(values) / len(values) if values else None
+        print(f"\n📊 [LocalSeg/{mode}] 회의 {len(rows)}개 평균: Pk {mean('pk'):.3f}, WindowDiff {mean('windowdiff'):.3f}, "
+              f"경계 P/R/F1 {mean('precision'):.3f}/{mean('recall'):.3f}/{mean('f1'):.3f}, 로컬 {mean('local_sec'):.2f}s"
+              + (f", LLM {mean('llm_sec'):.2f}s" if mean('llm_sec') is not None else "")
+              + f", 구조 분석 프롬프트 {mean('llm_prompt_tokens'):,.0f} -> {mean('hybrid_prompt_tokens'):,.0f} 토큰")
+    return rows
+
+
+if __name__ == "__main__":
+    import storage
+    import llm_client
+
+    parser = argparse.ArgumentParser(description="로컬 임베딩 구간 분할 vs LLM 구조 분석 평가")
+    parser.add_argument("--file_ids", nargs='+', default=[], help="평가할 File ID 목록")
+    parser.add_argument("--file_list", help="평가할 File ID 목록 파일 (한 줄에 하나)")
+    parser.add_argument("--mode", choices=["local", "hybrid"], default="local", help="평가할 로컬 구조 분석 방식")
+    parser.add_argument("--run_llm", action="store_true",
+                        help="기준 토픽을 저장된 최종 요약 대신 STRUCTURE_PROMPT로 새로 분석 (LLM 시간 측정)")
+    parser.add_argument("--report", help="회의별 결과를 저장할 로컬 JSON 경로")
+    args = parser.parse_args()
+
+    file_ids = list(args.file_ids)
+    if args.file_list:
+        with open(args.file_list, encoding="utf-8") as f:
+            file_ids += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not file_ids:
+        parser.error("--file_ids 또는 --file_list 중 하나는 필요합니다.")
+    if args.run_llm or args.mode == "hybrid":
+        llm_client.configure()
+
+    try:
+        rows = asyncio.run(evaluate(file_ids, args.mode, args.run_llm))
+    finally:
+        storage.metrics.log_summary()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"📝 평가 결과 저장: {args.report}")
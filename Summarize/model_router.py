@@ -0,0 +1,165 @@
+#%%
+# 작업 유형/구간 크기/호출 한도 여유에 따른 Gemini 모델 선택 (pro <-> flash, 한도 소진 시 대체 모델) + 경로별 지연/비용 집계
+###############################################################################################################################################################################
+
+import os
+import time
+import threading
+from collections import defaultdict, deque
+
+from google.api_core import exceptions
+
+import llm_client
+import rate_limiter
+
+# Configuration
+PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "models/gemini-2.5-pro")
+FLASH_MODEL = os.getenv("GEMINI_FLASH_MODEL", "models/gemini-2.5-flash")
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "on").lower()                       # on: 작업별 모델 선택 | off: 모든 호출을 PRO_MODEL로 (대체 모델 없음)
+ROUTE_SHORT_TOPIC_TOKENS = int(os.getenv("ROUTE_SHORT_TOPIC_TOKENS", "6000"))   # Step 2 토픽 프롬프트가 이 추정 토큰 이하면 flash
+ROUTE_MIN_HEADROOM = float(os.getenv("ROUTE_MIN_HEADROOM", "0.2"))             # 유연한 작업은 선호 모델의 한도 여유가 이보다 작고 다른 모델이 더 여유 있으면 교체
+ROUTE_FALLBACK_ATTEMPTS = int(os.getenv("ROUTE_FALLBACK_ATTEMPTS", "1"))       # 한도 초과(429) 시 대체 모델로 넘어가기 전 시도 횟수 (1=바로 대체)
+LATENCY_SAMPLES = 1000                                                         # 경로별로 보관하는 최근 지연 시간 수 (p95 계산용)
+
+# 모델별 가격 (USD / 1M 토큰: 입력, 캐시된 입력, 출력(사고 토큰 포함)), 200K 이하 프롬프트 기준, 가격 변경 시 수정
+MODEL_PRICES = {
+    "pro": (1.25, 0.31, 10.00),
+    "flash": (0.30, 0.075, 2.50),
+}
+
+# 작업별 경로: (선호 모델 등급, 한도 여유에 따라 교체 가능 여부)
+# - 구조 분석/통합은 품질 우선으로 pro 고정 (한도 소진 시에만 flash로 대체)
+# - Recap(지연 시간 우선)과 구간 제목 붙이기(작은 프롬프트)는 flash
+# - Step 2 토픽은 프롬프트 크기로 결정 (ROUTE_SHORT_TOPIC_TOKENS)
+ROUTES = {
+    "structure": ("pro", False),
+    "structure_window": ("pro", False),
+    "structure_merge": ("pro", False),
+    "segment_label": ("flash", True),
+    "topic": ("size", True),
+    "consolidation": ("pro", False),
+    "recap": ("flash", True),
+}
+TIER_MODELS = {"pro": PRO_MODEL, "flash": FLASH_MODEL}
+
+
+def settings() -> dict:
+    """결과에 영향을 주는 설정 (체크포인트 해시에 포함)"""
+    if MODEL_ROUTING == "off":
+        return {"routing": "off"}
+    return {"routing": MODEL_ROUTING, "flash_model": FLASH_MODEL, "short_topic_tokens": ROUTE_SHORT_TOPIC_TOKENS}
+
+
+def tier_of(model_name: str) -> str:
+    return "flash" if "flash" in model_name else "pro"
+
+
+def route(task: str, prompt_tokens: int = 0) -> list:
+    """
+    작업에 쓸 모델 순서 (첫 번째가 선택된 모델, 나머지는 한도 소진 시 대체 모델)
+    - 작업 유형 -> 선호 등급 (topic은 프롬프트 추정 토큰으로 결정)
+    - 교체 가능한 작업은 선호 모델의 한도 여유(rate_limiter.headroom)가 부족하면 더 여유 있는 모델 먼저
+    """
+    if MODEL_ROUTING == "off":
+        return [PRO_MODEL]
+    tier, flexible = ROUTES.get(task, ("pro", False))
+    if tier == "size":
+        tier = "flash" if prompt_tokens <= ROUTE_SHORT_TOPIC_TOKENS else "pro"
+    chain = [TIER_MODELS[tier], TIER_MODELS["flash" if tier == "pro" else "pro"]]
+    if flexible:
+        preferred, other = (rate_limiter.get_rate_limiter(m).headroom() for m in chain)
+        if preferred < ROUTE_MIN_HEADROOM and other > preferred:
+            chain.reverse()
+    return chain
+
+
+# ==============================================================================
+# 경로별 (작업, 모델) 지연/토큰/비용 집계
+# ==============================================================================
+route_stats = defaultdict(lambda: {"calls": 0, "failures": 0, "fallbacks": 0, "prompt": 0, "cached": 0,
+                                   "output": 0, "cost": 0.0, "latency": deque(maxlen=LATENCY_SAMPLES)})
+_stats_lock = threading.Lock()
+
+
+def cost_of(model_name: str, response) -> float:
+    """응답 usage_metadata 기준 비용 (USD, 캐시된 입력은 캐시 가격)"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt = getattr(usage, "prompt_token_count", None) or 0
+    cached = getattr(usage, "cached_content_token_count", None) or 0
+    output = (getattr(usage, "candidates_token_count", None) or 0) + (getattr(usage, "thoughts_token_count", None) or 0)
+    input_price, cached_price, output_price = MODEL_PRICES[tier_of(model_name)]
+    return ((prompt - cached) * input_price + cached * cached_price + output * output_price) / 1_000_000
+
+
+def record(task: str, model_name: str, latency_sec: float, response=None, ok=True, fallback=False):
+    usage = llm_client.usage_of(response) if response is not None else {}
+    with _stats_lock:
+        s = route_stats[(task, model_name)]
+        s["calls"] += 1
+        s["failures"] += not ok
+        s["fallbacks"] += fallback
+        s["latency"].append(latency_sec)
+        if response is not None:
+            s["prompt"] += usage["prompt_tokens"] or 0
+            s["cached"] += usage["cached_tokens"]
+            s["output"] += usage["output_tokens"] or 0
+            s["cost"] += cost_of(model_name, response)
+
+
+async def agenerate_json(task: str, prompt, schema=None, label: str = "", models=None, prompt_tokens=None, **kwargs):
+    """
+    route(task)로 고른 모델로 llm_client.agenerate_json 호출, (data, response) 반환
+    - 한도 초과(ResourceExhausted)가 ROUTE_FALLBACK_ATTEMPTS회 이어지면 다음 모델로 넘어감 (마지막 모델은 원래 재시도 횟수)
+    - models를 주면 그 순서를 그대로 사용 (예: 컨텍스트 캐시는 만든 모델에서만 쓸 수 있음)
+    - prompt_tokens가 없으면 prompt로 추정
+    """
+    if models is None:
+        if prompt_tokens is None:
+            prompt_tokens = rate_limiter.estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+        models = route(task, prompt_tokens)
+
+    for k, model_name in enumerate(models):
+        last = k == len(models) - 1
+        call_kwargs = dict(kwargs)
+        if not last:
+            call_kwargs["max_attempts"] = min(kwargs.get("max_attempts", llm_client.LLM_MAX_ATTEMPTS), ROUTE_FALLBACK_ATTEMPTS)
+        started = time.perf_counter()
+        try:
+            data, response = await llm_client.agenerate_json(prompt, model_name, schema=schema, label=label, **call_kwargs)
+        except exceptions.ResourceExhausted:
+            record(task, model_name, time.perf_counter() - started, ok=False, fallback=not last)
+            if last:
+                raise
+            print(f"🔀 [Router] {label or task}: {model_name} 호출 한도 소진 -> {models[k + 1]}로 대체")
+            continue
+        except Exception:
+            record(task, model_name, time.perf_counter() - started, ok=False)
+            raise
+        record(task, model_name, time.perf_counter() - started, response)
+        return data, response
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+
+
+def log_summary():
+    """경로별 호출 수/지연(평균, p95)/토큰/비용과 사용한 모델의 호출량 제한기 상태"""
+    with _stats_lock:
+        items = sorted(route_stats.items())
+        if not items:
+            return
+        print(f"🔀 [Router] 작업/모델별 호출 (라우팅: {MODEL_ROUTING})")
+        total_cost = 0.0
+        for (task, model_name), s in items:
+            latency = list(s["latency"])
+            avg = sum(latency) / len(latency) if latency else 0.0
+            total_cost += s["cost"]
+            print(f"   - {task} -> {model_name.split('/')[-1]}: {s['calls']}회 (실패 {s['failures']}, 대체 {s['fallbacks']}), "
+                  f"지연 평균 {avg:.1f}s / p95 {_p95(latency):.1f}s, 입력 {s['prompt']:,} (캐시 {s['cached']:,}), "
+                  f"출력 {s['output']:,}, 비용 ${s['cost']:.4f}")
+        print(f"   = 비용 합계 ${total_cost:.4f}")
+        models = dict.fromkeys(model_name for (_, model_name), _ in items)
+    for model_name in models:
+        rate_limiter.get_rate_limiter(model_name).log_summary()
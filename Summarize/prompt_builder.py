@@ -0,0 +1,237 @@
+#%%
+# 토큰 예산 기반 프롬프트 구성 (Step 2 구간 추출 + 문맥 버퍼 크기 결정, 호출별 토큰 기록)
+###############################################################################################################################################################################
+
+import os
+import re
+import json
+import math
+import time
+import argparse
+import threading
+from collections import deque, defaultdict
+
+import rate_limiter
+
+# Configuration
+TOPIC_PROMPT_BUDGET_TOKENS = int(os.getenv("TOPIC_PROMPT_BUDGET_TOKENS", "16000"))   # Step 2 토픽 호출 1회의 입력 토큰 예산 (로컬 추정치 기준)
+CONTEXT_BUFFER_MAX = int(os.getenv("CONTEXT_BUFFER_MAX", "10"))                       # 핵심 구간 앞뒤에 붙이는 문맥 발화 최대 수 (한쪽 기준, 기존 BUFFER_SIZE)
+CONTEXT_BUFFER_MIN = int(os.getenv("CONTEXT_BUFFER_MIN", "2"))                        # 문맥 발화 최소 수 (예산이 남는 경우)
+CONTEXT_BUFFER_RATIO = float(os.getenv("CONTEXT_BUFFER_RATIO", "0.25"))              # 핵심 구간 발화 수 대비 문맥 발화 수 (짧은 토픽은 문맥도 짧게)
+PROMPT_MAX_LINE_CHARS = int(os.getenv("PROMPT_MAX_LINE_CHARS", "400"))               # 예산 초과 시 긴 발화를 이 글자 수로 자름
+PROMPT_TOKEN_LOG = os.getenv("PROMPT_TOKEN_LOG")                                      # 설정하면 호출별 토큰 기록을 이 경로에 JSONL로 추가
+BUFFER_LOOKAROUND = 8                                                                 # 문맥 줄을 찾을 때 살펴보는 범위 (문맥 줄 수 × 이 배수만큼의 발화)
+CALL_LOG_SIZE = 5000                                                                  # 메모리에 보관하는 최근 호출 기록 수
+
+CLIPPED_MARK = "…(이하 생략)"
+OMITTED_LINE = "... (ID {first_id} ~ {last_id} 발화 {count}개 생략: 토큰 예산 초과) ..."
+
+
+def count_tokens(text: str) -> int:
+    """로컬 토큰 수 추정 (API 호출 없음, 실제 사용량과의 비율은 log_summary에서 확인)"""
+    return rate_limiter.estimate_tokens(text)
+
+
+def settings() -> dict:
+    """결과에 영향을 주는 설정 (체크포인트 해시에 포함)"""
+    return {
+        "topic_budget": TOPIC_PROMPT_BUDGET_TOKENS,
+        "buffer_max": CONTEXT_BUFFER_MAX,
+        "buffer_min": CONTEXT_BUFFER_MIN,
+        "buffer_ratio": CONTEXT_BUFFER_RATIO,
+        "max_line_chars": PROMPT_MAX_LINE_CHARS,
+    }
+
+
+def remaining_budget(*fixed_texts, budget: int = TOPIC_PROMPT_BUDGET_TOKENS) -> int:
+    """예산에서 고정 부분(공통 지시, 유형별 지시 등)을 뺀 대화 구간용 토큰 수"""
+    return max(0, budget - sum(count_tokens(text) for text in fixed_texts if text))
+
+
+def dynamic_buffer(core_lines: int) -> int:
+    """핵심 구간 길이에 비례하는 문맥 발화 수 (한쪽 기준, CONTEXT_BUFFER_MIN ~ CONTEXT_BUFFER_MAX)"""
+    return max(CONTEXT_BUFFER_MIN, min(CONTEXT_BUFFER_MAX, math.ceil(core_lines * CONTEXT_BUFFER_RATIO)))
+
+
+def _clip(line: str) -> str:
+    return line if len(line) <= PROMPT_MAX_LINE_CHARS else line[:PROMPT_MAX_LINE_CHARS] + CLIPPED_MARK
+
+
+def fit_segment(index, start_id, end_id, budget_tokens: int, label: str = "user_id"):
+    """
+    start_id ~ end_id 구간을 토큰 예산 안에 맞춰 (텍스트, 정보) 반환 (줄 단위는 index.units: 압축 시 합친 줄)
+    1. 핵심 구간이 예산 안이면 남은 예산으로 앞뒤 문맥을 한 줄씩 번갈아 추가 (최대 dynamic_buffer개)
+    2. 예산을 넘으면 문맥 없이 긴 줄을 PROMPT_MAX_LINE_CHARS로 자르고,
+    3. 그래도 넘으면 앞/뒤 줄을 남기고 가운데를 생략 표시로 대체
+    ID를 찾지 못하거나 구간에 줄이 없으면 ("", None)
+    """
+    start_idx = index.index_of(start_id)
+    end_idx = index.index_of(end_id, end=True)
+    if start_idx is None or end_idx is None:
+        return "", None
+
+    core_units = index.units(start_idx, end_idx + 1, label)
+    if not core_units:
+        return "", None
+    core = [text for _, _, text in core_units]
+    info = {"core_lines": len(core), "buffer": 0, "buffer_before": 0, "buffer_after": 0,
+            "clipped": 0, "omitted": 0, "tokens": 0}
+    cost = [count_tokens(text) for text in core]
+
+    # 예산 초과: 긴 줄 자르기 -> 가운데 생략
+    if sum(cost) > budget_tokens:
+        for k, text in enumerate(core):
+            clipped = _clip(text)
+            if clipped is not text:
+                core[k], cost[k] = clipped, count_tokens(clipped)
+                info["clipped"] += 1
+
+    if sum(cost) > budget_tokens:
+        used = count_tokens(OMITTED_LINE) + 8
+        head, tail = [], []
+        lo, hi = 0, len(core) - 1
+        take_head = True
+        while lo <= hi:
+            k = lo if take_head else hi
+            if used + cost[k] > budget_tokens:
+                break
+            used += cost[k]
+            if take_head:
+                head.append(core[k])
+                lo += 1
+            else:
+                tail.append(core[k])
+                hi -= 1
+            take_head = not take_head
+        omitted = core_units[lo:hi + 1]
+        info["omitted"] = len(omitted)
+        info["tokens"] = used
+        marker = OMITTED_LINE.format(first_id=index.utterances[omitted[0][0]].get('id'),
+                                     last_id=index.utterances[omitted[-1][1]].get('id'), count=len(omitted))
+        return "\n".join(head + [marker] + tail[::-1]), info
+
+    # 예산 안: 남은 예산으로 앞뒤 문맥 추가 (압축된 줄 하나가 여러 발화일 수 있으므로 넉넉한 범위에서 찾음)
+    buffer = dynamic_buffer(len(core))
+    info["buffer"] = buffer
+    lookaround = buffer * BUFFER_LOOKAROUND
+    before_pool = [text for _, _, text in index.units(start_idx - lookaround, start_idx, label)][::-1]
+    after_pool = [text for _, _, text in index.units(end_idx + 1, end_idx + 1 + lookaround, label)]
+    used = sum(cost)
+    before, after = [], []
+    while True:
+        added = False
+        for pool, chosen in ((before_pool, before), (after_pool, after)):
+            if len(chosen) >= min(buffer, len(pool)):
+                continue
+            line_tokens = count_tokens(pool[len(chosen)])
+            if used + line_tokens > budget_tokens:
+                continue
+            used += line_tokens
+            chosen.append(pool[len(chosen)])
+            added = True
+        if not added:
+            break
+
+    info["buffer_before"], info["buffer_after"] = len(before), len(after)
+    info["tokens"] = used
+    return "\n".join(before[::-1] + core + after), info
+
+
+# ==============================================================================
+# 호출별 토큰 기록
+# ==============================================================================
+call_log = deque(maxlen=CALL_LOG_SIZE)
+_log_lock = threading.Lock()
+
+
+def call_kind(label: str) -> str:
+    """'Topic 3', '구조 분석 구간 2/5' -> 'Topic', '구조 분석 구간' (호출 종류별 집계용)"""
+    return re.sub(r"[\d/#\s]+$", "", label or "").strip() or "기타"
+
+
+def record_call(label: str, model_name: str, estimated_tokens: int, response=None, latency_sec=None, parsed=True):
+    """호출 1회의 추정 입력 토큰과 실제 입력/출력 토큰을 기록"""
+    usage = getattr(response, "usage_metadata", None)
+    record = {
+        "ts": time.time(),
+        "label": label,
+        "kind": call_kind(label),
+        "model": model_name,
+        "estimated_tokens": estimated_tokens,
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "latency_sec": round(latency_sec, 2) if latency_sec is not None else None,
+        "parsed": parsed,
+    }
+    with _log_lock:
+        call_log.append(record)
+        if PROMPT_TOKEN_LOG:
+            try:
+                with open(PROMPT_TOKEN_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️ [PromptBuilder] 토큰 기록 저장 실패: {e}")
+    return record
+
+
+def summarize_calls(records=None) -> dict:
+    """호출 종류별 {calls, estimated, prompt, output, max_prompt}"""
+    summary = defaultdict(lambda: {"calls": 0, "estimated": 0, "prompt": 0, "output": 0, "max_prompt": 0})
+    for r in (call_log if records is None else records):
+        s = summary[r["kind"]]
+        s["calls"] += 1
+        s["estimated"] += r["estimated_tokens"] or 0
+        s["prompt"] += r["prompt_tokens"] or 0
+        s["output"] += r["output_tokens"] or 0
+        s["max_prompt"] = max(s["max_prompt"], r["prompt_tokens"] or r["estimated_tokens"] or 0)
+    return dict(summary)
+
+
+def log_summary():
+    summary = summarize_calls()
+    if not summary:
+        return
+    print("🧮 [PromptBuilder] 호출 종류별 토큰")
+    for kind, s in sorted(summary.items(), key=lambda kv: -kv[1]["prompt"]):
+        ratio = f", 실제/추정 {s['prompt'] / s['estimated']:.2f}" if s["prompt"] and s["estimated"] else ""
+        print(f"   - {kind}: {s['calls']}회, 입력 {s['prompt']:,} (호출당 최대 {s['max_prompt']:,}), "
+              f"출력 {s['output']:,}{ratio}")
+
+
+# ==============================================================================
+# 벤치마크: 고정 버퍼(±10) vs 토큰 예산 기반 구간 구성
+# ==============================================================================
+def run_benchmark(num_utterances=3000, budget=TOPIC_PROMPT_BUDGET_TOKENS, fixed_buffer=10):
+    import compression  # 가상 회의록 생성기 재사용
+    import transcript_index
+
+    data = compression.make_sample_meeting(num_utterances)
+    index = transcript_index.TranscriptIndex(data)
+    ids = [u['id'] for u in data['utterances']]
+
+    # 길이가 제각각인 토픽 (아주 짧은 토픽 ~ 예산을 넘는 긴 토픽)
+    lengths = [3, 8, 25, 60, 150, 400, 1200]
+    topics, pos = [], 0
+    for length in lengths:
+        if pos + length > len(ids):
+            break
+        topics.append((ids[pos], ids[pos + length - 1], length))
+        pos += length
+
+    print(f"발화 {num_utterances}개, 토픽 예산 {budget} 토큰 (고정 버퍼 ±{fixed_buffer} 비교)")
+    print(f"{'구간 발화':>8} | {'고정 토큰':>9} | {'예산 토큰':>9} | 문맥(앞/뒤) | 잘림 | 생략")
+    for start_id, end_id, length in topics:
+        fixed_tokens = count_tokens(index.segment(start_id, end_id, buffer=fixed_buffer))
+        _, info = fit_segment(index, start_id, end_id, budget)
+        print(f"{length:>8} | {fixed_tokens:>9} | {info['tokens']:>9} | "
+              f"{info['buffer_before']:>4}/{info['buffer_after']:<5} | {info['clipped']:>4} | {info['omitted']:>4}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="토큰 예산 기반 구간 구성 비교")
+    parser.add_argument("--utterances", type=int, default=3000, help="가상 회의록 발화 수")
+    parser.add_argument("--budget", type=int, default=TOPIC_PROMPT_BUDGET_TOKENS, help="구간에 쓸 토큰 예산")
+    args = parser.parse_args()
+
+    run_benchmark(args.utterances, args.budget)
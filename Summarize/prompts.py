@@ -260,6 +260,7 @@ STRUCTURE_PROMPT = """# 페르소나
     * **type**: 해당 소주제의 논의 성격 (아래 '회의 유형 정의'에서 반드시 하나 선택).
     * **start_id**: 해당 주제의 논의가 시작되는 발화의 ID (Conversation 내 [ID: 숫자] 참고).
     * **end_id**: 해당 주제의 논의가 끝나는 발화의 ID.
+    * 같은 화자의 연속 발화를 합친 줄은 [ID: 12-15]처럼 범위로 표시됩니다. 이 경우 start_id는 범위의 첫 번호(12), end_id는 마지막 번호(15)를 사용하세요.
 
 # 회의 유형 정의 (topics의 'type' 값으로 사용)
 각 세부 주제(`sub_topic`)가 어떤 성격인지 가장 적절한 것을 고르세요.
@@ -343,3 +344,197 @@ RECAP_PROMPT = """
 {input_data}
 """
 
+
+INCREMENTAL_RECAP_PROMPT = """
+# Role
+당신은 회의 중간에 늦게 들어온 참가자를 위해 지금까지의 상황을 빠르게 브리핑해주는 '친절한 동료'입니다.
+
+# 작업 목표
+[이전 요약]은 회의 시작부터 일정 시점까지를 요약한 결과이고, [새 대화 내용]은 그 이후에 이어진 기록입니다.
+전체 회의를 다시 읽지 않고도 현재 시점의 요약이 되도록, 이전 요약을 새 대화 내용으로 갱신해주세요.
+
+# 갱신 지침
+- 이전 요약의 내용 중 새 대화에서 뒤집히거나 수정된 부분은 최신 내용으로 고쳐주세요.
+- 새 대화에서 확정된 결정 사항은 key_decisions에 추가하고, 기존 결정 사항은 번복되지 않았다면 유지하세요.
+- summary_so_far는 회의 시작부터 현재까지의 흐름이 3~5개 문장으로 유지되도록 오래된 항목을 합쳐주세요.
+- current_topic과 catch_up_tip은 [새 대화 내용]의 가장 최근 발화를 기준으로 새로 작성하세요.
+
+# 출력 JSON 포맷 및 작성 지침 (반드시 한국어로 작성)
+{{
+  "current_topic": "현재 논의 중인 주제 (한 문장)",
+  "summary_so_far": [ "요약 1", "요약 2", "요약 3" ],
+  "key_decisions": [ "결정 사항 1" ],
+  "catch_up_tip": "참가자가 주의해야 할 점이나 바로 확인해야 할 문서 등 조언"
+}}
+
+# 이전 요약
+{previous_recap}
+
+# 새 대화 내용
+{input_data}
+"""
+
+# ==============================================================================
+# 토픽 상세 분석 (Step 2) - 모든 토픽에 공통인 앞부분과 토픽별 뒷부분
+# 공통 앞부분(+ 선택적으로 전체 대화)은 컨텍스트 캐시에 올려 토픽마다 재사용
+# ==============================================================================
+STEP2_PREFIX_PROMPT = """
+# 페르소나
+당신은 회의록의 특정 세그먼트를 정밀 분석하는 전문가입니다.
+
+# 참가자 정보
+다음은 회의 참가자 목록입니다. action_items의 assignee를 지정할 때 **반드시** 이 정보를 참고하세요.
+{participants_info}
+
+# 작업 지시
+요청마다 주어지는 [작업 개요]의 **핵심 논의 구간**을 중심으로, [대화 내용]을 읽고 다음 내용을 추출하세요.
+
+1. **details (상세 내용)**: 요청에 포함된 [작성 지침]에 정의된 구조대로 작성하세요.
+2. **segment_decisions (결정 사항)**: 이 구간에서 확정된 합의나 결정 사항이 있다면 명확한 문장으로 추출하세요. (없으면 빈 리스트)
+3. **segment_action_items (실행 항목)**: 구체적인 할 일(Task), 담당자(Assignee), 기한(Due Date)을 추출하세요.
+   - **중요:** assignee는 반드시 위 [참가자 정보]의 'name' 필드 값을 사용하세요. USER_ID를 사용하지 마세요.
+   - 대화에서 "제가 할게요" 같은 표현이 나오면, 해당 발화자의 USER_ID를 확인하고 [참가자 정보]에서 매칭되는 name을 찾아 사용하세요.
+   - 담당자가 불명확하거나 [참가자 정보]에서 찾을 수 없으면 '미정'으로 표기하세요.
+   - (없으면 빈 리스트)
+
+# 필수 출력 형식 (JSON Only)
+반드시 아래 포맷으로 응답하세요. 마크다운(```json)이나 추가 설명은 제외하세요.
+{{
+  "short_summary": "이 주제에 대한 1~2문장 요약",
+  "details": {{ ...[작성 지침]의 구조... }},
+  "segment_decisions": [
+    "결정된 사항 1",
+    "결정된 사항 2"
+  ],
+  "segment_action_items": [
+    {{
+      "task": "구체적인 작업 내용",
+      "assignee": "담당자 이름 (또는 '미정')",
+      "due_date": "마감기한 (또는 '미정')"
+    }}
+  ]
+}}
+"""
+
+STEP2_TOPIC_PROMPT = """
+# 작업 개요
+* **분석 대상 주제**: '{sub_topic}'
+* **핵심 논의 구간**: ID {start_id}번 ~ {end_id}번 발화
+{context_note}
+
+# 작성 지침 (JSON Schema & Guide)
+{type_instruction}
+
+# 대화 내용
+{segment_text}
+"""
+
+# [대화 내용]이 요청에 직접 포함되는 경우 (구간 + 앞뒤 Buffer)
+STEP2_SEGMENT_NOTE = "* **참고 문맥(Buffer)**: 핵심 구간의 앞뒤로 각각 {buffer_size}개의 발화가 문맥 파악을 위해 추가되었습니다."
+
+# 전체 대화가 컨텍스트 캐시에 들어 있는 경우
+STEP2_CACHED_TRANSCRIPT_NOTE = "* **참고 문맥**: 앞서 제공된 [전체 대화]에서 핵심 구간과 그 앞뒤 {buffer_size}개 발화를 함께 참고하세요."
+
+# ==============================================================================
+# 긴 회의용 계층적 구조 분석 (구간별 토픽 추출 -> 전체 병합)
+# ==============================================================================
+WINDOW_STRUCTURE_PROMPT = """# 페르소나
+당신은 긴 회의록의 일부 구간을 읽고 주제 전환 지점을 찾아내는 '회의 구조화 전문가'입니다.
+
+# 작업 지시
+아래 [Conversation]은 전체 회의 중 {window_no}/{window_count}번째 구간(ID {first_id} ~ {last_id})입니다.
+앞뒤 구간과 일부 발화가 겹칠 수 있으며, 겹치는 부분은 나중에 자동으로 정리되므로 이 구간 안에서만 판단하세요.
+
+1. **window_summary**: 이 구간에서 논의된 내용 요약 (한 문장).
+2. **topics**: 이 구간 안에서 논의된 세부 주제 목록. 각 항목은 다음을 포함합니다.
+    * **sub_topic**: 소주제 제목 (구체적으로).
+    * **type**: 논의 성격. 다음 중 하나: shared_info, decision_making, operational_review, problem_solving, planning, team_building, brainstorming, retrospective
+    * **start_id** / **end_id**: 이 구간 [Conversation]에 실제로 존재하는 발화 ID. [ID: 12-15]처럼 범위로 표시된 줄(같은 화자의 연속 발화)은 start_id에 첫 번호, end_id에 마지막 번호를 사용하세요.
+
+# 제약 사항
+- start_id와 end_id는 반드시 이 구간에 존재하는 실제 ID 숫자여야 합니다.
+- 구간의 처음이나 끝에서 주제가 잘려 있더라도 보이는 범위까지만 기록하세요.
+- 이 구간은 보통 1~3개의 세부 주제로 나뉩니다. 단순 인사말이나 잡담은 제외할 수 있습니다.
+
+# 출력 형식 (JSON Only, 한국어)
+{{
+  "window_summary": "구간 요약",
+  "topics": [
+    {{ "sub_topic": "주제", "type": "shared_info", "start_id": "1", "end_id": "25" }}
+  ]
+}}
+
+# Participants
+{participants}
+
+# Conversation
+{conversation}
+"""
+
+STRUCTURE_MERGE_PROMPT = """# 페르소나
+당신은 긴 회의를 여러 구간으로 나누어 분석한 결과를 하나의 목차로 통합하는 '회의 구조화 전문가'입니다.
+
+# 작업 지시
+[구간 분석 결과]는 회의를 시간 순서대로 나눈 구간별 요약과 후보 세부 주제 목록입니다.
+이를 바탕으로 회의 전체의 구조를 다음 JSON으로 정리하세요.
+
+1. **main_topic**: 회의 전체를 관통하는 핵심 주제 (한 문장).
+2. **domain**: 다음 중 하나 - '정치', '경제', '사회', '교육', '세계', '생활', '의료', '문화', '스포츠', '경영/재무', 'IT', '법률/행정'
+3. **topics**: 최종 세부 주제 목록.
+   - 구간 경계 때문에 둘로 나뉜 같은 주제는 하나로 합치세요 (앞 항목의 start_id ~ 뒤 항목의 end_id).
+   - 서로 다른 주제는 합치지 마세요. 회의 길이에 맞게 대략 30분당 2~3개 수준을 유지하세요.
+   - start_id / end_id는 반드시 후보 목록에 있는 값만 사용하고, 시간 순서대로 겹치지 않게 배치하세요.
+   - type은 후보의 type 중 가장 적절한 것을 사용하세요.
+
+# 출력 형식 (JSON Only, 한국어)
+{{
+  "main_topic": "전체 회의 주제 요약",
+  "domain": "선택된 도메인",
+  "topics": [
+    {{ "sub_topic": "주제", "type": "decision_making", "start_id": "1", "end_id": "120" }}
+  ]
+}}
+
+# Metadata
+{metadata}
+
+# 구간 분석 결과
+{windows_json}
+"""
+
+# ==============================================================================
+# 로컬 구간 분할 결과에 제목/유형 붙이기 (STRUCTURE_MODE=hybrid)
+# ==============================================================================
+SEGMENT_LABEL_PROMPT = """# 페르소나
+당신은 회의록 목차를 다듬는 '회의 구조화 전문가'입니다.
+
+# 작업 지시
+[후보 구간]은 회의 전체를 문장 임베딩으로 미리 나눈 결과입니다. 각 구간에는 ID 범위, 핵심어, 일부 발췌 발화만 있습니다.
+이를 바탕으로 회의 구조를 다음 JSON으로 정리하세요.
+
+1. **main_topic**: 회의 전체를 관통하는 핵심 주제 (한 문장).
+2. **domain**: 다음 중 하나 - '정치', '경제', '사회', '교육', '세계', '생활', '의료', '문화', '스포츠', '경영/재무', 'IT', '법률/행정'
+3. **topics**: 최종 세부 주제 목록.
+   - 각 항목의 sub_topic(구체적인 소주제 제목)과 type(논의 성격)을 정하세요.
+   - type은 다음 중 하나: shared_info(정보 공유), decision_making(의사결정), operational_review(진행 상황 점검), problem_solving(문제 해결), planning(계획/전략), team_building(팀 빌딩), brainstorming(아이디어 발산), retrospective(회고)
+   - 이어지는 구간이 같은 주제라면 하나로 합치세요 (앞 구간의 start_id ~ 뒤 구간의 end_id). 새 경계를 만들거나 구간을 나누지는 마세요.
+   - start_id / end_id는 반드시 [후보 구간]에 적힌 값만 사용하고, 시간 순서대로 겹치지 않게 배치하세요.
+
+# 출력 형식 (JSON Only, 한국어)
+{{
+  "main_topic": "전체 회의 주제 요약",
+  "domain": "선택된 도메인",
+  "topics": [
+    {{ "sub_topic": "주제", "type": "planning", "start_id": "1", "end_id": "48" }}
+  ]
+}}
+
+# Metadata
+{metadata}
+
+# Participants
+{participants}
+
+# 후보 구간
+{segments}
+"""
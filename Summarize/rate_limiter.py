@@ -0,0 +1,157 @@
+#%%
+# Gemini API 호출량 제한기 (RPM/TPM 토큰 버킷, Summarize 공용)
+###############################################################################################################################################################################
+
+import os
+import time
+import asyncio
+import threading
+
+# Configuration
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "2"))             # 분당 요청 수 한도 (기존 31초 대기와 같은 수준)
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "125000"))        # 분당 토큰 수 한도
+GEMINI_FLASH_RPM = float(os.getenv("GEMINI_FLASH_RPM", "15"))         # flash 계열 모델의 분당 요청 수 한도
+GEMINI_FLASH_TPM = float(os.getenv("GEMINI_FLASH_TPM", "1000000"))    # flash 계열 모델의 분당 토큰 수 한도
+MIN_LIMIT_FACTOR = 0.1                                         # 429 이후 줄어들 수 있는 최소 비율
+BACKOFF_FACTOR = 0.5                                         # 429 발생 시 한도 축소 비율
+RECOVERY_STEP = 0.1                                          # 성공할 때마다 회복하는 비율
+RATE_LIMITED_PAUSE_SEC = 30.0                                # 429 발생 시 전체 호출 일시 정지 시간 (retry_after가 없을 때)
+CHARS_PER_TOKEN = 2.0                                        # 한국어 위주 텍스트의 대략적인 글자/토큰 비율
+
+
+def default_limits(name: str):
+    """모델 이름별 기본 (RPM, TPM) - flash 계열은 한도가 더 높음"""
+    if "flash" in name:
+        return GEMINI_FLASH_RPM, GEMINI_FLASH_TPM
+    return GEMINI_RPM, GEMINI_TPM
+
+
+def estimate_tokens(text: str) -> int:
+    """호출 전 토큰 수 대략 추정 (실제 사용량은 응답의 usage_metadata로 보정)"""
+    return max(1, int(len(text) / CHARS_PER_TOKEN))
+
+
+class RateLimiter:
+    """
+    RPM/TPM 두 개의 토큰 버킷으로 호출을 조절하는 제한기
+    - 스레드(acquire)와 asyncio(aacquire) 양쪽에서 같은 인스턴스를 공유할 수 있음
+    - 429/ResourceExhausted를 받으면 한도를 BACKOFF_FACTOR만큼 줄이고 잠시 전체 호출을 멈춤 (AIMD)
+    - 성공할 때마다 설정한 한도까지 조금씩 회복
+    """
+    def __init__(self, rpm: float = GEMINI_RPM, tpm: float = GEMINI_TPM, name: str = "gemini"):
+        self.name = name
+        self.max_rpm = rpm
+        self.max_tpm = tpm
+        self.factor = 1.0
+
+        # 시작 시점에는 버킷을 가득 채워 첫 호출들이 바로 나가도록 함
+        self._requests = rpm
+        self._tokens = tpm
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.stats = {"calls": 0, "rate_limited": 0, "waited_sec": 0.0, "tokens": 0}
+
+    @property
+    def rpm(self):
+        return max(self.max_rpm * MIN_LIMIT_FACTOR, self.max_rpm * self.factor)
+
+    @property
+    def tpm(self):
+        return max(self.max_tpm * MIN_LIMIT_FACTOR, self.max_tpm * self.factor)
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def _try_acquire(self, tokens):
+        """획득하면 0, 아니면 기다려야 할 시간(초)을 반환"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            # 한 번의 요청이 버킷 크기보다 크면 버킷이 가득 찼을 때 통과시킴
+            tokens = min(tokens, self.tpm)
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                self.stats["calls"] += 1
+                self.stats["tokens"] += tokens
+                return 0.0
+
+            wait_requests = (1 - self._requests) * 60.0 / self.rpm if self._requests < 1 else 0.0
+            wait_tokens = (tokens - self._tokens) * 60.0 / self.tpm if self._tokens < tokens else 0.0
+            return max(wait_requests, wait_tokens, 0.01)
+
+    def acquire(self, tokens: int = 1):
+        """호출 전에 요청 1개 + 예상 토큰을 획득할 때까지 대기 (스레드용)"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            self.stats["waited_sec"] += wait
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 1):
+        """acquire의 asyncio 버전 (이벤트 루프를 막지 않음)"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            self.stats["waited_sec"] += wait
+            await asyncio.sleep(wait)
+
+    def headroom(self) -> float:
+        """지금 바로 쓸 수 있는 한도 비율 (0~1, 요청/토큰 버킷 중 작은 쪽, 일시 정지 중이면 0)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return 0.0
+            return max(0.0, min(self._requests / self.rpm, self._tokens / self.tpm))
+
+    def record_usage(self, estimated: int, actual: int | None):
+        """실제 사용 토큰이 추정보다 많으면 차이만큼 버킷에서 추가 차감"""
+        if actual is None:
+            return
+        with self._lock:
+            self._tokens -= actual - estimated
+            self.stats["tokens"] += actual - estimated
+
+    def on_success(self):
+        with self._lock:
+            self.factor = min(1.0, self.factor + RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after: float | None = None):
+        """429/ResourceExhausted 수신 시 한도 축소 + 일시 정지"""
+        with self._lock:
+            self.factor = max(MIN_LIMIT_FACTOR, self.factor * BACKOFF_FACTOR)
+            pause = retry_after if retry_after is not None else RATE_LIMITED_PAUSE_SEC
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._requests = min(self._requests, 0.0)
+            self.stats["rate_limited"] += 1
+        print(f"🚦 [{self.name}] 호출 한도 초과 -> {pause:.1f}초 정지, 한도 {self.rpm:.1f} RPM / {self.tpm:.0f} TPM로 축소")
+
+    def log_summary(self):
+        s = self.stats
+        print(f"🚦 [{self.name}] 호출 {s['calls']}회, 토큰 약 {s['tokens']}, "
+              f"한도 초과 {s['rate_limited']}회, 대기 합계 {s['waited_sec']:.1f}s")
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = "gemini") -> RateLimiter:
+    """프로세스 전역에서 이름(모델)별로 하나의 제한기를 공유"""
+    with _limiters_lock:
+        if name not in _limiters:
+            rpm, tpm = default_limits(name)
+            _limiters[name] = RateLimiter(rpm, tpm, name=name)
+        return _limiters[name]
@@ -0,0 +1,193 @@
+#%%
+# Gemini JSON 응답 스키마 (prompts.py의 출력 형식과 1:1 대응)
+###############################################################################################################################################################################
+
+import os
+import re
+
+import prompts
+
+# Configuration
+# schema: JSON 모드 + 응답 스키마 강제 | json: JSON 모드만 | off: 기존 방식(텍스트 응답)
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "schema").lower()
+
+TOPIC_TYPES = [
+    "shared_info", "decision_making", "operational_review", "problem_solving",
+    "planning", "team_building", "brainstorming", "retrospective",
+]
+DOMAINS = ['정치', '경제', '사회', '교육', '세계', '생활', '의료', '문화', '스포츠', '경영/재무', 'IT', '법률/행정']
+PROGRESS_STATUSES = ["Completed", "On Track", "At Risk", "Delayed", "Blocked"]
+
+
+def string(enum=None):
+    return {"type": "string", "enum": enum} if enum else {"type": "string"}
+
+
+def array(items):
+    return {"type": "array", "items": items}
+
+
+def obj(properties: dict, required=None):
+    """모든 속성을 필수로 두는 object 스키마 (프롬프트도 빈 값은 '' 또는 []로 채우도록 지시)"""
+    return {"type": "object", "properties": properties,
+            "required": list(properties) if required is None else required}
+
+
+STRINGS = array(string())
+
+# ==============================================================================
+# Step 2: TYPE_PROMPTS의 details 구조
+# ==============================================================================
+TOPIC_DETAILS = {
+    "shared_info": obj({
+        "presentation_summary": STRINGS,
+        "key_takeaways": STRINGS,
+        "qa_summary": array(obj({"question": string(), "answer": string()})),
+    }),
+    "decision_making": obj({
+        "decision_background": string(),
+        "discussed_alternatives": STRINGS,
+        "voting_results": array(obj({"item": string(), "votes": string()})),
+    }),
+    "operational_review": obj({
+        "progress_summary": array(obj({"item": string(), "status": string(PROGRESS_STATUSES), "note": string()})),
+        "blockers": STRINGS,
+        "next_period_plan": STRINGS,
+    }),
+    "problem_solving": obj({
+        "problem_definition": string(),
+        "root_cause_analysis": string(),
+        "solution_alternatives": STRINGS,
+    }),
+    "planning": obj({
+        "goals_objectives": STRINGS,
+        "roadmap_milestones": array(obj({"milestone": string(), "due_date": string()})),
+        "resource_allocation": string(),
+    }),
+    "team_building": obj({
+        "activity_summary": string(),
+        "team_feedback": STRINGS,
+    }),
+    "brainstorming": obj({
+        "idea_list": STRINGS,
+        "key_themes": array(obj({"theme": string(), "ideas": STRINGS})),
+        "next_steps": string(),
+    }),
+    "retrospective": obj({
+        "keep": STRINGS,
+        "problem": STRINGS,
+        "try": STRINGS,
+    }),
+}
+DEFAULT_DETAILS = obj({"summary": string()})
+
+
+def topic_schema(topic_type: str):
+    """STEP2_PREFIX_PROMPT 출력 형식 + 유형별 details"""
+    return obj({
+        "short_summary": string(),
+        "details": TOPIC_DETAILS.get(topic_type, DEFAULT_DETAILS),
+        "segment_decisions": STRINGS,
+        "segment_action_items": array(obj({"task": string(), "assignee": string(), "due_date": string()})),
+    })
+
+
+# ==============================================================================
+# Step 1 / 최종 통합 / Recap
+# ==============================================================================
+TOPIC_ITEM = obj({
+    "sub_topic": string(),
+    "type": string(TOPIC_TYPES),
+    "start_id": string(),
+    "end_id": string(),
+})
+
+STRUCTURE_SCHEMA = obj({
+    "main_topic": string(),
+    "domain": string(DOMAINS),
+    "topics": array(TOPIC_ITEM),
+})
+
+WINDOW_STRUCTURE_SCHEMA = obj({
+    "window_summary": string(),
+    "topics": array(TOPIC_ITEM),
+})
+
+STRUCTURE_MERGE_SCHEMA = STRUCTURE_SCHEMA
+SEGMENT_LABEL_SCHEMA = STRUCTURE_SCHEMA
+
+CONSOLIDATION_SCHEMA = obj({
+    "summary": string(),
+    "decisions": array(obj({"content": string(), "related_sub_topic_id": string()})),
+    "action_items": array(obj({
+        "task": string(), "assignee": string(), "due_date": string(), "related_sub_topic_id": string(),
+    })),
+})
+
+# RECAP_PROMPT / INCREMENTAL_RECAP_PROMPT 공용
+RECAP_SCHEMA = obj({
+    "current_topic": string(),
+    "summary_so_far": STRINGS,
+    "key_decisions": STRINGS,
+    "catch_up_tip": string(),
+})
+
+
+def json_config(schema, base: dict | None = None):
+    """
+    STRUCTURED_OUTPUT 설정에 따른 generation_config
+    (base에 temperature 등이 있으면 함께 유지, off면 base 그대로)
+    """
+    config = dict(base or {})
+    if STRUCTURED_OUTPUT in ("schema", "json"):
+        config["response_mime_type"] = "application/json"
+    if STRUCTURED_OUTPUT == "schema" and schema is not None:
+        config["response_schema"] = schema
+    return config or None
+
+
+# ==============================================================================
+# 프롬프트 <-> 스키마 동기화 확인 (prompts.py 수정 시 실행)
+# ==============================================================================
+def _property_names(schema):
+    names = set()
+    for name, sub in schema.get("properties", {}).items():
+        names.add(name)
+        names |= _property_names(sub)
+    if schema.get("type") == "array":
+        names |= _property_names(schema["items"])
+    return names
+
+
+def check_prompt_sync():
+    """각 프롬프트의 출력 형식에 나오는 키가 스키마와 일치하는지 확인하고 불일치 목록을 반환"""
+    pairs = [(f"TYPE_PROMPTS['{t}']", prompts.TYPE_PROMPTS[t], TOPIC_DETAILS.get(t)) for t in prompts.TYPE_PROMPTS]
+    pairs += [
+        ("DEFAULT_PROMPT", prompts.DEFAULT_PROMPT, DEFAULT_DETAILS),
+        ("CONSOLIDATION_PROMPT", prompts.CONSOLIDATION_PROMPT, CONSOLIDATION_SCHEMA),
+        ("STRUCTURE_PROMPT", prompts.STRUCTURE_PROMPT, STRUCTURE_SCHEMA),
+        ("WINDOW_STRUCTURE_PROMPT", prompts.WINDOW_STRUCTURE_PROMPT, WINDOW_STRUCTURE_SCHEMA),
+        ("STRUCTURE_MERGE_PROMPT", prompts.STRUCTURE_MERGE_PROMPT, STRUCTURE_MERGE_SCHEMA),
+        ("SEGMENT_LABEL_PROMPT", prompts.SEGMENT_LABEL_PROMPT, SEGMENT_LABEL_SCHEMA),
+        ("RECAP_PROMPT", prompts.RECAP_PROMPT, RECAP_SCHEMA),
+        ("INCREMENTAL_RECAP_PROMPT", prompts.INCREMENTAL_RECAP_PROMPT, RECAP_SCHEMA),
+    ]
+    problems = []
+    for name, prompt_text, schema in pairs:
+        if schema is None:
+            problems.append(f"{name}: 대응하는 스키마 없음")
+            continue
+        prompt_keys = set(re.findall(r'"([A-Za-z_]+)"\s*:', prompt_text))
+        schema_keys = _property_names(schema)
+        if prompt_keys - schema_keys:
+            problems.append(f"{name}: 스키마에 없는 키 {sorted(prompt_keys - schema_keys)}")
+        if schema_keys - prompt_keys:
+            problems.append(f"{name}: 프롬프트에 없는 키 {sorted(schema_keys - prompt_keys)}")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = check_prompt_sync()
+    for problem in problems:
+        print(f"⚠️ {problem}")
+    print("✅ 프롬프트와 스키마가 일치합니다." if not problems else f"❌ 불일치 {len(problems)}건")
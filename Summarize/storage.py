@@ -0,0 +1,522 @@
+#%%
+# 공용 객체 저장소 계층 (STT, Summarize 공용)
+# - STORAGE_BACKEND 설정으로 S3 / 로컬 디렉터리 / 인메모리 백엔드 선택 (키 구조는 동일)
+# - S3: 프로세스당 하나의 커넥션 풀 공유, aiobotocore가 있으면 네이티브 async 클라이언트
+# - 지터가 적용된 재시도, 작업별 지연 시간 메트릭
+###############################################################################################################################################################################
+
+import os
+import abc
+import time
+import random
+import asyncio
+import datetime
+import mimetypes
+import threading
+
+from dotenv import load_dotenv
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError
+    from boto3.s3.transfer import TransferConfig
+except ImportError:  # local/memory 백엔드만 쓰는 환경에서는 boto3 없이도 동작
+    boto3 = None
+
+try:
+    from aiobotocore.session import get_session as get_aio_session
+except ImportError:  # 선택 의존성: 없으면 스레드 풀로 동기 클라이언트 호출
+    get_aio_session = None
+
+# 아래 설정값과 compression 설정을 읽기 전에 .env 로드
+load_dotenv()
+
+import compression
+
+# Configuration
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()           # s3 | local | memory
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "storage_data")    # local 백엔드 루트 디렉터리
+BUCKET_NAME = os.getenv("AWS_BUCKET_NAME", "hedj-s3-1")   # S3 버킷 이름
+AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-2")
+MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = 0.2
+RETRY_MAX_SECONDS = 8.0
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+MULTIPART_CHUNK_BYTES = 8 * 1024 * 1024
+
+RETRYABLE_ERROR_CODES = {
+    "Throttling", "ThrottlingException", "SlowDown", "RequestTimeout",
+    "RequestTimeTooSkewed", "InternalError", "ServiceUnavailable", "500", "502", "503", "504",
+}
+NOT_FOUND_ERROR_CODES = {"NoSuchKey", "404", "NotFound"}
+
+
+class ObjectNotFound(KeyError):
+    """요청한 키의 객체가 저장소에 없음"""
+
+
+def _is_not_found(e):
+    if isinstance(e, (FileNotFoundError, ObjectNotFound)):
+        return True
+    return boto3 is not None and isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in NOT_FOUND_ERROR_CODES
+
+
+def _is_retryable(e):
+    if boto3 is None:
+        return False
+    if isinstance(e, (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError)):
+        return True
+    return isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
+
+def _body_size(result):
+    """get 결과 (본문, Content-Encoding)에서 전송 바이트 수 추출"""
+    if isinstance(result, tuple) and result and isinstance(result[0], bytes):
+        return len(result[0])
+    return 0
+
+
+def _backoff(attempt):
+    """Full jitter 지수 백오프 (attempt는 1부터)"""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+
+
+# ==============================================================================
+# 1. 작업별 지연 시간 메트릭
+# ==============================================================================
+class StorageMetrics:
+    """작업(put/get/head/list/upload)별 호출 수, 실패 수, 재시도 수, 지연 시간, 전송 바이트 집계"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {}
+
+    def reset(self):
+        with self._lock:
+            self.ops = {}
+
+    def record(self, op, seconds, ok=True, retries=0, nbytes=0):
+        with self._lock:
+            m = self.ops.setdefault(op, {"count": 0, "errors": 0, "retries": 0, "total_sec": 0.0,
+                                         "max_sec": 0.0, "bytes": 0})
+            m["count"] += 1
+            m["errors"] += 0 if ok else 1
+            m["retries"] += retries
+            m["total_sec"] += seconds
+            m["max_sec"] = max(m["max_sec"], seconds)
+            m["bytes"] += nbytes
+
+    def summary(self):
+        with self._lock:
+            return {
+                op: {**m, "avg_ms": round(m["total_sec"] / m["count"] * 1000, 1) if m["count"] else 0.0}
+                for op, m in self.ops.items()
+            }
+
+    def log_summary(self):
+        stats = self.summary()
+        if not stats:
+            return
+        print("📊 [Storage] 작업별 지연 시간")
+        for op, m in sorted(stats.items()):
+            print(f"   - {op}: {m['count']}회 (실패 {m['errors']}, 재시도 {m['retries']}), "
+                  f"평균 {m['avg_ms']}ms, 최대 {m['max_sec'] * 1000:.1f}ms, {m['bytes'] / 1024:.1f} KB")
+
+
+metrics = StorageMetrics()
+
+
+# ==============================================================================
+# 2. 백엔드 공통 인터페이스
+# ==============================================================================
+class StorageBackend(abc.ABC):
+    """
+    모든 저장소 백엔드의 공통 인터페이스
+    - 하위 클래스는 _put / _get / _head / _list 만 구현 (추상 메서드)
+    - 동기 메서드: Summarize 스크립트용 / a* 비동기 메서드: STT 에이전트(이벤트 루프)용
+    - 재시도, 메트릭, JSON 직렬화 + 압축은 여기서 공통 처리
+    """
+    name = "base"
+
+    @abc.abstractmethod
+    def _put(self, key, body, content_type, content_encoding):
+        """본문 바이트를 key에 저장"""
+
+    @abc.abstractmethod
+    def _get(self, key):
+        """(본문 바이트, Content-Encoding) 반환"""
+
+    @abc.abstractmethod
+    def _head(self, key):
+        """{"size", "content_type", "content_encoding", "last_modified"} 반환"""
+
+    @abc.abstractmethod
+    def _list(self, prefix, delimiter):
+        """prefix로 시작하는 키 목록 반환"""
+
+    def _upload_fileobj(self, fileobj, key, content_type, content_encoding):
+        fileobj.seek(0)
+        self._put(key, fileobj.read(), content_type, content_encoding)
+
+    # --------------------------------------------------------------------------
+    # 재시도 + 메트릭 래퍼
+    # --------------------------------------------------------------------------
+    def _call(self, op, fn, nbytes=0):
+        start = time.perf_counter()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                result = fn()
+                metrics.record(op, time.perf_counter() - start, True, attempt - 1, nbytes or _body_size(result))
+                return result
+            except Exception as e:
+                if _is_not_found(e):
+                    metrics.record(op, time.perf_counter() - start, True, attempt - 1)
+                    raise ObjectNotFound(key_of(e)) from e
+                if attempt == MAX_ATTEMPTS or not _is_retryable(e):
+                    metrics.record(op, time.perf_counter() - start, False, attempt - 1)
+                    raise
+                time.sleep(_backoff(attempt))
+
+    async def _acall(self, op, fn, nbytes=0):
+        start = time.perf_counter()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                result = await fn()
+                metrics.record(op, time.perf_counter() - start, True, attempt - 1, nbytes or _body_size(result))
+                return result
+            except Exception as e:
+                if _is_not_found(e):
+                    metrics.record(op, time.perf_counter() - start, True, attempt - 1)
+                    raise ObjectNotFound(key_of(e)) from e
+                if attempt == MAX_ATTEMPTS or not _is_retryable(e):
+                    metrics.record(op, time.perf_counter() - start, False, attempt - 1)
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+
+    # --------------------------------------------------------------------------
+    # 동기 API
+    # --------------------------------------------------------------------------
+    def put_object(self, key: str, body: bytes, content_type: str = "application/octet-stream",
+                   content_encoding: str | None = None):
+        self._call("put", lambda: self._put(key, body, content_type, content_encoding), nbytes=len(body))
+
+    def get_object(self, key: str):
+        """(본문 바이트, Content-Encoding) 반환. 없으면 ObjectNotFound"""
+        return self._call("get", lambda: self._get(key))
+
+    def head_object(self, key: str) -> dict:
+        """객체 메타데이터 반환. 없으면 ObjectNotFound"""
+        return self._call("head", lambda: self._head(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.head_object(key)
+            return True
+        except ObjectNotFound:
+            return False
+
+    def list_keys(self, prefix: str, delimiter: str | None = None):
+        """prefix 아래의 객체 키 목록 (delimiter를 주면 바로 아래 단계의 객체만)"""
+        return self._call("list", lambda: sorted(self._list(prefix, delimiter)))
+
+    def upload_fileobj(self, fileobj, key: str, content_type: str = "application/octet-stream",
+                       content_encoding: str | None = None):
+        self._call("upload", lambda: self._upload_fileobj(fileobj, key, content_type, content_encoding))
+
+    def put_json(self, key: str, data, indent=None):
+        body, content_encoding = compression.encode_json(data, indent=indent)
+        self.put_object(key, body, "application/json", content_encoding)
+
+    def get_json(self, key: str):
+        body, content_encoding = self.get_object(key)
+        return compression.decode_json(body, content_encoding)
+
+    # --------------------------------------------------------------------------
+    # 비동기 API (기본: 스레드 위임, S3 백엔드는 aiobotocore 사용 가능)
+    # --------------------------------------------------------------------------
+    async def aput_object(self, key: str, body: bytes, content_type: str = "application/octet-stream",
+                          content_encoding: str | None = None):
+        await asyncio.to_thread(self.put_object, key, body, content_type, content_encoding)
+
+    async def aget_object(self, key: str):
+        return await asyncio.to_thread(self.get_object, key)
+
+    async def ahead_object(self, key: str) -> dict:
+        return await asyncio.to_thread(self.head_object, key)
+
+    async def alist_keys(self, prefix: str, delimiter: str | None = None):
+        return await asyncio.to_thread(self.list_keys, prefix, delimiter)
+
+    async def aupload_fileobj(self, fileobj, key: str, content_type: str = "application/octet-stream",
+                              content_encoding: str | None = None):
+        await asyncio.to_thread(self.upload_fileobj, fileobj, key, content_type, content_encoding)
+
+    async def aput_json(self, key: str, data, indent=None):
+        body, content_encoding = await asyncio.to_thread(compression.encode_json, data, None, indent)
+        await self.aput_object(key, body, "application/json", content_encoding)
+
+    async def aget_json(self, key: str):
+        body, content_encoding = await self.aget_object(key)
+        return await asyncio.to_thread(compression.decode_json, body, content_encoding)
+
+    async def aclose(self):
+        pass
+
+
+def key_of(e):
+    return str(e.args[0]) if getattr(e, "args", None) else str(e)
+
+
+# ==============================================================================
+# 3. S3 백엔드
+# ==============================================================================
+def _client_config():
+    # 재시도는 공통 래퍼에서 지터와 함께 직접 처리하므로 botocore 재시도는 끔
+    return Config(
+        region_name=AWS_REGION,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={"total_max_attempts": 1, "mode": "standard"},
+    )
+
+
+class S3Backend(StorageBackend):
+    """S3 버킷 백엔드 (커넥션 풀을 공유하는 단일 boto3 클라이언트 + 선택적 aiobotocore)"""
+    name = "s3"
+
+    def __init__(self, bucket: str = BUCKET_NAME):
+        if boto3 is None:
+            raise RuntimeError("S3 백엔드를 사용하려면 boto3 패키지가 필요합니다.")
+        self.bucket = bucket
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._aio_clients = {}   # 이벤트 루프별 (aiobotocore 클라이언트 컨텍스트, 클라이언트)
+        self._aio_locks = {}     # 이벤트 루프별 클라이언트 생성 잠금 (동시 첫 호출이 클라이언트를 여러 개 만들지 않도록)
+        self._transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_BYTES,
+            multipart_chunksize=MULTIPART_CHUNK_BYTES,
+            use_threads=False,
+        )
+
+    @property
+    def client(self):
+        """동기 boto3 클라이언트 (스레드 안전, 커넥션 풀 공유)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = boto3.client("s3", config=_client_config())
+        return self._client
+
+    async def _aio_client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._aio_clients.get(loop)
+        if entry is None:
+            async with self._aio_locks.setdefault(loop, asyncio.Lock()):
+                entry = self._aio_clients.get(loop)
+                if entry is None:
+                    context = get_aio_session().create_client("s3", config=_client_config())
+                    entry = (context, await context.__aenter__())
+                    self._aio_clients[loop] = entry
+        return entry[1]
+
+    def _put(self, key, body, content_type, content_encoding):
+        extra = {"ContentEncoding": content_encoding} if content_encoding else {}
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type, **extra)
+
+    def _get(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return response["Body"].read(), response.get("ContentEncoding")
+
+    def _head(self, key):
+        response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return {
+            "size": response.get("ContentLength", 0),
+            "content_type": response.get("ContentType"),
+            "content_encoding": response.get("ContentEncoding"),
+            "last_modified": response.get("LastModified"),
+        }
+
+    def _list(self, prefix, delimiter):
+        paginator = self.client.get_paginator("list_objects_v2")
+        extra = {"Delimiter": delimiter} if delimiter else {}
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, **extra)
+            for obj in page.get("Contents", [])
+        ]
+
+    def _upload_fileobj(self, fileobj, key, content_type, content_encoding):
+        extra_args = {"ContentType": content_type}
+        if content_encoding:
+            extra_args["ContentEncoding"] = content_encoding
+        fileobj.seek(0)
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args, Config=self._transfer_config)
+
+    async def aput_object(self, key: str, body: bytes, content_type: str = "application/octet-stream",
+                          content_encoding: str | None = None):
+        if get_aio_session is None:
+            return await super().aput_object(key, body, content_type, content_encoding)
+
+        extra = {"ContentEncoding": content_encoding} if content_encoding else {}
+
+        async def put():
+            client = await self._aio_client()
+            await client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type, **extra)
+        await self._acall("put", put, nbytes=len(body))
+
+    async def aget_object(self, key: str):
+        if get_aio_session is None:
+            return await super().aget_object(key)
+
+        async def fetch():
+            client = await self._aio_client()
+            response = await client.get_object(Bucket=self.bucket, Key=key)
+            return await response["Body"].read(), response.get("ContentEncoding")
+        return await self._acall("get", fetch)
+
+    async def aclose(self):
+        """현재 이벤트 루프에 묶인 aiobotocore 클라이언트 정리 (생성할 때 연 컨텍스트를 닫음)"""
+        loop = asyncio.get_running_loop()
+        entry = self._aio_clients.pop(loop, None)
+        self._aio_locks.pop(loop, None)
+        if entry is not None:
+            await entry[0].__aexit__(None, None, None)
+
+
+# ==============================================================================
+# 4. 로컬 디렉터리 백엔드 (AWS 없는 환경의 오프라인 배치/벤치마크용)
+# ==============================================================================
+class LocalBackend(StorageBackend):
+    """
+    root 디렉터리 아래에 키 경로 그대로 파일로 저장
+    Content-Encoding은 별도로 기록하지 않고, 읽을 때 매직 바이트로 판별
+    """
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        self.root = os.path.abspath(root)
+        self.bucket = self.root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"잘못된 키: {key}")
+        return path
+
+    def _put(self, key, body, content_type, content_encoding):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+        with open(path, "rb") as f:
+            return f.read(), None
+
+    def _head(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+        stat = os.stat(path)
+        return {
+            "size": stat.st_size,
+            "content_type": mimetypes.guess_type(path)[0],
+            "content_encoding": None,
+            "last_modified": datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc),
+        }
+
+    def _list(self, prefix, delimiter):
+        keys = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if ".tmp" in filename:
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and not (delimiter and delimiter in key[len(prefix):]):
+                    keys.append(key)
+        return keys
+
+
+# ==============================================================================
+# 5. 인메모리 백엔드 (단일 프로세스 종단 간 테스트/처리량 측정용)
+# ==============================================================================
+class MemoryBackend(StorageBackend):
+    name = "memory"
+
+    def __init__(self):
+        self.bucket = "memory"
+        self.objects = {}   # key -> (body, content_type, content_encoding, last_modified)
+        self._lock = threading.Lock()
+
+    def _put(self, key, body, content_type, content_encoding):
+        with self._lock:
+            self.objects[key] = (bytes(body), content_type, content_encoding,
+                                 datetime.datetime.now(datetime.timezone.utc))
+
+    def _get(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise ObjectNotFound(key)
+            body, _, content_encoding, _ = self.objects[key]
+        return body, content_encoding
+
+    def _head(self, key):
+        with self._lock:
+            if key not in self.objects:
+                raise ObjectNotFound(key)
+            body, content_type, content_encoding, last_modified = self.objects[key]
+        return {"size": len(body), "content_type": content_type,
+                "content_encoding": content_encoding, "last_modified": last_modified}
+
+    def _list(self, prefix, delimiter):
+        with self._lock:
+            keys = list(self.objects)
+        return [k for k in keys if k.startswith(prefix) and not (delimiter and delimiter in k[len(prefix):])]
+
+
+# ==============================================================================
+# 6. 설정 기반 백엔드 선택
+# ==============================================================================
+BACKENDS = {"s3": S3Backend, "local": LocalBackend, "memory": MemoryBackend}
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def create_backend(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend not in BACKENDS:
+        raise ValueError(f"지원하지 않는 저장소 백엔드: {backend} (선택지: {', '.join(BACKENDS)})")
+    return BACKENDS[backend]()
+
+
+def get_storage_client() -> StorageBackend:
+    """프로세스 전역에서 공유하는 저장소 백엔드 (STORAGE_BACKEND 기준, 최초 호출 시 생성)"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = create_backend()
+    return _shared_client
+
+
+async def aclose_storage_client():
+    """공용 백엔드가 만들어져 있으면 현재 이벤트 루프의 비동기 클라이언트 정리 (루프 종료 전에 호출)"""
+    if _shared_client is not None:
+        await _shared_client.aclose()
+
+
+def set_storage_client(backend: StorageBackend):
+    """공용 백엔드를 교체 (벤치마크/오프라인 배치에서 인메모리 백엔드 주입용)"""
+    global _shared_client
+    with _shared_lock:
+        _shared_client = backend
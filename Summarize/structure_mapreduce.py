@@ -0,0 +1,264 @@
+#%%
+# 긴 회의용 계층적 구조 분석 (Step 1 map-reduce)
+###############################################################################################################################################################################
+
+import os
+import json
+import time
+import asyncio
+
+import prompts
+import schemas
+import rate_limiter
+
+# Configuration
+# single: 항상 한 번에 호출 | hierarchical: 항상 구간 분할 | auto: 프롬프트가 STRUCTURE_SINGLE_MAX_TOKENS를 넘으면 분할
+STRUCTURE_WINDOWING = os.getenv("STRUCTURE_WINDOWING", "auto").lower()
+STRUCTURE_SINGLE_MAX_TOKENS = int(os.getenv("STRUCTURE_SINGLE_MAX_TOKENS", "80000"))    # auto 모드에서 단일 호출을 허용하는 최대 추정 토큰
+STRUCTURE_WINDOW_TOKENS = int(os.getenv("STRUCTURE_WINDOW_TOKENS", "20000"))            # 구간(window) 하나의 대화 추정 토큰
+STRUCTURE_WINDOW_OVERLAP = int(os.getenv("STRUCTURE_WINDOW_OVERLAP", "20"))             # 인접 구간끼리 겹치는 발화 수
+STRUCTURE_WINDOW_CONCURRENCY = int(os.getenv("STRUCTURE_WINDOW_CONCURRENCY", "4"))      # 구간 분석 동시 호출 수 (실제 속도는 rate_limiter가 조절)
+STRUCTURE_MERGE_MIN_FILL = int(os.getenv("STRUCTURE_MERGE_MIN_FILL", "5"))             # 병합 결과가 빠뜨린 구간이 이보다 짧으면(발화 수) 새 토픽 대신 인접 토픽을 늘림
+FAILED_WINDOW_TOPIC = "구조 분석 실패 구간"                                               # 구간 분석이 실패했을 때 Step 2에서라도 다루도록 넣는 임시 토픽 제목
+
+
+def choose_mode(prompt_tokens: int) -> str:
+    """STRUCTURE_WINDOWING 설정과 단일 호출 프롬프트의 추정 토큰으로 구조 분석 방식 결정"""
+    if STRUCTURE_WINDOWING in ("single", "hierarchical"):
+        return STRUCTURE_WINDOWING
+    return "hierarchical" if prompt_tokens > STRUCTURE_SINGLE_MAX_TOKENS else "single"
+
+
+def split_windows(index, window_tokens: int = STRUCTURE_WINDOW_TOKENS, overlap: int = STRUCTURE_WINDOW_OVERLAP):
+    """
+    구조 분석용 대화 줄(이름 라벨, 압축 시 합친 줄)을 추정 토큰 기준으로 겹치는 구간으로 나눔
+    - 각 구간: 발화 목록 위치 [start, end), 중복 제거 기준이 되는 담당 범위 [core_start, core_end)
+    - 담당 범위는 겹치는 부분의 가운데에서 나뉘므로 모든 발화는 정확히 한 구간이 담당
+    """
+    units = index.units(0, None, "name")
+    if not units:
+        return []
+    costs = [rate_limiter.estimate_tokens(text) for _, _, text in units]
+
+    ranges = []
+    k = 0
+    while k < len(units):
+        tokens = 0
+        j = k
+        while j < len(units) and (j == k or tokens + costs[j] <= window_tokens):
+            tokens += costs[j]
+            j += 1
+        ranges.append((k, j))
+        if j >= len(units):
+            break
+        # 다음 구간은 overlap개 줄을 겹쳐 시작 (최소 1개는 전진)
+        k = max(k + 1, j - overlap)
+
+    windows = []
+    for no, (k, j) in enumerate(ranges):
+        core_k = k if no == 0 else (k + ranges[no - 1][1]) // 2
+        core_j = j if no == len(ranges) - 1 else (ranges[no + 1][0] + j) // 2
+        windows.append({
+            "no": no + 1,
+            "start": units[k][0],
+            "end": units[j - 1][1] + 1,
+            "core_start": units[core_k][0],
+            "core_end": units[core_j][0] if core_j < len(units) else len(index),
+            "core_first_id": index.utterances[units[core_k][0]].get('id'),
+            "core_last_id": index.utterances[units[core_j - 1][1]].get('id'),
+            "first_id": index.utterances[units[k][0]].get('id'),
+            "last_id": index.utterances[units[j - 1][1]].get('id'),
+            "text": "\n".join(text for _, _, text in units[k:j]),
+        })
+    return windows
+
+
+def reconcile_topics(index, topics, lo: int = 0, hi: int | None = None):
+    """
+    토픽 목록을 발화 위치 기준으로 정리
+    - 존재하지 않는 ID의 토픽은 제외, [lo, hi) 범위로 자르기
+    - 시작 순으로 정렬하고 앞 토픽과 겹치는 부분은 뒤 토픽에서 잘라냄 (완전히 포함되면 제외)
+    - ID는 STRUCTURE_PROMPT 출력과 같은 문자열 형식으로 반환 (압축 줄의 범위 ID '12-15'도 실제 발화 ID로 바꿈)
+    """
+    hi = len(index) if hi is None else hi
+    placed = []
+    for topic in topics:
+        start = index.index_of(topic.get('start_id'))
+        end = index.index_of(topic.get('end_id'), end=True)
+        if start is None or end is None:
+            print(f"⚠️ [Step 1] 존재하지 않는 ID의 토픽 제외: {topic.get('sub_topic')} ({topic.get('start_id')} ~ {topic.get('end_id')})")
+            continue
+        start, end = max(min(start, end), lo), min(max(start, end), hi - 1)
+        if start <= end:
+            placed.append((start, end, topic))
+
+    placed.sort(key=lambda x: (x[0], -x[1]))
+    result = []
+    last_end = -1
+    for start, end, topic in placed:
+        start = max(start, last_end + 1)
+        if start > end:
+            continue
+        result.append(dict(topic, start_id=str(index.utterances[start].get('id')),
+                           end_id=str(index.utterances[end].get('id'))))
+        last_end = end
+    return result
+
+
+async def analyze_window(window, window_count, participants_str, generate_json):
+    """
+    구간 하나의 세부 주제 추출 (끝내 실패하면 None)
+    generate_json(prompt, schema, label, task): 파싱된 JSON을 반환하는 호출 함수 (JSON이 깨지면 그 호출만 다시 요청, task는 model_router 작업 유형)
+    """
+    prompt_text = prompts.WINDOW_STRUCTURE_PROMPT.format(
+        window_no=window['no'],
+        window_count=window_count,
+        first_id=window['first_id'],
+        last_id=window['last_id'],
+        participants=participants_str,
+        conversation=window['text'],
+    )
+    try:
+        return await generate_json(prompt_text, schemas.WINDOW_STRUCTURE_SCHEMA, f"구조 분석 구간 {window['no']}/{window_count}",
+                                   "structure_window")
+    except json.JSONDecodeError as e:
+        print(f"⚠️ [Step 1] 구간 {window['no']}/{window_count} 응답 파싱 실패: {e}")
+    except Exception as e:
+        print(f"❌ [Step 1] 구간 {window['no']}/{window_count} 분석 실패: {e}")
+    return None
+
+
+def collect_candidates(index, windows, results):
+    """
+    구간별 결과 -> 회의 전체의 후보 토픽 목록
+    - 토픽의 가운데 발화가 그 구간의 담당 범위에 있을 때만 채택 (겹치는 구간의 중복 제거)
+    - 분석에 실패한 구간은 담당 범위 전체를 임시 토픽으로 채워 Step 2에서 누락되지 않게 함
+    """
+    candidates = []
+    for window, result in zip(windows, results):
+        if result is None:
+            candidates.append({
+                "sub_topic": f"{FAILED_WINDOW_TOPIC} #{window['no']}",
+                "type": "shared_info",
+                "start_id": window['core_first_id'],
+                "end_id": window['core_last_id'],
+            })
+            continue
+
+        for topic in reconcile_topics(index, result.get('topics', []), window['start'], window['end']):
+            mid = (index.index_of(topic['start_id']) + index.index_of(topic['end_id'], end=True)) // 2
+            if window['core_start'] <= mid < window['core_end']:
+                candidates.append(topic)
+
+    return reconcile_topics(index, candidates)
+
+
+def fill_gaps(index, topics, candidates):
+    """
+    병합 결과가 후보 토픽이 다루던 발화를 빠뜨렸으면 그 부분을 후보 토픽으로 채움
+    (병합 호출은 대화 원문 없이 구간 요약만 보므로 후보를 누락하거나 범위를 줄일 수 있음)
+    - 빠진 구간은 해당 후보 토픽(제목/유형 유지)을 그 구간으로 잘라 추가
+    - STRUCTURE_MERGE_MIN_FILL보다 짧은 구간은 바로 앞(없으면 뒤) 토픽을 늘려 흡수
+    반환: (정리된 토픽 목록, 채운 발화 수)
+    """
+    spans = [[index.index_of(t['start_id']), index.index_of(t['end_id'], end=True), t] for t in topics]
+    covered = [False] * len(index)
+    for start, end, _ in spans:
+        covered[start:end + 1] = [True] * (end - start + 1)
+
+    added = []
+    missing = 0
+    for candidate in candidates:
+        k = index.index_of(candidate['start_id'])
+        end = index.index_of(candidate['end_id'], end=True)
+        while k <= end:
+            if covered[k]:
+                k += 1
+                continue
+            j = k
+            while j < end and not covered[j + 1]:
+                j += 1
+            missing += j - k + 1
+            covered[k:j + 1] = [True] * (j - k + 1)
+            before = next((span for span in spans if span[1] == k - 1), None)
+            after = next((span for span in spans if span[0] == j + 1), None)
+            if j - k + 1 < STRUCTURE_MERGE_MIN_FILL and (before or after):
+                if before:
+                    before[1] = j
+                else:
+                    after[0] = k
+            else:
+                spans.append([k, j, candidate])
+            k = j + 1
+
+    if not missing:
+        return topics, 0
+    filled = [dict(t, start_id=str(index.utterances[start].get('id')), end_id=str(index.utterances[end].get('id')))
+              for start, end, t in spans]
+    return reconcile_topics(index, filled), missing
+
+
+async def analyze_hierarchical(index, metadata_str, participants_str, generate_json):
+    """
+    긴 회의의 구조 분석 (map-reduce)
+    1. 대화를 겹치는 구간으로 나눠 구간별 세부 주제를 동시에 추출 (map)
+    2. 겹치는 구간의 중복 제거 + ID 정리로 후보 토픽 목록 생성
+    3. 구간 요약과 후보 목록만(대화 원문 없이) 다시 보내 main_topic/domain 결정 및 경계에서 잘린 주제 병합 (reduce)
+       병합 결과가 후보 토픽의 구간을 빠뜨리면 그 부분은 후보 토픽으로 채움 (Step 2에서 누락되지 않게)
+    반환 형식은 STRUCTURE_PROMPT 응답과 같음: {main_topic, domain, topics}
+    """
+    started = time.perf_counter()
+    windows = split_windows(index)
+    if not windows:
+        raise ValueError("구조 분석할 발화가 없습니다.")
+    print(f"🧩 [Step 1] 계층적 구조 분석: 발화 {len(index)}개 -> 구간 {len(windows)}개 "
+          f"(구간당 약 {STRUCTURE_WINDOW_TOKENS} 토큰, 겹침 {STRUCTURE_WINDOW_OVERLAP}발화)")
+
+    semaphore = asyncio.Semaphore(STRUCTURE_WINDOW_CONCURRENCY)
+
+    async def run_window(window):
+        async with semaphore:
+            return await analyze_window(window, len(windows), participants_str, generate_json)
+
+    results = await asyncio.gather(*(run_window(w) for w in windows))
+    failed = sum(1 for r in results if r is None)
+    if failed == len(windows):
+        raise RuntimeError("모든 구간의 구조 분석에 실패했습니다.")
+
+    candidates = collect_candidates(index, windows, results)
+    print(f"🧩 [Step 1] 구간 분석 완료: 후보 토픽 {len(candidates)}개, 실패 구간 {failed}개 "
+          f"({time.perf_counter() - started:.2f}s)")
+
+    windows_summary = [
+        {
+            "window": w['no'],
+            "id_range": f"{w['first_id']} ~ {w['last_id']}",
+            "window_summary": (r or {}).get('window_summary', ''),
+        }
+        for w, r in zip(windows, results)
+    ]
+    merge_prompt = prompts.STRUCTURE_MERGE_PROMPT.format(
+        metadata=metadata_str,
+        windows_json=json.dumps({"windows": windows_summary, "candidate_topics": candidates}, ensure_ascii=False, indent=2),
+    )
+
+    try:
+        merged = await generate_json(merge_prompt, schemas.STRUCTURE_MERGE_SCHEMA, "구조 병합", "structure_merge")
+        topics = reconcile_topics(index, merged.get('topics', []))
+        if not topics:
+            raise ValueError("병합 결과에 유효한 토픽이 없습니다.")
+        topics, missing = fill_gaps(index, topics, candidates)
+        if missing:
+            print(f"⚠️ [Step 1] 병합 결과가 빠뜨린 발화 {missing}개를 후보 토픽으로 채움")
+        merged['topics'] = topics
+    except Exception as e:
+        # 병합 호출이 실패해도 구간 분석 결과(후보 목록)는 그대로 사용
+        print(f"⚠️ [Step 1] 토픽 병합 실패 -> 후보 토픽 목록을 그대로 사용: {e}")
+        merged = {
+            "main_topic": next((s['window_summary'] for s in windows_summary if s['window_summary']), ''),
+            "domain": '',
+            "topics": candidates,
+        }
+
+    print(f"🧩 [Step 1] 계층적 구조 분석 완료: 토픽 {len(merged['topics'])}개 ({time.perf_counter() - started:.2f}s)")
+    return merged
@@ -0,0 +1,121 @@
+#%%
+# 회의록 요약 워커 풀 (job_queue에서 작업을 받아 S3_Summarization 실행)
+###############################################################################################################################################################################
+
+import os
+import time
+import asyncio
+import argparse
+
+import storage
+import llm_client
+import model_router
+import job_queue
+import prompt_builder
+import S3_Summarization
+
+# Configuration
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))               # 프로세스당 동시에 처리할 작업 수
+WORKER_POLL_SEC = float(os.getenv("SUMMARY_WORKER_POLL_SEC", "5"))     # 대기열이 비었을 때 다시 확인하는 주기
+HEARTBEAT_SEC = job_queue.JOB_LEASE_SEC / 3                            # 점유 기한 연장 주기
+
+
+async def heartbeat(queue, job, worker_id, task, lost):
+    """작업을 처리하는 동안 점유 기한을 주기적으로 연장, 점유를 잃으면 요약 작업을 취소"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_SEC)
+        if not await asyncio.to_thread(queue.heartbeat, job["id"], worker_id):
+            print(f"⚠️ [Worker {worker_id}] #{job['id']} 점유를 잃었습니다 (다른 워커가 가져감) -> 요약 중단")
+            lost.set()
+            task.cancel()
+            return
+
+
+async def process_job(queue, job, worker_id):
+    file_id = job["file_id"]
+    room_name = job["room_name"]
+    print(f"🛠️ [Worker {worker_id}] #{job['id']} {file_id} 시작 (시도 {job['attempts']}/{job['max_attempts']})")
+
+    if room_name:
+        await asyncio.to_thread(S3_Summarization.update_session_status, room_name, "IN_PROGRESS")
+
+    started = time.perf_counter()
+    lost = asyncio.Event()
+    summary = asyncio.create_task(S3_Summarization.summarize_meeting(file_id))
+    beat = asyncio.create_task(heartbeat(queue, job, worker_id, summary, lost))
+    try:
+        failed_stage = await summary
+    except asyncio.CancelledError:
+        if not lost.is_set():
+            raise
+        print(f"🛑 [Worker {worker_id}] #{job['id']} {file_id} 중단 (상태는 새로 가져간 워커가 기록)")
+        return
+    except Exception as e:
+        failed_stage = f"error: {e}"
+    finally:
+        beat.cancel()
+
+    elapsed = time.perf_counter() - started
+    if failed_stage is None:
+        if not await asyncio.to_thread(queue.complete, job["id"], worker_id):
+            print(f"⚠️ [Worker {worker_id}] #{job['id']} {file_id} 완료했지만 점유를 잃어 상태를 기록하지 않음 ({elapsed:.1f}s)")
+            return
+        if room_name:
+            await asyncio.to_thread(S3_Summarization.update_session_status, room_name, "COMPLETED")
+        since_hangup = f", 전원 퇴장 -> COMPLETED {time.time() - job['hangup_at']:.1f}s" if job.get("hangup_at") else ""
+        print(f"✅ [Worker {worker_id}] #{job['id']} {file_id} 완료 ({elapsed:.1f}s{since_hangup})")
+        return
+
+    retry = await asyncio.to_thread(queue.fail, job["id"], worker_id, f"{failed_stage} 단계 실패")
+    if retry is None:
+        print(f"⚠️ [Worker {worker_id}] #{job['id']} {file_id} {failed_stage} 단계 실패, 점유를 잃어 상태를 기록하지 않음")
+        return
+    print(f"❌ [Worker {worker_id}] #{job['id']} {file_id} {failed_stage} 단계 실패 ({elapsed:.1f}s) -> "
+          f"{'재시도 예약' if retry else '최대 시도 횟수 초과, failed 처리'}")
+
+
+async def worker_loop(queue, worker_id, stop_when_empty=False):
+    while True:
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            if stop_when_empty:
+                return
+            await asyncio.sleep(WORKER_POLL_SEC)
+            continue
+        await process_job(queue, job, worker_id)
+
+
+async def run_workers(num_workers=SUMMARY_WORKERS, stop_when_empty=False):
+    """
+    num_workers개의 워커를 한 프로세스에서 실행
+    - 같은 프로세스의 워커는 Gemini RPM/TPM 제한기를 공유
+    - 처리량이 부족하면 이 스크립트를 여러 프로세스/서버에서 실행 (같은 큐 파일 공유)
+    """
+    queue = job_queue.get_job_queue()
+    base_id = job_queue.default_worker_id()
+    print(f"👷 요약 워커 {num_workers}개 시작 (큐: {queue.path}, 대기 작업: {queue.counts()})")
+    try:
+        await asyncio.gather(*(
+            worker_loop(queue, f"{base_id}/{i}", stop_when_empty) for i in range(num_workers)
+        ))
+    finally:
+        model_router.log_summary()
+        llm_client.log_json_summary()
+        prompt_builder.log_summary()
+        await storage.aclose_storage_client()
+        print(f"👷 요약 워커 종료 (큐 상태: {queue.counts()})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="요약 작업 큐 워커")
+    parser.add_argument("--workers", type=int, default=SUMMARY_WORKERS, help="동시에 처리할 작업 수")
+    parser.add_argument("--once", action="store_true", help="대기열이 비면 종료 (배치/크론용)")
+    args = parser.parse_args()
+
+    llm_client.configure()
+    try:
+        asyncio.run(run_workers(args.workers, stop_when_empty=args.once))
+    except KeyboardInterrupt:
+        print("🛑 워커 중단 (진행 중이던 작업은 점유 기한이 지나면 다시 처리됨)")
+    finally:
+        storage.metrics.log_summary()
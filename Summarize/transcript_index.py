@@ -0,0 +1,338 @@
+#%%
+# 회의록 발화 인덱스 (구조 분석, 토픽 구간 추출, Recap 공용)
+###############################################################################################################################################################################
+
+import os
+import re
+import time
+import bisect
+import argparse
+import itertools
+from collections import OrderedDict
+
+import rate_limiter
+
+# Configuration
+INDEX_CACHE_SIZE = 8    # 최근 회의 몇 개의 인덱스를 메모리에 유지할지
+# 프롬프트용 대화 압축: 같은 화자의 연속 발화를 '[ID: 12-15] 화자: ...' 한 줄로 합치고 필러/환각 문구/중복 제거 (on | off)
+TRANSCRIPT_COMPACTION = os.getenv("TRANSCRIPT_COMPACTION", "on").lower() != "off"
+COMPACT_MAX_LINE_CHARS = int(os.getenv("COMPACT_MAX_LINE_CHARS", "600"))   # 합친 줄 하나의 최대 글자 수 (넘으면 새 줄로 시작)
+COMPACT_REPEAT_LIMIT = 3                                                   # 같은 단어가 이 횟수 이상 연속 반복되면 한 번으로 줄임
+
+# 발화 전체가 이 단어들로만 이루어져 있으면 제거 ('네', '예'처럼 대답이 되는 말은 남김)
+FILLER_WORDS = {"음", "음음", "어", "어어", "아", "에", "으", "흠", "엄", "그", "저", "뭐", "막", "이제", "그러니까", "그니까", "저기"}
+# Whisper가 무음/잡음 구간에서 자주 만들어 내는 문구 (발화 전체가 일치할 때만 제거)
+HALLUCINATION_PATTERNS = [re.compile(p) for p in (
+    r"(시청|청취)\s*해\s*주셔서\s*(정말\s*)?감사(합니다|드립니다)",
+    r"구독\s*(과|,)?\s*좋아요.*",
+    r"다음\s*(영상|시간)에(서)?\s*(만나요|뵙겠습니다)",
+    r"(MBC|KBS|SBS|YTN|JTBC)\s*뉴스.*",
+    r"자막\s*(제공|제작|by).*",
+    r"(thank\s*you\s*for\s*watching|thanks\s*for\s*watching)",
+)]
+_PUNCT = re.compile(r"[\s.,!?~…·\-]+")
+
+
+def normalize_id(u_id):
+    """'12'와 12를 같은 ID로 취급 (기존 str() 비교와 동일한 의미)"""
+    try:
+        return int(u_id)
+    except (TypeError, ValueError):
+        return u_id
+
+
+def clean_content(content):
+    """
+    압축용 발화 정리: 공백 정규화 + 연속 반복 단어 축약
+    반환: (정리된 내용, None) 또는 제거할 발화면 (None, 사유: empty | filler | hallucination)
+    """
+    collapsed = []
+    for word, group in itertools.groupby(str(content or "").split()):
+        repeats = len(list(group))
+        # 반복 루프(예: '감사합니다 감사합니다 감사합니다 ...')는 한 번만 남김
+        collapsed.extend([word] * (1 if repeats >= COMPACT_REPEAT_LIMIT else repeats))
+    text = " ".join(collapsed)
+
+    bare = _PUNCT.sub(" ", text).strip()
+    if not bare:
+        return None, "empty"
+    if all(word in FILLER_WORDS for word in bare.split()):
+        return None, "filler"
+    if any(pattern.fullmatch(bare) for pattern in HALLUCINATION_PATTERNS):
+        return None, "hallucination"
+    return text, None
+
+
+class TranscriptIndex:
+    """
+    회의 하나의 발화 목록에 대해 한 번만 만들어 두는 인덱스
+    - '[ID: n] 화자: 내용' 줄을 미리 렌더링해 두고 (라벨 방식별로 한 번씩)
+    - 발화 ID -> 목록 위치 맵으로 구간을 O(구간 길이) 슬라이싱으로 추출
+    라벨 방식
+    - "name": 참가자 이름 (구조 분석, Recap용). 화자/내용/ID가 빠진 발화는 제외
+    - "user_id": USER_ID 그대로 (토픽 상세 분석용). 모든 발화 포함
+    압축(compact)을 쓰면 프롬프트에 넣는 줄(units)은 같은 화자의 연속 발화를 합친 '[ID: 12-15] 화자: ...' 형식이고,
+    필러/환각 문구/같은 화자의 중복 발화는 빠짐 (index_of는 '12-15' 같은 범위 ID도 원래 발화 위치로 변환)
+    """
+    def __init__(self, meeting_log_data, compact: bool = TRANSCRIPT_COMPACTION):
+        self.utterances = meeting_log_data.get('utterances', [])
+        participants = meeting_log_data.get('participants', [])
+        self.speaker_map = {p['USER_ID']: p.get('name', f"P{i:02d}") for i, p in enumerate(participants)}
+
+        self.ids = [normalize_id(u.get('id')) for u in self.utterances]
+        self.id_to_index = {}
+        for i, u_id in enumerate(self.ids):
+            self.id_to_index.setdefault(u_id, i)
+
+        self.compact = compact
+        self._lines = {}
+        self._compacted = {}
+
+    def __len__(self):
+        return len(self.utterances)
+
+    def lines(self, label: str = "name"):
+        """발화 목록과 같은 길이의 렌더링된 줄 목록 (제외된 발화는 None)"""
+        if label not in self._lines:
+            if label == "name":
+                rendered = [
+                    f"[ID: {u.get('id')}] {self.speaker_map.get(u.get('USER_ID'), u.get('USER_ID'))}: {u.get('content')}"
+                    if u.get('USER_ID') and u.get('content') and u.get('id') else None
+                    for u in self.utterances
+                ]
+            elif label == "user_id":
+                rendered = [
+                    f"[ID: {u.get('id')}] {u.get('USER_ID', 'Unknown')}: {u.get('content', '')}"
+                    for u in self.utterances
+                ]
+            else:
+                raise ValueError(f"지원하지 않는 라벨 방식: {label}")
+            self._lines[label] = rendered
+        return self._lines[label]
+
+    def index_of(self, u_id, end: bool = False):
+        """발화 ID -> 목록 위치 (압축 줄의 범위 ID '12-15'는 end면 마지막, 아니면 첫 ID 기준)"""
+        pos = self.id_to_index.get(normalize_id(u_id))
+        if pos is None and isinstance(u_id, str) and "-" in u_id:
+            first, _, last = u_id.partition("-")
+            pos = self.id_to_index.get(normalize_id((last if end else first).strip()))
+        return pos
+
+    def _compact_view(self, label: str):
+        """라벨별로 한 번만 계산: 위치별 정리된 내용(제거되면 None), 위치별 합칠 줄 번호, 제거 통계"""
+        if label not in self._compacted:
+            raw = self.lines(label)
+            contents = [None] * len(raw)
+            runs = [0] * len(raw)
+            stats = {"empty": 0, "filler": 0, "hallucination": 0, "duplicate": 0}
+            run, run_chars = -1, 0
+            prev_speaker = prev_content = None
+            for i, u in enumerate(self.utterances):
+                if raw[i] is None:
+                    continue
+                content, reason = clean_content(u.get('content', ''))
+                if content is None:
+                    stats[reason] += 1
+                    continue
+                speaker = u.get('USER_ID')
+                if speaker == prev_speaker and content == prev_content:
+                    stats["duplicate"] += 1
+                    continue
+                if speaker != prev_speaker or run_chars + len(content) > COMPACT_MAX_LINE_CHARS:
+                    run, run_chars = run + 1, 0
+                contents[i], runs[i] = content, run
+                run_chars += len(content) + 1
+                prev_speaker, prev_content = speaker, content
+            self._compacted[label] = (contents, runs, stats)
+        return self._compacted[label]
+
+    def _speaker(self, u, label: str):
+        if label == "name":
+            return self.speaker_map.get(u.get('USER_ID'), u.get('USER_ID'))
+        return u.get('USER_ID', 'Unknown')
+
+    def units(self, start: int = 0, stop: int | None = None, label: str = "name"):
+        """
+        목록 위치 [start, stop) 범위의 프롬프트 줄 목록 [(첫 위치, 마지막 위치, 줄)]
+        - 압축을 쓰지 않으면 발화 하나가 한 줄 (제외된 발화는 빠짐)
+        - 압축을 쓰면 범위 안의 같은 화자 연속 발화를 한 줄로 합침 (범위 경계에서는 잘라서 합침)
+        """
+        stop = len(self.utterances) if stop is None else min(stop, len(self.utterances))
+        start = max(0, start)
+        if not self.compact:
+            lines = self.lines(label)
+            return [(i, i, lines[i]) for i in range(start, stop) if lines[i] is not None]
+
+        contents, runs, _ = self._compact_view(label)
+        units = []
+        group = []
+        for i in range(start, stop + 1):
+            if i < stop and contents[i] is None:
+                continue
+            if group and (i == stop or runs[i] != runs[group[0]]):
+                first, last = group[0], group[-1]
+                first_id, last_id = self.utterances[first].get('id'), self.utterances[last].get('id')
+                id_label = first_id if first == last else f"{first_id}-{last_id}"
+                text = " ".join(contents[p] for p in group)
+                units.append((first, last, f"[ID: {id_label}] {self._speaker(self.utterances[first], label)}: {text}"))
+                group = []
+            if i < stop:
+                group.append(i)
+        return units
+
+    def compaction_report(self, label: str = "name") -> dict:
+        """압축 전/후 줄 수와 추정 토큰 (압축을 쓰지 않으면 전후가 같음)"""
+        raw = [line for line in self.lines(label) if line is not None]
+        units = self.units(0, None, label)
+        report = {
+            "utterances": len(raw),
+            "lines": len(units),
+            "raw_tokens": sum(rate_limiter.estimate_tokens(line) for line in raw),
+            "compact_tokens": sum(rate_limiter.estimate_tokens(text) for _, _, text in units),
+        }
+        if self.compact:
+            report.update(self._compact_view(label)[2])
+        return report
+
+    def segment(self, start_id, end_id, buffer: int = 0, label: str = "user_id") -> str:
+        """
+        start_id ~ end_id 구간 + 앞뒤 buffer개 발화를 줄바꿈으로 이어 반환
+        ID를 찾지 못하면 빈 문자열
+        """
+        start_idx = self.index_of(start_id)
+        end_idx = self.index_of(end_id, end=True)
+        if start_idx is None or end_idx is None:
+            return ""
+
+        real_start = max(0, start_idx - buffer)
+        real_end = min(len(self.utterances), end_idx + 1 + buffer)
+        return "\n".join(text for _, _, text in self.units(real_start, real_end, label))
+
+    def conversation_lines(self, end_id=None, after_id=None, label: str = "name"):
+        """
+        처음(또는 after_id 다음)부터 end_id까지의 줄 목록
+        end_id를 찾지 못하면 경고 후 끝까지 포함
+        """
+        stop = len(self.utterances)
+        if end_id:
+            end_idx = self.index_of(end_id, end=True)
+            if end_idx is None:
+                print(f"⚠️ 경고: 지정된 Cut-off ID ({end_id})를 찾지 못했습니다. 전체 내용을 사용합니다.")
+            else:
+                stop = end_idx + 1
+
+        start = 0
+        if after_id is not None:
+            # 저널의 발화 ID는 증가 순서이므로 이진 탐색
+            start = bisect.bisect_right(self.ids, normalize_id(after_id), 0, stop)
+
+        return [text for _, _, text in self.units(start, stop, label)]
+
+    def text(self, end_id=None, after_id=None, label: str = "name") -> str:
+        return "\n".join(self.conversation_lines(end_id, after_id, label))
+
+
+_index_cache = OrderedDict()
+
+
+def get_index(meeting_log_data) -> TranscriptIndex:
+    """
+    같은 회의 데이터(같은 utterances 리스트 객체)에 대해서는 인덱스를 한 번만 생성
+    (구조 분석 -> 상세 분석처럼 한 회의를 여러 단계에서 읽을 때 재사용)
+    """
+    utterances = meeting_log_data.get('utterances', [])
+    key = id(utterances)
+    cached = _index_cache.get(key)
+    if cached is not None and cached.utterances is utterances and len(cached) == len(utterances):
+        _index_cache.move_to_end(key)
+        return cached
+
+    index = TranscriptIndex(meeting_log_data)
+    _index_cache[key] = index
+    if len(_index_cache) > INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+
+# ==============================================================================
+# 벤치마크: 기존 선형 탐색 vs 인덱스 슬라이싱
+# ==============================================================================
+def _linear_segment(all_utterances, start_id, end_id, buffer=5):
+    """인덱스 도입 전 get_transcript_segment 구현 (비교용)"""
+    start_idx = -1
+    end_idx = -1
+    for i, u in enumerate(all_utterances):
+        if str(u.get('id')) == str(start_id):
+            start_idx = i
+        if str(u.get('id')) == str(end_id):
+            end_idx = i
+            if start_idx != -1: break
+    if start_idx == -1 or end_idx == -1:
+        return ""
+    real_start = max(0, start_idx - buffer)
+    real_end = min(len(all_utterances), end_idx + 1 + buffer)
+    segment_lines = []
+    for i in range(real_start, real_end):
+        u = all_utterances[i]
+        segment_lines.append(f"[ID: {u.get('id')}] {u.get('USER_ID', 'Unknown')}: {u.get('content', '')}")
+    return "\n".join(segment_lines)
+
+
+def run_benchmark(num_utterances=20000, num_topics=50, buffer=10, repeat=3):
+    import compression  # 가상 회의록 생성기 재사용
+
+    data = compression.make_sample_meeting(num_utterances)
+    utterances = data['utterances']
+    step = num_utterances // num_topics
+    topics = [(i * step + 1, (i + 1) * step) for i in range(num_topics)]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        legacy = [_linear_segment(utterances, s, e, buffer) for s, e in topics]
+    linear_ms = (time.perf_counter() - t0) / repeat * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        index = TranscriptIndex(data, compact=False)
+        index.lines("user_id")
+    build_ms = (time.perf_counter() - t0) / repeat * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        indexed = [index.segment(s, e, buffer) for s, e in topics]
+    slice_ms = (time.perf_counter() - t0) / repeat * 1000
+
+    assert indexed == legacy, "인덱스 추출 결과가 기존 구현과 다릅니다."
+
+    print(f"발화 {num_utterances}개, 토픽 {num_topics}개 (Buffer ±{buffer})")
+    print(f"  기존 선형 탐색     : {linear_ms:8.1f} ms")
+    print(f"  인덱스 생성(1회)   : {build_ms:8.1f} ms")
+    print(f"  인덱스 구간 추출   : {slice_ms:8.1f} ms")
+    print(f"  합계 (생성 + 추출) : {build_ms + slice_ms:8.1f} ms  ({linear_ms / (build_ms + slice_ms):.1f}x)")
+
+
+def print_compaction_report(file_id):
+    """저장소의 회의록(meeting_logs/{file_id}.json)에 대한 압축 전후 비교"""
+    import storage
+
+    data = storage.get_storage_client().get_json(f"meeting_logs/{file_id}.json")
+    index = TranscriptIndex(data, compact=True)
+    for label in ("name", "user_id"):
+        r = index.compaction_report(label)
+        print(f"[{label}] 발화 {r['utterances']}개 -> 줄 {r['lines']}개, 토큰 약 {r['raw_tokens']:,} -> {r['compact_tokens']:,} "
+              f"(-{(r['raw_tokens'] - r['compact_tokens']) / max(1, r['raw_tokens']):.0%}), "
+              f"제거: 필러 {r['filler']}, 환각 문구 {r['hallucination']}, 중복 {r['duplicate']}, 빈 발화 {r['empty']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="발화 인덱스 구간 추출 벤치마크 / 대화 압축 결과 확인")
+    parser.add_argument("--utterances", type=int, default=20000, help="가상 회의록 발화 수")
+    parser.add_argument("--topics", type=int, default=50, help="토픽(구간) 수")
+    parser.add_argument("--repeat", type=int, default=3, help="측정 반복 횟수")
+    parser.add_argument("--compaction", metavar="FILE_ID", help="저장된 회의록의 압축 전후 줄 수/토큰 비교")
+    args = parser.parse_args()
+
+    if args.compaction:
+        print_compaction_report(args.compaction)
+    else:
+        run_benchmark(args.utterances, args.topics, repeat=args.repeat)